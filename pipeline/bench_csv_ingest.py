@@ -0,0 +1,245 @@
+"""
+csv_ingest.py against a Logstash-like path: rows/s, file-to-topic latency, resume.
+
+The Logstash-like path reproduces what csv-to-kafka.conf does per event in
+a single thread (csv filter on each line, header drop, one mutate per step,
+uncached date parsing, JSON codec) and discovers files with a glob every
+--discover-interval seconds. Both paths produce into a producer stand-in
+that acknowledges every message on poll/flush, so Kafka is not needed;
+latency is measured from the rename of the file into the data directory to
+the last acknowledgement.
+
+The resume check kills ingestion halfway through a file (the producer
+raises after --rows/2 messages), restarts it on the same ledger and counts
+missing and duplicated rows.
+
+Usage:
+    python bench_csv_ingest.py [--rows 200000] [--workers 1 4] [--discover-interval 5]
+"""
+
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import csv_ingest
+from csv_ingest import COLUMNS, DEFAULT_TIMEZONE, CsvIngestor, DirectoryIngest, OffsetLedger
+
+HEADER = COLUMNS[:14] + ["timestamp", "xdrid"]
+
+
+class Crash(Exception):
+    pass
+
+
+class AckingProducer:
+    """confluent_kafka.Producer stand-in: messages are acknowledged on poll and flush."""
+
+    def __init__(self, crash_after=None):
+        self.queue = []
+        self.keys = Counter()
+        self.delivered = 0
+        self.last_delivery = None
+        self.crash_after = crash_after
+
+    def produce(self, topic, key=None, value=None, on_delivery=None):
+        self.queue.append((key, on_delivery))
+
+    def poll(self, timeout=0):
+        queue, self.queue = self.queue, []
+        for key, on_delivery in queue:
+            if self.crash_after is not None and self.delivered >= self.crash_after:
+                raise Crash()
+            self.keys[key] += 1
+            self.delivered += 1
+            if on_delivery is not None:
+                on_delivery(None, None)
+        if queue:
+            self.last_delivery = time.time()
+        return len(queue)
+
+    def flush(self, timeout=None):
+        self.poll()
+        return 0
+
+
+def write_calls(path, rows, seed=11):
+    """CSV in the format of the simulator, published with an atomic rename like cdr_writer.py."""
+    rng = random.Random(seed)
+    base = datetime(2025, 3, 27, 8, 0, tzinfo=timezone(timedelta(minutes=50)))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(HEADER)
+    for i in range(rows):
+        writer.writerow([
+            "Sparkle", f"{rng.uniform(0.1, 10):.2f}", rng.randrange(1, 3600), f"{rng.uniform(0.1, 10):.2f}",
+            "IT", "Rome", "Voice", "", "TIM", "Vodafone", "Rome", f"39{rng.randrange(10 ** 9):09d}",
+            f"39{rng.randrange(10 ** 9):09d}", "Italy", (base + timedelta(seconds=i / 50)).isoformat(),
+            str(uuid.UUID(int=rng.getrandbits(128))),
+        ])
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp, "w") as f:
+        f.write(buffer.getvalue())
+    os.rename(tmp, path)
+
+
+def logstash_like(path, producer):
+    """One event per line through the csv-to-kafka.conf filter chain."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            event = {"message": line.rstrip("\n"), "path": path, "host": "logstash", "@version": "1",
+                     "@timestamp": datetime.now(timezone.utc)}
+            row = next(csv.reader([event["message"]]))
+            for name, value in zip(COLUMNS, row):
+                if value != "":
+                    event[name] = value
+            if event.get("tenant") == "tenant":
+                continue
+            if "op35" not in event:
+                event["op35"] = ""
+            for name, cast in (("val_euro", float), ("duration", int), ("economicUnitValue", float)):
+                if name in event:
+                    event[name] = cast(event[name])
+            dt = datetime.fromisoformat(event["event_timestamp"])
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=DEFAULT_TIMEZONE)
+            event["event_timestamp"] = csv_ingest._utc_iso(dt)
+            event["event_type"] = "call_record"
+            event["@timestamp"] = csv_ingest._utc_iso(event["@timestamp"])
+            event["kafka_timestamp"] = event["@timestamp"]
+            for name in ("path", "host", "@version", "message"):
+                del event[name]
+            producer.produce("call-data-raw", key=event["xdrid"].encode(),
+                             value=json.dumps(event).encode(), on_delivery=None)
+            producer.poll(0)
+    producer.flush()
+
+
+def throughput(path, rows, workers):
+    results = []
+    producer = AckingProducer()
+    start = time.perf_counter()
+    logstash_like(path, producer)
+    results.append(("logstash-like", producer.delivered, time.perf_counter() - start))
+    for n in workers:
+        directory = tempfile.mkdtemp()
+        ledger = OffsetLedger(os.path.join(directory, "ledger.db"))
+        with ProcessPoolExecutor(max_workers=n) as executor:
+            executor.submit(int).result()  # fork the pool outside the timing
+            producer = AckingProducer()
+            ingestor = CsvIngestor(producer, ledger, executor, max_in_flight=2 * n)
+            start = time.perf_counter()
+            ingestor.ingest(path)
+            results.append((f"csv_ingest x{n}", producer.delivered, time.perf_counter() - start))
+        ledger.close()
+        shutil.rmtree(directory)
+    for name, delivered, elapsed in results:
+        assert delivered == rows, (name, delivered)
+        print(f"{name:<16} {rows / elapsed:>10,.0f} rows/s  ({elapsed:.2f}s)")
+
+
+def latency(rows, workers, discover_interval):
+    # Logstash-like: glob every discover_interval seconds
+    directory = tempfile.mkdtemp()
+    producer = AckingProducer()
+    stop = threading.Event()
+
+    def poll_loop():
+        seen = set()
+        while not stop.wait(discover_interval):
+            for path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+                if path not in seen:
+                    seen.add(path)
+                    logstash_like(path, producer)
+
+    thread = threading.Thread(target=poll_loop, daemon=True)
+    thread.start()
+    # Half a poll interval after the start: the average discovery delay
+    time.sleep(discover_interval / 2)
+    path = os.path.join(directory, "calls.csv")
+    write_calls(path, rows)
+    published = time.time()
+    while producer.delivered < rows:
+        time.sleep(0.01)
+    print(f"{'logstash-like':<16} file-to-topic {producer.last_delivery - published:6.2f}s")
+    stop.set()
+    thread.join()
+    shutil.rmtree(directory)
+
+    # csv_ingest: inotify on the directory
+    directory = tempfile.mkdtemp()
+    ledger_dir = tempfile.mkdtemp()
+    producer = AckingProducer()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        ledger = OffsetLedger(os.path.join(ledger_dir, "ledger.db"))
+        service = DirectoryIngest(CsvIngestor(producer, ledger, executor, max_in_flight=2 * workers), directory)
+        thread = threading.Thread(target=service.run, daemon=True)
+        thread.start()
+        time.sleep(0.5)
+        path = os.path.join(directory, "calls.csv")
+        write_calls(path, rows)
+        published = time.time()
+        while producer.delivered < rows:
+            time.sleep(0.01)
+        print(f"{f'csv_ingest x{workers}':<16} file-to-topic {producer.last_delivery - published:6.2f}s")
+        service.stop()
+        thread.join()
+        ledger.close()
+    shutil.rmtree(directory)
+    shutil.rmtree(ledger_dir)
+
+
+def resume(path, rows, workers):
+    directory = tempfile.mkdtemp()
+    ledger = OffsetLedger(os.path.join(directory, "ledger.db"))
+    keys = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        crashing = AckingProducer(crash_after=rows // 2)
+        try:
+            CsvIngestor(crashing, ledger, executor, chunk_bytes=1 << 20).ingest(path)
+        except Crash:
+            pass
+        keys.update(crashing.keys)
+        producer = AckingProducer()
+        CsvIngestor(producer, ledger, executor, chunk_bytes=1 << 20).ingest(path)
+        keys.update(producer.keys)
+    ledger.close()
+    shutil.rmtree(directory)
+    duplicated = sum(count - 1 for count in keys.values())
+    print(f"resume after crash at row {rows // 2:,}: {rows - len(keys)} missing, {duplicated:,} duplicated "
+          f"(rows of the range in flight)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--discover-interval", type=float, default=5.0, help="Logstash discover_interval")
+    args = parser.parse_args()
+    csv_ingest.logger.setLevel("WARNING")
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "calls.csv")
+    write_calls(path, args.rows)
+    print(f"{args.rows:,} rows, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+    try:
+        throughput(path, args.rows, args.workers)
+        latency(args.rows, max(args.workers), args.discover_interval)
+        resume(path, args.rows, max(args.workers))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+opensearch_indexer.py batch strategies against a local fake _bulk endpoint.
+
+The fake cluster indexes with --threads write threads, each bulk costing
+--overhead-ms plus --per-doc-us per document, and rejects a whole request
+with 429 when the bytes of the requests in flight would exceed
+--pressure-mb (like indexing_pressure.memory.limit). Compared strategies:
+
+    logstash        fixed batches of 125 (pipeline.batch.size) on 4 workers
+    fixed-10000     fixed batches of 10000 on --workers workers
+    adaptive        AdaptiveBatchSize on --workers workers
+
+Every run indexes the same --docs call records and checks that all of them
+reach the fake, in the daily index of their event_timestamp.
+
+Usage:
+    python bench_opensearch_indexer.py [--docs 200000] [--workers 8] [--threads 2]
+"""
+
+import argparse
+import gzip
+import json
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import opensearch_indexer
+from opensearch_indexer import AdaptiveBatchSize, BulkIndexer, make_client, to_action
+
+
+class FakeBulkCluster:
+    def __init__(self, threads, overhead_ms, per_doc_us, pressure_mb):
+        self.slots = threading.Semaphore(threads)
+        self.overhead = overhead_ms / 1000
+        self.per_doc = per_doc_us / 1e6
+        self.pressure_limit = pressure_mb * 2 ** 20
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.indices = Counter()
+        self.ids = set()
+        self.requests = 0
+        self.rejections = 0
+
+    def bulk(self, body):
+        with self.lock:
+            self.requests += 1
+            if self.in_flight and self.in_flight + len(body) > self.pressure_limit:
+                self.rejections += 1
+                return 429, {"error": {"type": "rejected_execution_exception",
+                                       "reason": "rejected due to indexing pressure"}, "status": 429}
+            self.in_flight += len(body)
+        try:
+            lines = body.split(b"\n")
+            docs = (len(lines) - 1) // 2
+            with self.slots:
+                time.sleep(self.overhead + self.per_doc * docs)
+            with self.lock:
+                for action in lines[0:-1:2]:
+                    meta = json.loads(action)["index"]
+                    self.indices[meta["_index"]] += 1
+                    self.ids.add(meta["_id"])
+            return 200, {"errors": False, "items": [{"index": {"status": 201}}] * docs}
+        finally:
+            with self.lock:
+                self.in_flight -= len(body)
+
+    def serve(self):
+        cluster = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                status, payload = cluster.bulk(body) if self.path.startswith("/_bulk") else (404, {})
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def call_documents(count):
+    base = datetime(2025, 3, 27, 22, 0, tzinfo=timezone.utc)
+    ingest = "2025-03-28T09:00:00.000Z"
+    for i in range(count):
+        event = (base + timedelta(seconds=i * 0.1)).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        yield json.dumps({
+            "tenant": "Sparkle", "val_euro": 1.25, "duration": 60 + i % 600, "economicUnitValue": 1.25,
+            "other_party_country": "IT", "routing_dest": "Rome", "service_type__desc": "Voice", "op35": "",
+            "carrier_in": "TIM", "carrier_out": "Vodafone", "selling_dest": "Rome",
+            "raw_caller_number": f"39{i % 50000:09d}", "raw_called_number": f"39{i * 7 % 90000:09d}",
+            "paese_destinazione": "Italy", "event_timestamp": event, "xdrid": f"bench-{i}",
+            "event_type": "call_record", "kafka_timestamp": ingest, "@timestamp": ingest,
+        }).encode()
+
+
+def run(url, actions, workers, batch_size):
+    indexer = BulkIndexer(make_client(url, "admin", "admin", workers), workers=workers, batch_size=batch_size,
+                          max_retries=50)
+    pending = deque()
+    sizes = []
+    start = time.perf_counter()
+    position = 0
+    while position < len(actions):
+        size = batch_size.size
+        sizes.append(size)
+        pending.append(indexer.submit(actions[position:position + size]))
+        position += size
+        while len(pending) >= 2 * workers:
+            pending.popleft().result()
+    for future in pending:
+        future.result()
+    elapsed = time.perf_counter() - start
+    indexer.close()
+    return elapsed, indexer.stats, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=2, help="write threads of the fake cluster")
+    parser.add_argument("--overhead-ms", type=float, default=15.0)
+    parser.add_argument("--per-doc-us", type=float, default=20.0)
+    parser.add_argument("--pressure-mb", type=float, default=16.0)
+    parser.add_argument("--target-latency", type=float, default=0.5)
+    args = parser.parse_args()
+    opensearch_indexer.logger.setLevel("ERROR")
+    opensearch_indexer.logging.getLogger("opensearch").setLevel("ERROR")
+
+    actions = [to_action(value)[1] for value in call_documents(args.docs)]
+    strategies = [
+        ("logstash", 4, AdaptiveBatchSize(125, 125, 125)),
+        ("fixed-10000", args.workers, AdaptiveBatchSize(10000, 10000, 10000)),
+        ("adaptive", args.workers, AdaptiveBatchSize(target_latency=args.target_latency)),
+    ]
+    print(f"{args.docs:,} docs, fake cluster: {args.threads} write threads, "
+          f"{args.overhead_ms:g} ms + {args.per_doc_us:g} us/doc, {args.pressure_mb:g} MiB indexing pressure")
+    for name, workers, batch_size in strategies:
+        cluster = FakeBulkCluster(args.threads, args.overhead_ms, args.per_doc_us, args.pressure_mb)
+        server = cluster.serve()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        elapsed, stats, sizes = run(url, actions, workers, batch_size)
+        server.shutdown()
+        assert len(cluster.ids) == args.docs and stats["indexed"] == args.docs, (name, stats)
+        print(f"{name:<12} {args.docs / elapsed:>9,.0f} docs/s  requests {cluster.requests:>5}  "
+              f"429 {cluster.rejections:>4}  batch {sizes[0]}->{sizes[-1]} (max {max(sizes)})  "
+              f"indices {dict(sorted(cluster.indices.items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+"""
+Ingestion of call CSVs from the data directory into the call-data-raw topic.
+
+Replaces logstash/pipeline/csv-to-kafka.conf. New files are discovered through
+inotify (IN_CLOSE_WRITE and IN_MOVED_TO on the data directory, so the final
+rename done by cdr_writer.py is seen at once) instead of a 5 s poll; a
+periodic rescan covers filesystems that do not deliver inotify events, such
+as some bind mounts.
+
+Files are split into byte ranges on line boundaries and parsed in a process
+pool. Workers return ready-to-send (key, JSON) pairs with the same fields as
+the Logstash filter: positional columns, empty columns omitted, op35
+defaulting to "", val_euro/economicUnitValue as float, duration as integer,
+event_timestamp read as ISO8601 in Europe/Rome and written in UTC with
+milliseconds, plus event_type, kafka_timestamp and @timestamp.
+
+Progress is kept in a SQLite offset ledger instead of completed_files.log:
+for every file, the byte offset up to which all rows have been acknowledged
+by Kafka. The offset only moves over contiguous delivered ranges, so after a
+crash a file resumes from its first range not fully delivered (at-least-once,
+as with Logstash).
+
+Usage:
+    python csv_ingest.py [--data-dir /data] [--workers 4] [--chunk-bytes 4194304]
+    python csv_ingest.py --once    # ingest the files already present and exit
+"""
+
+import argparse
+import csv
+import ctypes
+import ctypes.util
+import fnmatch
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import select
+import signal
+import sqlite3
+import struct
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("csv_ingest")
+
+DEFAULT_BOOTSTRAP_SERVERS = "kafka:29092"
+DEFAULT_TOPIC = "call-data-raw"
+DEFAULT_DATA_DIR = "/data"
+DEFAULT_LEDGER_NAME = ".csv_ingest_ledger.db"
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+DEFAULT_RESCAN_INTERVAL = 30.0
+# A file seen by a rescan (no close event) is taken as complete after this many idle seconds
+DEFAULT_SETTLE_SECONDS = 5.0
+
+PATTERNS = ("*.csv", "*.csv.gz")
+
+# Positional columns of csv-to-kafka.conf: the CSV "timestamp" column becomes event_timestamp
+COLUMNS = [
+    "tenant", "val_euro", "duration", "economicUnitValue", "other_party_country",
+    "routing_dest", "service_type__desc", "op35", "carrier_in", "carrier_out",
+    "selling_dest", "raw_caller_number", "raw_called_number", "paese_destinazione",
+    "event_timestamp", "xdrid",
+]
+
+# Timezone of the date filter for timestamps without offset
+DEFAULT_TIMEZONE = ZoneInfo("Europe/Rome")
+
+# Throughput-oriented producer settings, as in simulatore-python/kafka_sink.py
+PRODUCER_DEFAULTS = {
+    "linger.ms": 50,
+    "batch.size": 1048576,
+    "compression.type": "lz4",
+    "acks": "1",
+    "queue.buffering.max.messages": 1000000,
+}
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+_ISO8601 = re.compile(r"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})(?:[.,](\d+))?(Z|[+-]\d{2}(?::?\d{2})?)?$")
+
+_quote = json.encoder.encode_basestring
+
+Message = Tuple[Optional[bytes], bytes]
+
+
+def _utc_iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+@lru_cache(maxsize=65536)
+def _utc_second(second: str, offset: str) -> str:
+    """UTC 'YYYY-MM-DDTHH:MM:SS' of a local second with its offset ('' for Europe/Rome)."""
+    if offset == "Z":
+        offset = "+00:00"
+    elif len(offset) == 3:
+        offset += ":00"
+    dt = datetime.fromisoformat(second + offset)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=DEFAULT_TIMEZONE)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def normalize_timestamp(value: str) -> str:
+    """ISO8601 timestamp in UTC with milliseconds, like the date filter of csv-to-kafka.conf.
+
+    The conversion is cached per second, the fraction is truncated to
+    milliseconds. Unparseable values are left as they are, as Logstash does
+    on _dateparsefailure.
+    """
+    match = _ISO8601.match(value)
+    if match is None:
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=DEFAULT_TIMEZONE)
+        return _utc_iso(dt)
+    second, fraction, offset = match.groups()
+    try:
+        utc = _utc_second(second, offset or "")
+    except ValueError:
+        return value
+    return f"{utc}.{(fraction or '')[:3].ljust(3, '0')}Z"
+
+
+def _float_json(value: str) -> str:
+    try:
+        number = float(value)
+    except ValueError:
+        return _quote(value)
+    # NaN and infinities have no JSON literal: kept as strings like the other unconvertible values
+    return repr(number) if math.isfinite(number) else _quote(value)
+
+
+def _int_json(value: str) -> str:
+    try:
+        return str(int(float(value)))
+    except (ValueError, OverflowError):
+        return _quote(value)
+
+
+# mutate convert of csv-to-kafka.conf, by column index; values that do not convert stay strings
+CONVERSIONS = {COLUMNS.index("val_euro"): _float_json, COLUMNS.index("duration"): _int_json,
+               COLUMNS.index("economicUnitValue"): _float_json}
+_OP35 = COLUMNS.index("op35")
+_EVENT_TIMESTAMP = COLUMNS.index("event_timestamp")
+_XDRID = COLUMNS.index("xdrid")
+_FIELD_PREFIX = [f"{_quote(name)}:" for name in COLUMNS]
+
+
+def message_suffix(ingest_ts: str) -> str:
+    """Fields added by the filter, closing the JSON object."""
+    return f',"event_type":"call_record","kafka_timestamp":{_quote(ingest_ts)},"@timestamp":{_quote(ingest_ts)}}}'
+
+
+def row_to_json(row: List[str], suffix: str) -> Optional[str]:
+    """JSON event for a CSV row, or None for header and blank lines.
+
+    The text is written directly instead of through a dict and json.dumps:
+    every value is a string except the converted numbers.
+    """
+    if not any(row) or row[0] == "tenant":
+        return None
+    values = list(map(_quote, row[:len(COLUMNS)]))
+    for index, convert in CONVERSIONS.items():
+        if index < len(row) and row[index]:
+            values[index] = convert(row[index])
+    if len(row) > _EVENT_TIMESTAMP and row[_EVENT_TIMESTAMP]:
+        values[_EVENT_TIMESTAMP] = _quote(normalize_timestamp(row[_EVENT_TIMESTAMP]))
+    fields = [prefix + value for prefix, value, raw in zip(_FIELD_PREFIX, values, row) if raw != ""]
+    if len(row) <= _OP35 or row[_OP35] == "":
+        fields.append('"op35":""')
+    return "{" + ",".join(fields) + suffix
+
+
+def parse_chunk(data: bytes) -> List[Message]:
+    """(key, value) pairs for a block of complete CSV lines; key is the xdrid."""
+    suffix = message_suffix(_utc_iso(datetime.now(timezone.utc)))
+    messages = []
+    for row in csv.reader(data.decode("utf-8", errors="replace").splitlines()):
+        value = row_to_json(row, suffix)
+        if value is None:
+            continue
+        key = row[_XDRID].encode() if len(row) > _XDRID and row[_XDRID] else None
+        messages.append((key, value.encode()))
+    return messages
+
+
+def parse_range(path: str, start: int, end: int) -> List[Message]:
+    """parse_chunk of bytes [start, end) of an uncompressed file, read by the worker itself."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return parse_chunk(f.read(end - start))
+
+
+def _last_line_end(f, start: int, end: int) -> int:
+    """Offset just past the last newline in [start, end), or start if there is none."""
+    position = end
+    while position > start:
+        block_start = max(start, position - 65536)
+        f.seek(block_start)
+        index = f.read(position - block_start).rfind(b"\n")
+        if index >= 0:
+            return block_start + index + 1
+        position = block_start
+    return start
+
+
+def plain_chunks(path: str, offset: int, size: int, chunk_bytes: int,
+                 final: bool) -> Iterator[Tuple[int, int, Callable, tuple]]:
+    """Line-aligned ranges of an uncompressed file from offset.
+
+    Unless final, a trailing line without newline is left for a later pass:
+    the file may still be being written.
+    """
+    with open(path, "rb") as f:
+        limit = size if final else _last_line_end(f, offset, size)
+        start = offset
+        while start < limit:
+            end = start + chunk_bytes
+            if end >= limit:
+                end = limit
+            else:
+                f.seek(end - 1)
+                f.readline()
+                end = min(f.tell(), limit)
+            yield start, end, parse_range, (path, start, end)
+            start = end
+
+
+def gzip_chunks(path: str, offset: int, chunk_bytes: int) -> Iterator[Tuple[int, int, Callable, tuple]]:
+    """Line-aligned blocks of a .csv.gz; offsets are positions in the decompressed stream."""
+    with gzip.open(path, "rb") as f:
+        f.seek(offset)
+        start = offset
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                return
+            data += f.readline()
+            yield start, start + len(data), parse_chunk, (data,)
+            start += len(data)
+
+
+def file_id(st: os.stat_result) -> str:
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+class OffsetLedger:
+    """Delivered byte offset of every ingested file, in SQLite."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        path TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        byte_offset INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        completed_at REAL,
+        updated_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(self.SCHEMA)
+
+    def position(self, path: str, fid: str, size: int) -> Tuple[int, int]:
+        """(offset, rows) to resume from; a replaced or truncated file starts over."""
+        row = self.conn.execute("SELECT file_id, byte_offset, rows FROM ingested_files WHERE path = ?",
+                                (path,)).fetchone()
+        if row is None or row[0] != fid or (row[1] > size and not path.endswith(".gz")):
+            return 0, 0
+        return row[1], row[2]
+
+    def save(self, path: str, fid: str, offset: int, rows: int, completed: bool = False) -> None:
+        now = time.time()
+        self.conn.execute(
+            """
+            INSERT INTO ingested_files (path, file_id, byte_offset, rows, completed_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                file_id = excluded.file_id,
+                byte_offset = excluded.byte_offset,
+                rows = excluded.rows,
+                completed_at = COALESCE(excluded.completed_at, ingested_files.completed_at),
+                updated_at = excluded.updated_at
+            """,
+            (path, fid, offset, rows, now if completed else None, now))
+
+    def is_completed(self, path: str, fid: str) -> bool:
+        row = self.conn.execute("SELECT file_id, completed_at FROM ingested_files WHERE path = ?",
+                                (path,)).fetchone()
+        return row is not None and row[0] == fid and row[1] is not None
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class FileProgress:
+    """Delivery state of the ranges of one file.
+
+    Ranges are registered in file order; the ledger offset moves to the end
+    of the longest prefix whose messages have all been acknowledged.
+    """
+
+    def __init__(self, ledger: OffsetLedger, path: str, fid: str, offset: int, rows: int):
+        self.ledger = ledger
+        self.path = path
+        self.fid = fid
+        self.offset = offset
+        self.rows = rows
+        self.ranges = deque()
+        self.remaining: Dict[int, int] = {}
+        self.failed = 0
+
+    def add(self, start: int, end: int, count: int) -> None:
+        self.ranges.append((start, end, count))
+        self.remaining[start] = count
+        if count == 0:
+            self.advance()
+
+    def on_delivery(self, start: int, err, msg) -> None:
+        if err is not None:
+            self.failed += 1
+            logger.error("Delivery failed for %s@%d: %s", self.path, start, err)
+            return
+        self.remaining[start] -= 1
+        if self.remaining[start] == 0 and self.ranges[0][0] == start:
+            self.advance()
+
+    def advance(self) -> None:
+        moved = False
+        while self.ranges and self.remaining[self.ranges[0][0]] == 0:
+            start, end, count = self.ranges.popleft()
+            del self.remaining[start]
+            self.offset = end
+            self.rows += count
+            moved = True
+        if moved:
+            self.ledger.save(self.path, self.fid, self.offset, self.rows)
+
+
+class CsvIngestor:
+    """Parse files in the executor and produce their rows, recording progress in the ledger."""
+
+    def __init__(self, producer, ledger: OffsetLedger, executor: Executor, topic: str = DEFAULT_TOPIC,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES, max_in_flight: int = 8):
+        self.producer = producer
+        self.ledger = ledger
+        self.executor = executor
+        self.topic = topic
+        self.chunk_bytes = chunk_bytes
+        self.max_in_flight = max_in_flight
+        self.running = True
+        self.stats = {"files": 0, "rows": 0, "bytes": 0}
+
+    def produce(self, messages: List[Message], callback) -> None:
+        produce, poll = self.producer.produce, self.producer.poll
+        for key, value in messages:
+            while True:
+                try:
+                    produce(self.topic, key=key, value=value, on_delivery=callback)
+                    break
+                except BufferError:
+                    # Local queue full: wait for the batches in flight
+                    poll(0.1)
+        poll(0)
+
+    def ingest(self, path: str, final: bool = True, discovered: Optional[float] = None) -> int:
+        """Produce the rows of path after its ledger offset; returns the rows sent."""
+        started = time.monotonic()
+        st = os.stat(path)
+        fid = file_id(st)
+        offset, rows = self.ledger.position(path, fid, st.st_size)
+        compressed = path.endswith(".gz")
+        if compressed:
+            if self.ledger.is_completed(path, fid):
+                return 0
+            chunks = gzip_chunks(path, offset, self.chunk_bytes)
+        else:
+            if offset >= st.st_size:
+                return 0
+            chunks = plain_chunks(path, offset, st.st_size, self.chunk_bytes, final)
+        if offset:
+            logger.info("Resuming %s at byte %d (%d rows already delivered)", path, offset, rows)
+
+        progress = FileProgress(self.ledger, path, fid, offset, rows)
+        pending = deque()
+        sent = 0
+        truncated = False
+        try:
+            for start, end, parse, args in chunks:
+                if not self.running:
+                    break
+                pending.append((start, end, self.executor.submit(parse, *args)))
+                if len(pending) >= self.max_in_flight:
+                    sent += self._produce_next(pending, progress)
+            while pending and self.running:
+                sent += self._produce_next(pending, progress)
+        except (EOFError, gzip.BadGzipFile) as e:
+            # Truncated archive: still being copied, retried at its next event
+            logger.warning("Incomplete gzip %s: %s", path, e)
+            truncated = True
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            self.producer.flush()
+        if progress.failed:
+            raise RuntimeError(f"{progress.failed} rows of {path} not delivered to Kafka")
+
+        if compressed:
+            completed = self.running and not truncated and not pending
+        else:
+            completed = progress.offset >= st.st_size
+        if completed:
+            self.ledger.save(path, fid, progress.offset, progress.rows, completed=True)
+        self.stats["rows"] += sent
+        self.stats["bytes"] += progress.offset - offset
+        if sent or completed:
+            self.stats["files"] += 1
+            elapsed = time.monotonic() - started
+            latency = f", {time.time() - discovered:.2f}s after discovery" if discovered else ""
+            logger.info("%s: %d rows in %.2fs (%.0f rows/s%s)", path, sent, elapsed,
+                        sent / elapsed if elapsed else 0, latency)
+        return sent
+
+    def _produce_next(self, pending: deque, progress: FileProgress) -> int:
+        start, end, future = pending.popleft()
+        messages = future.result()
+        progress.add(start, end, len(messages))
+        if messages:
+            self.produce(messages, partial(progress.on_delivery, start))
+        return len(messages)
+
+    def stop(self, *_) -> None:
+        self.running = False
+
+
+class InotifyWatcher:
+    """Names of files closed after writing in, or moved into, a directory (Linux only)."""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed on {directory}")
+
+    def read(self, timeout: float) -> List[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        names, position = [], 0
+        while position < len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, position)
+            position += _EVENT_HEADER.size
+            names.append(os.fsdecode(data[position:position + length].rstrip(b"\0")))
+            position += length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DirectoryIngest:
+    """Watch a directory and ingest the matching files in discovery order."""
+
+    def __init__(self, ingestor: CsvIngestor, directory: str, patterns=PATTERNS,
+                 rescan_interval: float = DEFAULT_RESCAN_INTERVAL, settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        self.ingestor = ingestor
+        self.directory = directory
+        self.patterns = patterns
+        self.rescan_interval = rescan_interval
+        self.settle_seconds = settle_seconds
+        self.running = False
+        # path -> (discovery time, known to be complete)
+        self.queue: Dict[str, Tuple[float, bool]] = {}
+
+    def matches(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def scan(self) -> None:
+        now = time.time()
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.stat().st_mtime):
+            if entry.is_file() and self.matches(entry.name) and entry.path not in self.queue:
+                self.queue[entry.path] = (now, now - entry.stat().st_mtime >= self.settle_seconds)
+
+    def drain(self) -> None:
+        while self.queue and self.running:
+            path = next(iter(self.queue))
+            discovered, final = self.queue.pop(path)
+            try:
+                self.ingestor.ingest(path, final=final, discovered=discovered)
+            except FileNotFoundError:
+                logger.warning("%s disappeared before ingestion", path)
+            except RuntimeError as e:
+                # Kafka unavailable: the ledger keeps the delivered ranges, retry at the next rescan
+                logger.error("%s, retrying at the next rescan", e)
+                self.queue[path] = (discovered, final)
+                break
+
+    def run(self, once: bool = False) -> None:
+        self.running = True
+        watcher = None
+        if not once:
+            try:
+                watcher = InotifyWatcher(self.directory)
+            except (OSError, AttributeError) as e:
+                logger.warning("inotify unavailable (%s), polling every %.0fs", e, self.rescan_interval)
+        self.scan()
+        next_scan = time.monotonic() + self.rescan_interval
+        try:
+            while self.running:
+                self.drain()
+                if once:
+                    break
+                timeout = max(0.0, next_scan - time.monotonic())
+                if watcher is not None:
+                    for name in watcher.read(timeout):
+                        if self.matches(name):
+                            self.queue[os.path.join(self.directory, name)] = (time.time(), True)
+                else:
+                    time.sleep(timeout)
+                if time.monotonic() >= next_scan:
+                    self.scan()
+                    next_scan = time.monotonic() + self.rescan_interval
+        finally:
+            if watcher is not None:
+                watcher.close()
+            logger.info("Stopped: %s", self.ingestor.stats)
+
+    def stop(self, *_) -> None:
+        self.running = False
+        self.ingestor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion of call CSVs into Kafka")
+    parser.add_argument("--bootstrap-servers", default=os.getenv("KAFKA_BOOTSTRAP_SERVERS", DEFAULT_BOOTSTRAP_SERVERS))
+    parser.add_argument("--topic", default=os.getenv("CALLS_TOPIC", DEFAULT_TOPIC))
+    parser.add_argument("--data-dir", default=os.getenv("CSV_INGEST_DATA_DIR", DEFAULT_DATA_DIR))
+    parser.add_argument("--ledger", default=os.getenv("CSV_INGEST_LEDGER"),
+                        help=f"SQLite offset ledger (default: <data-dir>/{DEFAULT_LEDGER_NAME})")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CSV_INGEST_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--chunk-bytes", type=int,
+                        default=int(os.getenv("CSV_INGEST_CHUNK_BYTES", DEFAULT_CHUNK_BYTES)))
+    parser.add_argument("--rescan-interval", type=float,
+                        default=float(os.getenv("CSV_INGEST_RESCAN_INTERVAL", DEFAULT_RESCAN_INTERVAL)))
+    parser.add_argument("--once", action="store_true", help="ingest the files present and exit")
+    args = parser.parse_args()
+
+    from confluent_kafka import Producer
+
+    producer = Producer({"bootstrap.servers": args.bootstrap_servers, **PRODUCER_DEFAULTS})
+    ledger = OffsetLedger(args.ledger or os.path.join(args.data_dir, DEFAULT_LEDGER_NAME))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        ingestor = CsvIngestor(producer, ledger, executor, topic=args.topic, chunk_bytes=args.chunk_bytes,
+                               max_in_flight=2 * args.workers)
+        service = DirectoryIngest(ingestor, args.data_dir, rescan_interval=args.rescan_interval)
+        signal.signal(signal.SIGTERM, service.stop)
+        signal.signal(signal.SIGINT, service.stop)
+        try:
+            service.run(once=args.once)
+        finally:
+            ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Bulk indexer of the call-data-raw topic into the daily calls-* indices.
+
+Replaces the opensearch output of logstash/pipeline/kafka-to-opensearch.conf:
+calls are consumed in batches and sent with the _bulk API by a pool of
+parallel workers, with document id = xdrid as before. Two differences:
+
+- The daily index comes from event_timestamp (the call time, in UTC) rather
+  than the ingest time, so a replay or a late file lands in the day it
+  belongs to.
+- The batch size adapts to the cluster: it grows while bulk requests finish
+  within --target-latency, shrinks when they are slower, and halves on
+  rejections (HTTP 429 or es_rejected_execution_exception items), which
+  are retried with exponential backoff.
+
+Indices are created on first use with ingestion settings: refresh_interval
+--refresh-interval, and with --backfill refresh disabled and no replicas
+until the consumer has caught up (no messages for --idle-seconds), when the
+live settings are restored.
+
+Offsets are committed to Kafka once all batches up to them are indexed;
+after a crash the uncommitted batches are sent again and overwrite the
+same documents.
+
+Usage:
+    python opensearch_indexer.py [--workers 4] [--backfill] [--target-latency 1.0]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from confluent_kafka import Consumer, KafkaException, TopicPartition
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import ConnectionError, RequestError, TransportError
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("opensearch_indexer")
+# opensearch-py logs every request at INFO
+logging.getLogger("opensearch").setLevel(logging.WARNING)
+
+DEFAULT_BOOTSTRAP_SERVERS = "kafka:29092"
+DEFAULT_TOPIC = "call-data-raw"
+DEFAULT_GROUP_ID = "opensearch-indexer"
+DEFAULT_OPENSEARCH_URL = "http://opensearch:9200"
+DEFAULT_INDEX_PREFIX = "calls-"
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MIN_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_SIZE = 20000
+DEFAULT_MAX_BATCH_BYTES = 10 * 1024 * 1024
+DEFAULT_TARGET_LATENCY = 1.0
+DEFAULT_LINGER_MS = 500
+DEFAULT_REFRESH_INTERVAL = "5s"
+DEFAULT_REPLICAS = 1
+DEFAULT_IDLE_SECONDS = 30.0
+
+# Fields dropped by the mutate of kafka-to-opensearch.conf
+REMOVED_FIELDS = ("@version", "host", "event")
+# mutate convert of kafka-to-opensearch.conf for the non-string fields
+CONVERSIONS = (("val_euro", float), ("duration", int), ("economicUnitValue", float))
+
+# Only what is needed to find rejected and failed items in the _bulk response
+BULK_FILTER_PATH = "errors,items.*.status,items.*.error.type,items.*.error.reason"
+REJECTED_STATUS = 429
+
+_UTC_DAY = re.compile(r"\d{4}-\d{2}-\d{2}T[^+]*Z$")
+_quote = json.encoder.encode_basestring
+
+Action = Tuple[bytes, bytes]
+
+
+def event_day(doc: dict) -> str:
+    """UTC day of the call as YYYY.MM.dd, from event_timestamp (@timestamp as fallback)."""
+    for field in ("event_timestamp", "@timestamp"):
+        value = doc.get(field)
+        if isinstance(value, str):
+            if _UTC_DAY.match(value):
+                return f"{value[0:4]}.{value[5:7]}.{value[8:10]}"
+            try:
+                dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(timezone.utc)
+            return dt.strftime("%Y.%m.%d")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value / 1000, timezone.utc).strftime("%Y.%m.%d")
+    return datetime.now(timezone.utc).strftime("%Y.%m.%d")
+
+
+def to_action(value: bytes, index_prefix: str = DEFAULT_INDEX_PREFIX) -> Optional[Tuple[str, Action]]:
+    """Target index and (action line, source) of a call message, or None if it is not a JSON object.
+
+    The message is sent as is unless the Logstash filter would change it.
+    """
+    try:
+        doc = json.loads(value)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict):
+        return None
+    changed = False
+    for field in REMOVED_FIELDS:
+        if field in doc:
+            del doc[field]
+            changed = True
+    for field, convert in CONVERSIONS:
+        if isinstance(doc.get(field), str):
+            try:
+                doc[field] = convert(float(doc[field])) if convert is int else convert(doc[field])
+                changed = True
+            except ValueError:
+                pass
+    if changed:
+        value = json.dumps(doc, separators=(",", ":")).encode()
+    index = index_prefix + event_day(doc)
+    xdrid = doc.get("xdrid")
+    doc_id = f',"_id":{_quote(str(xdrid))}' if xdrid not in (None, "") else ""
+    return index, (f'{{"index":{{"_index":{_quote(index)}{doc_id}}}}}'.encode(), value)
+
+
+def make_client(url: str, user: str, password: str, workers: int = DEFAULT_WORKERS) -> OpenSearch:
+    """Client with one pooled connection per bulk worker; retries are done by BulkIndexer."""
+    return OpenSearch(hosts=[url], http_auth=(user, password), use_ssl=False, verify_certs=False,
+                      ssl_show_warn=False, http_compress=True, pool_maxsize=workers, timeout=60, max_retries=0)
+
+
+def bulk_body(actions: List[Action]) -> bytes:
+    parts = []
+    for action, source in actions:
+        parts.append(action)
+        parts.append(source)
+    parts.append(b"")
+    return b"\n".join(parts)
+
+
+class AdaptiveBatchSize:
+    """Batch size of the _bulk requests, shared by all the workers.
+
+    Multiplicative increase while full batches finish within the target
+    latency, decrease when slower, halving on rejections.
+    """
+
+    def __init__(self, initial: int = DEFAULT_BATCH_SIZE, minimum: int = DEFAULT_MIN_BATCH_SIZE,
+                 maximum: int = DEFAULT_MAX_BATCH_SIZE, target_latency: float = DEFAULT_TARGET_LATENCY,
+                 growth: float = 1.25, shrink: float = 0.8):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = max(minimum, min(maximum, initial))
+        self.target_latency = target_latency
+        self.growth = growth
+        self.shrink = shrink
+        self.lock = threading.Lock()
+
+    def record(self, docs: int, latency: float, rejected: bool) -> None:
+        with self.lock:
+            if rejected:
+                self.size = max(self.minimum, self.size // 2)
+            elif latency > self.target_latency:
+                self.size = max(self.minimum, int(self.size * self.shrink))
+            elif docs >= self.size * 0.9:
+                # Only full batches say something about larger ones
+                self.size = min(self.maximum, int(self.size * self.growth) + 1)
+
+
+class IndexSettings:
+    """Create the daily indices on first use with ingestion settings, and undo the backfill ones."""
+
+    def __init__(self, client: OpenSearch, refresh_interval: str = DEFAULT_REFRESH_INTERVAL,
+                 replicas: int = DEFAULT_REPLICAS, backfill: bool = False):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.replicas = replicas
+        self.backfill = backfill
+        self.prepared = set()
+
+    def current(self) -> dict:
+        if self.backfill:
+            return {"refresh_interval": "-1", "number_of_replicas": 0}
+        return {"refresh_interval": self.refresh_interval, "number_of_replicas": self.replicas}
+
+    def prepare(self, index: str) -> None:
+        if index in self.prepared:
+            return
+        settings = self.current()
+        try:
+            self.client.indices.create(index=index, body={"settings": {"index": settings}})
+            logger.info("Created %s with %s", index, settings)
+        except RequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+            self.client.indices.put_settings(index=index, body={"index": settings})
+        self.prepared.add(index)
+
+    def finish_backfill(self) -> None:
+        if not self.backfill:
+            return
+        self.backfill = False
+        settings = self.current()
+        for index in sorted(self.prepared):
+            self.client.indices.put_settings(index=index, body={"index": settings})
+        if self.prepared:
+            self.client.indices.refresh(index=",".join(sorted(self.prepared)))
+        logger.info("Backfill done, %d indices back to %s", len(self.prepared), settings)
+
+
+class BulkIndexer:
+    """Send batches of actions with _bulk on a pool of worker threads."""
+
+    def __init__(self, client: OpenSearch, workers: int = DEFAULT_WORKERS,
+                 batch_size: Optional[AdaptiveBatchSize] = None, max_retries: int = 8,
+                 retry_backoff: float = 0.1, max_backoff: float = 10.0):
+        self.client = client
+        self.workers = workers
+        self.batch_size = batch_size or AdaptiveBatchSize()
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk")
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "indexed": 0, "failed": 0, "rejected": 0, "retries": 0}
+
+    def submit(self, actions: List[Action]) -> Future:
+        return self.executor.submit(self.bulk, actions)
+
+    def _count(self, **increments) -> None:
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _backoff(self, attempt: int) -> None:
+        # Full jitter, so workers rejected together do not come back together
+        time.sleep(random.uniform(0, min(self.max_backoff, self.retry_backoff * 2 ** attempt)))
+
+    def bulk(self, actions: List[Action]) -> int:
+        """Index actions, retrying rejected ones; returns the documents indexed."""
+        indexed = 0
+        attempt = 0
+        while actions:
+            started = time.monotonic()
+            try:
+                response = self.client.bulk(body=bulk_body(actions), filter_path=BULK_FILTER_PATH)
+            except (ConnectionError, TransportError) as e:
+                rejected = getattr(e, "status_code", None) == REJECTED_STATUS
+                if not rejected and not isinstance(e, ConnectionError) and e.status_code < 500:
+                    raise
+                self.batch_size.record(len(actions), time.monotonic() - started, rejected=True)
+                self._count(requests=1, rejected=len(actions) if rejected else 0, retries=1)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning("Bulk of %d failed (%s), retrying", len(actions), getattr(e, "status_code", e))
+                self._backoff(attempt)
+                attempt += 1
+                continue
+
+            retry, failed = [], 0
+            if response.get("errors"):
+                for action, item in zip(actions, response["items"]):
+                    result = next(iter(item.values()))
+                    status = result.get("status", 200)
+                    if status == REJECTED_STATUS:
+                        retry.append(action)
+                    elif status >= 300:
+                        failed += 1
+                        if failed == 1:
+                            logger.error("Document rejected: %s %s", status, result.get("error"))
+            done = len(actions) - len(retry) - failed
+            indexed += done
+            self.batch_size.record(len(actions), time.monotonic() - started, rejected=bool(retry))
+            self._count(requests=1, indexed=done, failed=failed, rejected=len(retry))
+            actions = retry
+            if retry:
+                if attempt >= self.max_retries:
+                    raise RuntimeError(f"{len(retry)} documents still rejected after {attempt} retries")
+                self._count(retries=1)
+                self._backoff(attempt)
+                attempt += 1
+        return indexed
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+class KafkaIndexer:
+    """Consume call records and index them through a BulkIndexer, committing indexed offsets."""
+
+    def __init__(self, consumer, indexer: BulkIndexer, settings: IndexSettings, topic: str = DEFAULT_TOPIC,
+                 index_prefix: str = DEFAULT_INDEX_PREFIX, max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                 linger_ms: int = DEFAULT_LINGER_MS, idle_seconds: float = DEFAULT_IDLE_SECONDS):
+        self.consumer = consumer
+        self.indexer = indexer
+        self.settings = settings
+        self.topic = topic
+        self.index_prefix = index_prefix
+        self.max_batch_bytes = max_batch_bytes
+        self.linger = linger_ms / 1000
+        self.idle_seconds = idle_seconds
+        self.running = False
+        self.skipped = 0
+
+    def next_batch(self) -> Tuple[List[Action], Dict[int, int]]:
+        """Up to the current batch size (or max_batch_bytes) of actions, and the next offset per partition."""
+        actions, offsets, size = [], {}, 0
+        deadline = time.monotonic() + self.linger
+        while self.running and size < self.max_batch_bytes:
+            wanted = self.indexer.batch_size.size - len(actions)
+            timeout = deadline - time.monotonic()
+            if wanted <= 0 or timeout <= 0:
+                break
+            for message in self.consumer.consume(num_messages=wanted, timeout=timeout):
+                if message.error():
+                    logger.error("Kafka error: %s", message.error())
+                    continue
+                offsets[message.partition()] = message.offset() + 1
+                routed = to_action(message.value(), self.index_prefix)
+                if routed is None:
+                    self.skipped += 1
+                    logger.warning("Skipping invalid call at %s[%d]@%d",
+                                   message.topic(), message.partition(), message.offset())
+                    continue
+                index, action = routed
+                self.settings.prepare(index)
+                actions.append(action)
+                size += len(action[0]) + len(action[1]) + 2
+        return actions, offsets
+
+    def commit(self, offsets: Dict[int, int]) -> None:
+        try:
+            self.consumer.commit(offsets=[TopicPartition(self.topic, p, o) for p, o in offsets.items()],
+                                 asynchronous=True)
+        except KafkaException as e:
+            logger.warning("Kafka offset commit failed: %s", e)
+
+    def run(self) -> None:
+        self.consumer.subscribe([self.topic])
+        self.running = True
+        pending = deque()
+        idle_since = time.monotonic()
+        try:
+            while self.running:
+                actions, offsets = self.next_batch()
+                if actions:
+                    pending.append((self.indexer.submit(actions), offsets))
+                    idle_since = time.monotonic()
+                elif offsets:
+                    pending.append((None, offsets))
+                elif self.settings.backfill and time.monotonic() - idle_since >= self.idle_seconds:
+                    self.drain(pending, 0)
+                    self.settings.finish_backfill()
+                # Two batches per worker in flight: one sending, one queued
+                self.drain(pending, 2 * self.indexer.workers)
+            self.drain(pending, 0)
+        finally:
+            self.consumer.close()
+            self.indexer.close()
+            logger.info("Stopped: %s, skipped %d", self.indexer.stats, self.skipped)
+
+    def drain(self, pending: deque, keep: int) -> None:
+        """Wait for the oldest batches until at most keep are in flight, committing their offsets."""
+        while pending and (len(pending) > keep or pending[0][0] is None or pending[0][0].done()):
+            future, offsets = pending.popleft()
+            if future is not None:
+                future.result()
+            self.commit(offsets)
+
+    def stop(self, *_) -> None:
+        self.running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk indexer of call-data-raw into OpenSearch")
+    parser.add_argument("--bootstrap-servers", default=os.getenv("KAFKA_BOOTSTRAP_SERVERS", DEFAULT_BOOTSTRAP_SERVERS))
+    parser.add_argument("--topic", default=os.getenv("CALLS_TOPIC", DEFAULT_TOPIC))
+    parser.add_argument("--group-id", default=os.getenv("INDEXER_GROUP_ID", DEFAULT_GROUP_ID))
+    parser.add_argument("--opensearch-url", default=os.getenv("OPENSEARCH_URL", DEFAULT_OPENSEARCH_URL))
+    parser.add_argument("--user", default=os.getenv("OPENSEARCH_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("OPENSEARCH_PASSWORD", "admin"))
+    parser.add_argument("--index-prefix", default=os.getenv("INDEXER_INDEX_PREFIX", DEFAULT_INDEX_PREFIX))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INDEXER_WORKERS", DEFAULT_WORKERS)))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INDEXER_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+                        help="initial batch size")
+    parser.add_argument("--min-batch-size", type=int,
+                        default=int(os.getenv("INDEXER_MIN_BATCH_SIZE", DEFAULT_MIN_BATCH_SIZE)))
+    parser.add_argument("--max-batch-size", type=int,
+                        default=int(os.getenv("INDEXER_MAX_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)))
+    parser.add_argument("--max-batch-bytes", type=int,
+                        default=int(os.getenv("INDEXER_MAX_BATCH_BYTES", DEFAULT_MAX_BATCH_BYTES)))
+    parser.add_argument("--target-latency", type=float,
+                        default=float(os.getenv("INDEXER_TARGET_LATENCY", DEFAULT_TARGET_LATENCY)),
+                        help="seconds per bulk request above which the batch shrinks")
+    parser.add_argument("--linger-ms", type=int, default=int(os.getenv("INDEXER_LINGER_MS", DEFAULT_LINGER_MS)))
+    parser.add_argument("--refresh-interval", default=os.getenv("INDEXER_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL))
+    parser.add_argument("--replicas", type=int, default=int(os.getenv("INDEXER_REPLICAS", DEFAULT_REPLICAS)))
+    parser.add_argument("--backfill", action="store_true",
+                        default=os.getenv("INDEXER_BACKFILL", "false").lower() == "true",
+                        help="no refresh and no replicas until the consumer catches up")
+    parser.add_argument("--idle-seconds", type=float,
+                        default=float(os.getenv("INDEXER_IDLE_SECONDS", DEFAULT_IDLE_SECONDS)))
+    args = parser.parse_args()
+
+    client = make_client(args.opensearch_url, args.user, args.password, args.workers)
+    consumer = Consumer({
+        "bootstrap.servers": args.bootstrap_servers,
+        "group.id": args.group_id,
+        "enable.auto.commit": False,
+        "auto.offset.reset": "earliest",
+    })
+    batch_size = AdaptiveBatchSize(args.batch_size, args.min_batch_size, args.max_batch_size, args.target_latency)
+    indexer = BulkIndexer(client, workers=args.workers, batch_size=batch_size)
+    settings = IndexSettings(client, refresh_interval=args.refresh_interval, replicas=args.replicas,
+                             backfill=args.backfill)
+    service = KafkaIndexer(consumer, indexer, settings, topic=args.topic, index_prefix=args.index_prefix,
+                           max_batch_bytes=args.max_batch_bytes, linger_ms=args.linger_ms,
+                           idle_seconds=args.idle_seconds)
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    try:
+        service.run()
+    finally:
+        settings.finish_backfill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,25 @@
--- Create table for call alerts with timezone support
+-- Create table for call alerts with timezone support, partitioned by UTC day
+-- of event_time. Daily partitions are created ahead and expired by
+-- pipeline/partition_manager.py; alerts outside them land in call_alerts_default.
 CREATE TABLE IF NOT EXISTS call_alerts (
-    xdrid VARCHAR(36) PRIMARY KEY,
+    xdrid VARCHAR(36) NOT NULL,
     tenant VARCHAR(50),
     val_euro DECIMAL(10,2),
     duration INTEGER,
     raw_caller_number VARCHAR(20),
     raw_called_number VARCHAR(20),
     timestamp TIMESTAMPTZ,
-    event_time TIMESTAMPTZ,
+    event_time TIMESTAMPTZ NOT NULL,
     processing_time TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
     carrier_in VARCHAR(50),
     carrier_out VARCHAR(50),
     selling_dest VARCHAR(50),
-    rule_name VARCHAR(100) NOT NULL
-);
+    rule_name VARCHAR(100) NOT NULL,
+    -- A unique key of a partitioned table must include the partition key
+    PRIMARY KEY (xdrid, event_time)
+) PARTITION BY RANGE (event_time);
+
+CREATE TABLE IF NOT EXISTS call_alerts_default PARTITION OF call_alerts DEFAULT;
 
 -- Create rules table for rule management
 CREATE TABLE IF NOT EXISTS rules (
@@ -37,17 +43,129 @@ CREATE TABLE IF NOT EXISTS audit_log (
     new_values JSONB
 );
 
+-- Kafka offsets of the alert sink (pipeline/alert_sink.py), written in the
+-- same transaction as the alerts for exactly-once loading
+CREATE TABLE IF NOT EXISTS alert_sink_offsets (
+    consumer_group VARCHAR(100) NOT NULL,
+    topic VARCHAR(255) NOT NULL,
+    partition INTEGER NOT NULL,
+    next_offset BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (consumer_group, topic, partition)
+);
+
+-- Per-rule runtime metrics sampled by the rule-manager (app/rule_metrics.py)
+CREATE TABLE IF NOT EXISTS rule_metrics (
+    ts TIMESTAMPTZ NOT NULL,
+    rule_name VARCHAR(100) NOT NULL,
+    job_id VARCHAR(32),
+    events_per_s DOUBLE PRECISION,
+    alerts_per_s DOUBLE PRECISION,
+    state_bytes BIGINT,
+    watermark_lag_ms DOUBLE PRECISION,
+    latency_p50_ms DOUBLE PRECISION,
+    latency_p99_ms DOUBLE PRECISION,
+    PRIMARY KEY (rule_name, ts)
+);
+
+-- Per-minute and per-hour alert aggregates, maintained incrementally by the
+-- rollup job (pipeline/rollup_job.py); NULL dimensions are stored as ''
+CREATE TABLE IF NOT EXISTS call_alerts_rollup_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    rule_name VARCHAR(100) NOT NULL,
+    carrier_in VARCHAR(50) NOT NULL,
+    carrier_out VARCHAR(50) NOT NULL,
+    selling_dest VARCHAR(50) NOT NULL,
+    alerts BIGINT NOT NULL,
+    val_euro DECIMAL(14,2) NOT NULL,
+    duration BIGINT NOT NULL,
+    PRIMARY KEY (bucket, rule_name, carrier_in, carrier_out, selling_dest)
+);
+
+CREATE TABLE IF NOT EXISTS call_alerts_rollup_1h (LIKE call_alerts_rollup_1m INCLUDING ALL);
+
+-- Last point processed by each rollup job, NULL before the first run
+CREATE TABLE IF NOT EXISTS rollup_checkpoints (
+    job VARCHAR(100) PRIMARY KEY,
+    checkpoint TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Where call_alert_counts(range_from, range_to) switches from the rollups to
+-- raw alerts: the minute of the Postgres rollup checkpoint
+-- (pipeline/rollup_job.py), within the range. Without a checkpoint, e.g. when
+-- the rollup service is not running, range_from: the whole range is read raw.
+CREATE OR REPLACE FUNCTION call_alert_counts_split(range_from TIMESTAMPTZ, range_to TIMESTAMPTZ)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql STABLE AS $$
+    SELECT GREATEST(range_from, LEAST(range_to, COALESCE(
+        (SELECT date_trunc('minute', c.checkpoint) FROM rollup_checkpoints c WHERE c.job = 'postgres:call_alerts'),
+        range_from)))
+$$;
+
+-- Alert counts in [range_from, range_to) for the dashboards, as rows to be
+-- summed per rule_name, carrier_in, carrier_out and/or selling_dest: raw
+-- alerts up to 6 hours, longer ranges from the whole hours of
+-- call_alerts_rollup_1h plus the minutes of call_alerts_rollup_1m at both edges
+-- up to call_alert_counts_split(), and raw alerts after it.
+CREATE OR REPLACE FUNCTION call_alert_counts(range_from TIMESTAMPTZ, range_to TIMESTAMPTZ)
+RETURNS TABLE (rule_name VARCHAR, carrier_in VARCHAR, carrier_out VARCHAR, selling_dest VARCHAR,
+               alerts BIGINT, val_euro NUMERIC, duration BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT a.rule_name, a.carrier_in, a.carrier_out, a.selling_dest, 1::BIGINT, a.val_euro, a.duration::BIGINT
+    FROM call_alerts a
+    WHERE range_to - range_from <= INTERVAL '6 hours'
+      AND a.event_time >= range_from AND a.event_time < range_to
+    UNION ALL
+    -- Past the rollup checkpoint; range_from lets the planner prune partitions before the split is known
+    SELECT a.rule_name, a.carrier_in, a.carrier_out, a.selling_dest, 1::BIGINT, a.val_euro, a.duration::BIGINT
+    FROM call_alerts a
+    WHERE range_to - range_from > INTERVAL '6 hours'
+      AND a.event_time >= range_from AND a.event_time < range_to
+      AND a.event_time >= call_alert_counts_split(range_from, range_to)
+    UNION ALL
+    -- Whole hours: from the first hour starting at or after range_from to the hour of the split
+    SELECT r.rule_name, NULLIF(r.carrier_in, ''), NULLIF(r.carrier_out, ''), NULLIF(r.selling_dest, ''),
+           r.alerts, r.val_euro, r.duration
+    FROM call_alerts_rollup_1h r
+    WHERE range_to - range_from > INTERVAL '6 hours'
+      AND r.bucket >= date_trunc('hour', range_from - INTERVAL '1 microsecond') + INTERVAL '1 hour'
+      AND r.bucket < date_trunc('hour', call_alert_counts_split(range_from, range_to))
+    UNION ALL
+    -- Minutes before the first and after the last whole hour, up to the split
+    SELECT r.rule_name, NULLIF(r.carrier_in, ''), NULLIF(r.carrier_out, ''), NULLIF(r.selling_dest, ''),
+           r.alerts, r.val_euro, r.duration
+    FROM call_alerts_rollup_1m r
+    WHERE range_to - range_from > INTERVAL '6 hours'
+      AND ((r.bucket >= range_from
+            AND r.bucket < LEAST(date_trunc('hour', range_from - INTERVAL '1 microsecond') + INTERVAL '1 hour',
+                                 call_alert_counts_split(range_from, range_to)))
+           OR (r.bucket >= GREATEST(date_trunc('hour', call_alert_counts_split(range_from, range_to)),
+                                    date_trunc('hour', range_from - INTERVAL '1 microsecond') + INTERVAL '1 hour')
+               AND r.bucket < call_alert_counts_split(range_from, range_to)))
+$$;
+
 -- Create indexes for common queries
-CREATE INDEX IF NOT EXISTS idx_call_alerts_timestamp ON call_alerts(timestamp);
-CREATE INDEX IF NOT EXISTS idx_call_alerts_tenant ON call_alerts(tenant);
-CREATE INDEX IF NOT EXISTS idx_call_alerts_rule_name ON call_alerts(rule_name);
-CREATE INDEX IF NOT EXISTS idx_call_alerts_processing_time ON call_alerts(processing_time);
+-- BRIN on the time columns of call_alerts: within a partition alerts are
+-- appended roughly in time order, so a few pages of summaries replace a btree
+CREATE INDEX IF NOT EXISTS idx_call_alerts_event_time ON call_alerts
+    USING brin (event_time) WITH (pages_per_range = 32, autosummarize = on);
+CREATE INDEX IF NOT EXISTS idx_call_alerts_processing_time ON call_alerts
+    USING brin (processing_time) WITH (pages_per_range = 32, autosummarize = on);
+CREATE INDEX IF NOT EXISTS idx_call_alerts_timestamp ON call_alerts
+    USING brin (timestamp) WITH (pages_per_range = 32, autosummarize = on);
 CREATE INDEX IF NOT EXISTS idx_rules_name ON rules(name);
 CREATE INDEX IF NOT EXISTS idx_rules_created_at ON rules(created_at);
 CREATE INDEX IF NOT EXISTS idx_audit_log_changed_at ON audit_log(changed_at);
 CREATE INDEX IF NOT EXISTS idx_audit_log_table_record ON audit_log(table_name, record_id);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_ts ON rule_metrics(ts);
 
 -- Grant privileges
 GRANT ALL PRIVILEGES ON TABLE call_alerts TO postgres;
 GRANT ALL PRIVILEGES ON TABLE rules TO postgres;
-GRANT ALL PRIVILEGES ON TABLE audit_log TO postgres;
\ No newline at end of file
+GRANT ALL PRIVILEGES ON TABLE audit_log TO postgres;
+GRANT ALL PRIVILEGES ON TABLE alert_sink_offsets TO postgres;
+GRANT ALL PRIVILEGES ON TABLE rule_metrics TO postgres;
+GRANT ALL PRIVILEGES ON TABLE call_alerts_rollup_1m TO postgres;
+GRANT ALL PRIVILEGES ON TABLE call_alerts_rollup_1h TO postgres;
+GRANT ALL PRIVILEGES ON TABLE rollup_checkpoints TO postgres;
\ No newline at end of file
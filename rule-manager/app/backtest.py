@@ -0,0 +1,327 @@
+"""Backtest rules on historical call data with the embedded engine, in event time.
+
+Replays CSVs (data/, simulatore-python/data/), JSON-lines dumps of
+call-data-raw or a Kafka topic read from the beginning through one or more
+rules, as fast as the engine goes: windows fire as the event time advances,
+never waiting for the wall clock. For each rule it reports alerts, keys
+alerted, precision/recall against the fraud labels injected by the
+simulator patterns (<file>.csv.labels next to each CSV, or --labels) and
+throughput.
+
+Rules are SQL scripts (INSERT ... GROUP BY key, TUMBLE/HOP window HAVING
+COUNT(DISTINCT x) > n, simple AND-ed WHERE filters) or inline specs:
+
+    name:window[/slide]:threshold[:key[:distinct]]    sizes in seconds
+
+Usage:
+    python app/backtest.py ../simulatore-python/data/*.csv --rule burst:120:10 --rule burst_hop:300/60:10
+    python app/backtest.py ../data/*.csv --sql sql-rules/rule_20250403212634.sql --json
+    python app/backtest.py --kafka-topic call-data-raw --bootstrap-servers localhost:9092 --rule hf:600:10
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from engine import (DistinctCountRule, HoppingWindow, StreamingRuleEngine, TumblingWindow, event_time_ms,
+                    iter_csv_records, iter_json_lines, iter_kafka_records)
+from rule_bundler import parse_aggregate_query
+from sql_validator import _INTERVAL, interval_seconds, split_statements, unquote
+
+TIME_FIELDS = ("event_timestamp", "timestamp", "start_time")
+DEFAULT_BATCH_SIZE = 10_000
+
+_HAVING_RE = re.compile(r"(APPROX_COUNT_DISTINCT\s*\(|COUNT\s*\(\s*DISTINCT\s+)\s*(`[^`]+`|\w+)\s*\)\s*(>=|>)\s*(\d+)",
+                        re.IGNORECASE)
+_CONDITION_RE = re.compile(r"(`[^`]+`|\w+)\s*(=|<>|!=|>=|<=|>|<)\s*('(?:[^']|'')*'|-?\d+(?:\.\d+)?)")
+_RULE_NAME_RE = re.compile(r"'((?:[^']|'')*)'\s+AS\s+`?rule_name`?", re.IGNORECASE)
+
+_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+class UnsupportedRule(ValueError):
+    """The SQL rule has a shape the embedded engine cannot evaluate"""
+
+def _condition(column: str, operator: str, literal: str) -> Callable[[dict], bool]:
+    compare = _OPERATORS[operator]
+    if literal.startswith("'"):
+        value: Any = literal[1:-1].replace("''", "'")
+        return lambda record: record.get(column) is not None and compare(str(record[column]), value)
+    value = float(literal)
+
+    def numeric(record: dict) -> bool:
+        try:
+            return compare(float(record.get(column)), value)
+        except (TypeError, ValueError):
+            return False
+    return numeric
+
+def compile_where(where: str) -> Callable[[dict], bool]:
+    """Record filter for `col op literal [AND ...]`; UnsupportedRule for anything else"""
+    parts = [p.strip() for p in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE)]
+    conditions = []
+    for part in parts:
+        match = _CONDITION_RE.fullmatch(part.strip("() "))
+        if not match:
+            raise UnsupportedRule(f"WHERE condition not supported by the engine: {part}")
+        conditions.append(_condition(unquote(match.group(1)), match.group(2), match.group(3)))
+    if len(conditions) == 1:
+        return conditions[0]
+    return lambda record: all(condition(record) for condition in conditions)
+
+def rules_from_sql(sql: str, default_name: str) -> List[DistinctCountRule]:
+    """Engine rules for the distinct-count INSERTs of a Flink SQL script"""
+    rules = []
+    inserts = [s for s in split_statements(sql) if re.match(r"INSERT\s+INTO\b", s, re.IGNORECASE)]
+    if not inserts:
+        raise UnsupportedRule("no INSERT INTO")
+    for statement in inserts:
+        query = parse_aggregate_query(statement)
+        if query is None:
+            raise UnsupportedRule("only windowed GROUP BY queries over calls_stream are supported")
+        if len(query["keys"]) != 1:
+            raise UnsupportedRule(f"one GROUP BY key expected, got {query['keys']}")
+        having = _HAVING_RE.fullmatch((query["having"] or "").strip("() "))
+        if not having:
+            raise UnsupportedRule(f"HAVING COUNT(DISTINCT col) > n expected, got: {query['having']}")
+        threshold = int(having.group(4)) - (1 if having.group(3) == ">=" else 0)
+        sizes = [interval_seconds(m.group(0)) for m in re.finditer(_INTERVAL, query["window"], re.IGNORECASE)]
+        if query["window"].upper().startswith("TUMBLE"):
+            window = TumblingWindow(sizes[0])
+        elif query["window"].upper().startswith("HOP"):
+            # HOP(..., slide, size)
+            window = HoppingWindow(sizes[1], sizes[0])
+        else:
+            raise UnsupportedRule(f"window not supported by the engine: {query['window']}")
+        name = _RULE_NAME_RE.search(query["select"])
+        rules.append(DistinctCountRule(
+            name.group(1) if name else default_name,
+            window,
+            threshold,
+            key_field=query["keys"][0],
+            distinct_field=unquote(having.group(2)),
+            where=compile_where(query["where"]) if query["where"] else None,
+            approximate=having.group(1).upper().startswith("APPROX")
+        ))
+    return rules
+
+def rule_from_spec(spec: str, approximate: bool = False) -> DistinctCountRule:
+    """name:window[/slide]:threshold[:key[:distinct]], sizes in seconds"""
+    parts = spec.split(":")
+    if len(parts) < 3:
+        raise ValueError(f"Rule spec must be name:window[/slide]:threshold[:key[:distinct]], got {spec!r}")
+    name, window, threshold = parts[:3]
+    size, _, slide = window.partition("/")
+    return DistinctCountRule(
+        name,
+        HoppingWindow(float(size), float(slide)) if slide else TumblingWindow(float(size)),
+        int(threshold),
+        key_field=parts[3] if len(parts) > 3 else "raw_caller_number",
+        distinct_field=parts[4] if len(parts) > 4 else "raw_called_number",
+        approximate=approximate
+    )
+
+def read_labels(paths: Iterable[str]) -> Dict[str, str]:
+    """xdrid -> injected pattern, from save_labels files (xdrid,raw_caller_number,pattern)"""
+    labels = {}
+    for path in paths:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                labels[row["xdrid"]] = row["pattern"]
+    return labels
+
+def iter_records(paths: Iterable[str]) -> Iterator[dict]:
+    for path in paths:
+        if path.endswith((".json", ".jsonl", ".ndjson")):
+            yield from iter_json_lines([path])
+        else:
+            yield from iter_csv_records([path])
+
+def load_records(source: Iterable[dict], sort: bool = True) -> Tuple[List[dict], int]:
+    """Records with their event time parsed once into event_timestamp (epoch ms), in event-time order.
+
+    Returns (records, records without a valid event time).
+    """
+    records, invalid = [], 0
+    time_field = None
+    for record in source:
+        if time_field is None:
+            time_field = next((f for f in TIME_FIELDS if record.get(f)), TIME_FIELDS[0])
+        ts = event_time_ms(record, time_field)
+        if ts is None:
+            invalid += 1
+            continue
+        record["event_timestamp"] = ts
+        records.append(record)
+    if sort:
+        records.sort(key=lambda record: record["event_timestamp"])
+    return records, invalid
+
+def score(rule: DistinctCountRule, alerts: List[dict], records: List[dict],
+          labels: Dict[str, str]) -> Dict[str, Any]:
+    """Precision and recall of the alerts, at alert and key level.
+
+    A key (e.g. caller) is fraudulent when at least one of its records is
+    labeled; an alert is a true positive when its key is fraudulent.
+    """
+    fraud_keys: Dict[Any, str] = {}
+    for record in records:
+        pattern = labels.get(record.get("xdrid"))
+        if pattern:
+            fraud_keys.setdefault(record.get(rule.key_field), pattern)
+    alerted = {alert.get(rule.key_field) for alert in alerts}
+    true_alerts = sum(1 for alert in alerts if alert.get(rule.key_field) in fraud_keys)
+    detected = alerted & fraud_keys.keys()
+
+    patterns: Dict[str, Dict[str, int]] = {}
+    for key, pattern in fraud_keys.items():
+        counts = patterns.setdefault(pattern, {"keys": 0, "detected": 0})
+        counts["keys"] += 1
+        counts["detected"] += key in detected
+    return {
+        "true_alerts": true_alerts,
+        "alert_precision": true_alerts / len(alerts) if alerts else None,
+        "keys_alerted": len(alerted),
+        "fraud_keys": len(fraud_keys),
+        "key_precision": len(detected) / len(alerted) if alerted else None,
+        "key_recall": len(detected) / len(fraud_keys) if fraud_keys else None,
+        "patterns": {p: {**c, "recall": c["detected"] / c["keys"]} for p, c in sorted(patterns.items())}
+    }
+
+def run_rules(records: List[dict], rules: List[DistinctCountRule], shared_scan: bool = False,
+              batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[Dict[str, List[dict]], Dict[str, float]]:
+    """Replay records through the rules; returns (alerts per rule, seconds per rule).
+
+    Each rule runs in its own engine, so its throughput is its own; with
+    shared_scan all rules run in one engine and share its time.
+    """
+    groups = [rules] if shared_scan else [[rule] for rule in rules]
+    alerts: Dict[str, List[dict]] = {rule.name: [] for rule in rules}
+    seconds: Dict[str, float] = {}
+    for group in groups:
+        engine = StreamingRuleEngine(group, shared_scan=shared_scan)
+        start = time.perf_counter()
+        for alert in engine.run(records, batch_size=batch_size):
+            alerts[alert["rule_name"]].append(alert)
+        elapsed = time.perf_counter() - start
+        for rule in group:
+            seconds[rule.name] = elapsed
+    return alerts, seconds
+
+def backtest(records: List[dict], rules: List[DistinctCountRule], labels: Optional[Dict[str, str]] = None,
+             shared_scan: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """One result per rule: alerts, late events, throughput and, with labels, precision/recall"""
+    names = [rule.name for rule in rules]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Rule names must be unique, got duplicates: {sorted(duplicates)}")
+    alerts, seconds = run_rules(records, rules, shared_scan, batch_size)
+    results = []
+    for rule in rules:
+        result = {
+            "rule": rule.name,
+            "definition": repr(rule),
+            "alerts": len(alerts[rule.name]),
+            "late_events": rule.late_events,
+            "seconds": seconds[rule.name],
+            "events_per_s": len(records) / seconds[rule.name] if seconds[rule.name] > 0 else None
+        }
+        if labels:
+            result.update(score(rule, alerts[rule.name], records, labels))
+        results.append(result)
+    return results
+
+def _percent(value: Optional[float]) -> str:
+    return f"{value:.1%}" if value is not None else "-"
+
+def print_report(results: List[Dict[str, Any]], out=sys.stdout):
+    width = max([len(r["rule"]) for r in results] + [4])
+    print(f"{'rule':<{width}} {'alerts':>9} {'keys':>7} {'precision':>9} {'key prec':>9} {'recall':>7} "
+          f"{'late':>7} {'events/s':>11}", file=out)
+    for r in results:
+        print(f"{r['rule']:<{width}} {r['alerts']:>9,} {r.get('keys_alerted', 0):>7,} "
+              f"{_percent(r.get('alert_precision')):>9} {_percent(r.get('key_precision')):>9} "
+              f"{_percent(r.get('key_recall')):>7} {r['late_events']:>7,} {r['events_per_s'] or 0:>11,.0f}",
+              file=out)
+        for pattern, counts in (r.get("patterns") or {}).items():
+            print(f"{'':<{width}}   {pattern}: {counts['detected']}/{counts['keys']} keys detected", file=out)
+
+def kafka_source(topic: str, bootstrap_servers: str, idle_polls: int) -> Iterator[dict]:
+    """The whole topic from the earliest offset, until idle_polls empty polls in a row"""
+    from confluent_kafka import Consumer
+    consumer = Consumer({
+        "bootstrap.servers": bootstrap_servers,
+        "group.id": f"backtest-{os.getpid()}-{int(time.time())}",
+        "auto.offset.reset": "earliest",
+        "enable.auto.commit": False
+    })
+    consumer.subscribe([topic])
+    try:
+        yield from iter_kafka_records(consumer, max_idle_polls=idle_polls)
+    finally:
+        consumer.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="call CSVs or JSON-lines dumps")
+    parser.add_argument("--rule", action="append", default=[], help="inline rule spec, repeatable")
+    parser.add_argument("--sql", action="append", default=[], help="Flink SQL rule script, repeatable")
+    parser.add_argument("--approximate", action="store_true", help="HyperLogLog distinct counts for --rule")
+    parser.add_argument("--labels", action="append", default=[],
+                        help="labels file (default: <path>.labels next to each input that has one)")
+    parser.add_argument("--kafka-topic", help="replay this topic from the earliest offset instead of files")
+    parser.add_argument("--bootstrap-servers", default="localhost:9092")
+    parser.add_argument("--idle-polls", type=int, default=5, help="stop the topic replay after N empty polls")
+    parser.add_argument("--no-sort", action="store_true", help="replay in input order instead of event time")
+    parser.add_argument("--shared-scan", action="store_true", help="run all rules in one shared-scan engine")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    rules = [rule_from_spec(spec, args.approximate) for spec in args.rule]
+    for path in args.sql:
+        with open(path) as f:
+            try:
+                rules.extend(rules_from_sql(f.read(), os.path.splitext(os.path.basename(path))[0]))
+            except UnsupportedRule as e:
+                print(f"Skipping {path}: {e}", file=sys.stderr)
+    if not rules:
+        parser.error("no rule to backtest: use --rule or --sql")
+    if not args.paths and not args.kafka_topic:
+        parser.error("no input: give CSV/JSON paths or --kafka-topic")
+
+    label_paths = args.labels or [f"{p}.labels" for p in args.paths if os.path.exists(f"{p}.labels")]
+    labels = read_labels(label_paths)
+
+    start = time.perf_counter()
+    if args.kafka_topic:
+        source = kafka_source(args.kafka_topic, args.bootstrap_servers, args.idle_polls)
+    else:
+        source = iter_records(args.paths)
+    records, invalid = load_records(source, sort=not args.no_sort)
+    load_seconds = time.perf_counter() - start
+
+    results = backtest(records, rules, labels, args.shared_scan, args.batch_size)
+    if args.json:
+        json.dump({"records": len(records), "invalid_records": invalid, "load_seconds": load_seconds,
+                   "labeled_records": len(labels), "results": results}, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"{len(records):,} records ({invalid:,} without event time) loaded in {load_seconds:.1f}s, "
+              f"{len(labels):,} labeled fraud records")
+        print_report(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
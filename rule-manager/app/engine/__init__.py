@@ -0,0 +1,11 @@
+from .windows import TumblingWindow, HoppingWindow
+from .sketches import HyperLogLog, precision_for_error
+from .rules import DistinctCountRule, PaneStore, ALERT_FIELDS
+from .engine import StreamingRuleEngine, event_time_ms
+from .sources import iter_csv_records, iter_json_lines, iter_kafka_records
+
+__all__ = [
+    'TumblingWindow', 'HoppingWindow', 'DistinctCountRule', 'PaneStore', 'ALERT_FIELDS',
+    'HyperLogLog', 'precision_for_error', 'StreamingRuleEngine', 'event_time_ms',
+    'iter_csv_records', 'iter_json_lines', 'iter_kafka_records',
+]
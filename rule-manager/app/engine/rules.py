@@ -0,0 +1,286 @@
+"""Windowed rules evaluated by the embedded rule engine."""
+
+import itertools
+import math
+import sys
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from .sketches import DEFAULT_ERROR, HyperLogLog, precision_for_error
+from .windows import TumblingWindow, HoppingWindow
+
+# Columns of the call_alerts table (postgres/db_init.sql) filled by the engine
+ALERT_FIELDS = [
+    "xdrid", "tenant", "val_euro", "duration", "raw_caller_number", "raw_called_number",
+    "timestamp", "event_time", "carrier_in", "carrier_out", "selling_dest", "rule_name",
+]
+
+# Alert latencies (processing time - event time) kept per rule for metrics
+LATENCY_SAMPLES = 4096
+
+
+def format_ms(ts_ms: int) -> str:
+    """ISO-8601 UTC timestamp with milliseconds, as produced by the Flink JSON format."""
+    dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def alert_row(record: dict, event_ms: int, rule_name: str, processing_ms: int) -> dict:
+    """Build a call_alerts row from the record that triggered the rule."""
+    return {
+        "xdrid": record.get("xdrid"),
+        "tenant": record.get("tenant"),
+        "val_euro": record.get("val_euro"),
+        "duration": record.get("duration"),
+        "raw_caller_number": record.get("raw_caller_number"),
+        "raw_called_number": record.get("raw_called_number"),
+        "timestamp": format_ms(processing_ms),
+        "event_time": format_ms(event_ms),
+        "carrier_in": record.get("carrier_in"),
+        "carrier_out": record.get("carrier_out"),
+        "selling_dest": record.get("selling_dest"),
+        "rule_name": rule_name,
+    }
+
+
+class PaneStore:
+    """Distinct-value state per slide-sized pane and per key, shared by compatible rules.
+
+    Each (pane, key) holds the distinct values (set or HyperLogLog), the
+    latest event time and the latest record. Rules reading the same key,
+    distinct field, filter and counting mode can share one store: each event
+    is filtered and inserted once whatever the number of rules, and the pane
+    size is the greatest common divisor of their slides. A pane is dropped
+    once no rule attached to the store has an unfired window containing it.
+    """
+
+    def __init__(self, slide_ms: int, key_field: str, distinct_field: str,
+                 where: Optional[Callable[[dict], bool]] = None, precision: Optional[int] = None):
+        self.slide_ms = slide_ms
+        self.key_field = key_field
+        self.distinct_field = distinct_field
+        self.where = where
+        self.precision = precision
+        self.rules: List["DistinctCountRule"] = []
+        # pane start (ms) -> key -> [distinct values (set or sketch), latest event ms, latest record]
+        self.panes: Dict[int, Dict[str, list]] = {}
+
+    @staticmethod
+    def signature(rule: "DistinctCountRule") -> tuple:
+        """Rules with the same signature can share a store"""
+        return (rule.key_field, rule.distinct_field, rule.where, rule.precision)
+
+    def attach(self, rule: "DistinctCountRule") -> None:
+        self.slide_ms = math.gcd(self.slide_ms, rule.window.slide_ms) if self.rules else rule.window.slide_ms
+        self.rules.append(rule)
+        rule.store = self
+
+    def insert(self, pane: int, ts: int, record: dict) -> None:
+        keys = self.panes.get(pane)
+        if keys is None:
+            keys = self.panes[pane] = {}
+        key = record.get(self.key_field)
+        value = record.get(self.distinct_field)
+        state = keys.get(key)
+        if state is None:
+            if self.precision is not None:
+                values = HyperLogLog(self.precision)
+                values.add(value)
+            else:
+                values = {value}
+            keys[key] = [values, ts, record]
+        else:
+            state[0].add(value)
+            if ts >= state[1]:
+                state[1] = ts
+                state[2] = record
+
+    def add(self, ts: int, record: dict) -> None:
+        """Add one event for every attached rule that still has a window for it."""
+        if self.where is not None and not self.where(record):
+            return
+        accepted = False
+        for rule in self.rules:
+            accepted |= rule._accept(ts)
+        if accepted:
+            self.insert(ts - ts % self.slide_ms, ts, record)
+
+    def evict(self) -> None:
+        """Drop the panes that no attached rule will read again."""
+        bound = None
+        for rule in self.rules:
+            if rule._fired_until is None:
+                return
+            # Start of the earliest window of this rule that has not fired yet
+            needed_from = rule._fired_until + rule.window.slide_ms - rule.window.size_ms
+            bound = needed_from if bound is None else min(bound, needed_from)
+        for pane in [p for p in self.panes if p + self.slide_ms <= bound]:
+            del self.panes[pane]
+
+    def _values_bytes(self, values) -> int:
+        if self.precision is not None:
+            return values.sizeof()
+        return sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+
+    def state_bytes(self) -> int:
+        return sum(self._values_bytes(state[0]) for keys in self.panes.values() for state in keys.values())
+
+    def estimated_state_bytes(self, sample: int = 512) -> int:
+        """state_bytes() extrapolated from about `sample` key states, cheap enough for periodic metrics."""
+        states = self.active_keys()
+        if states <= sample:
+            return self.state_bytes()
+        # Every step-th state of each pane, spread over insertion order
+        step = states // sample
+        measured = total = 0
+        for keys in self.panes.values():
+            for state in itertools.islice(keys.values(), 0, None, step):
+                total += self._values_bytes(state[0])
+                measured += 1
+        return int(total / measured * states) if measured else self.state_bytes()
+
+    def active_keys(self) -> int:
+        return sum(len(keys) for keys in self.panes.values())
+
+
+class DistinctCountRule:
+    """Alert when a key has more than `threshold` distinct values in a window.
+
+    Equivalent to the Flink SQL pattern used by top-callers-rule.sql:
+
+        SELECT raw_caller_number, COUNT(DISTINCT raw_called_number)
+        FROM TABLE(TUMBLE(TABLE calls_stream, DESCRIPTOR(event_timestamp), INTERVAL '2' MINUTES))
+        GROUP BY raw_caller_number, window_start, window_end
+        HAVING COUNT(DISTINCT raw_called_number) > 3
+
+    State is kept per slide-sized pane and per key in a PaneStore: each key
+    holds the set of distinct values and the latest record seen. Panes are
+    dropped as soon as no window that still has to fire contains them, so
+    memory is bounded by the keys active in the open windows. The rule owns
+    its store unless the engine attaches it to one shared with other rules.
+
+    With `approximate=True` the distinct values are kept in a HyperLogLog
+    sketch with relative standard error `error` instead of an exact set:
+    memory per key is bounded by 2**precision bytes whatever the number of
+    called numbers, at the cost of approximate counts near the threshold.
+    """
+
+    def __init__(self, name: str, window, threshold: int,
+                 key_field: str = "raw_caller_number",
+                 distinct_field: str = "raw_called_number",
+                 where: Optional[Callable[[dict], bool]] = None,
+                 approximate: bool = False, error: float = DEFAULT_ERROR):
+        if not isinstance(window, (TumblingWindow, HoppingWindow)):
+            raise ValueError("window must be a TumblingWindow or HoppingWindow")
+        self.name = name
+        self.window = window
+        self.threshold = threshold
+        self.key_field = key_field
+        self.distinct_field = distinct_field
+        self.where = where
+        self.approximate = approximate
+        self.precision = precision_for_error(error) if approximate else None
+        self.events = 0
+        self.late_events = 0
+        self.alerts = 0
+        # Latest alert latencies in ms, drained by the metrics collector
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._fired_until: Optional[int] = None
+        self._next_end: Optional[int] = None
+        self.store: PaneStore = None
+        PaneStore(window.slide_ms, key_field, distinct_field, where, self.precision).attach(self)
+
+    def _first_end(self, pane: int) -> int:
+        """End of the earliest window containing `pane` that has not fired yet."""
+        slide = self.window.slide_ms
+        end = pane - pane % slide + slide
+        if self._fired_until is not None:
+            end = max(end, self._fired_until + slide)
+        return end
+
+    def _accept(self, ts: int) -> bool:
+        """Whether this rule has an unfired window for event time `ts`; counts late events."""
+        pane = ts - ts % self.window.slide_ms
+        if self._fired_until is not None and pane + self.window.size_ms <= self._fired_until:
+            # Every window containing this event has already fired
+            self.late_events += 1
+            return False
+        if self._next_end is None or pane + self.window.slide_ms < self._next_end:
+            self._next_end = self._first_end(pane)
+        self.events += 1
+        return True
+
+    def add(self, ts: int, record: dict) -> None:
+        """Add one event with event time `ts` (epoch ms) to the window state."""
+        if len(self.store.rules) > 1:
+            raise RuntimeError(f"{self.name} shares its state: add events through its PaneStore")
+        self.store.add(ts, record)
+
+    def fire(self, watermark: int, processing_ms: int) -> List[dict]:
+        """Evaluate every window whose end is covered by `watermark`, then drop unneeded panes."""
+        alerts = []
+        fired = False
+        while self._next_end is not None and self._next_end - 1 <= watermark:
+            end = self._next_end
+            alerts.extend(self._evaluate(end, processing_ms))
+            self._fired_until = end
+            fired = True
+            start = end + self.window.slide_ms - self.window.size_ms
+            remaining = [p for p in self.store.panes if p + self.store.slide_ms > start]
+            self._next_end = self._first_end(max(min(remaining), start)) if remaining else None
+        if fired:
+            self.store.evict()
+        self.alerts += len(alerts)
+        return alerts
+
+    def _evaluate(self, end: int, processing_ms: int) -> List[dict]:
+        store_panes = self.store.panes
+        panes = [store_panes[p] for p in range(end - self.window.size_ms, end, self.store.slide_ms)
+                 if p in store_panes]
+        if not panes:
+            return []
+
+        alerts = []
+        threshold = self.threshold
+        if len(panes) == 1:
+            for values, ts, record in panes[0].values():
+                if len(values) > threshold:
+                    alerts.append(alert_row(record, ts, self.name, processing_ms))
+                    self.latencies_ms.append(processing_ms - ts)
+            return alerts
+
+        # Upper bound of the distinct count per key: the exact union is only
+        # computed for the few keys whose pane totals exceed the threshold
+        totals: Dict[str, int] = {}
+        for pane in panes:
+            for key, state in pane.items():
+                totals[key] = totals.get(key, 0) + len(state[0])
+        for key, total in totals.items():
+            if total <= threshold:
+                continue
+            states = [pane[key] for pane in panes if key in pane]
+            if len(states) > 1 and self._union_count([s[0] for s in states]) <= threshold:
+                continue
+            latest = max(states, key=lambda s: s[1])
+            alerts.append(alert_row(latest[2], latest[1], self.name, processing_ms))
+            self.latencies_ms.append(processing_ms - latest[1])
+        return alerts
+
+    def _union_count(self, values: List) -> int:
+        if self.approximate:
+            return HyperLogLog.union(values).count()
+        return len(set().union(*values))
+
+    def state_bytes(self) -> int:
+        """Approximate size of the distinct-value state (sets or sketches), in bytes."""
+        return self.store.state_bytes()
+
+    def active_keys(self) -> int:
+        """Number of (pane, key) states currently held."""
+        return self.store.active_keys()
+
+    def __repr__(self) -> str:
+        return (f"DistinctCountRule({self.name!r}, {self.window!r}, threshold={self.threshold}, "
+                f"key={self.key_field!r}, distinct={self.distinct_field!r}"
+                + (f", approximate=True, precision={self.precision})" if self.approximate else ")"))
@@ -0,0 +1,192 @@
+"""Approximate distinct counting for the embedded rule engine."""
+
+import hashlib
+import math
+import struct
+import sys
+from typing import Iterable, Optional
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+DEFAULT_ERROR = 0.02
+
+# 2**-rank for every possible register value
+_INV_POW2 = [2.0 ** -rank for rank in range(65)]
+
+_SPARSE = b"S"
+_DENSE = b"D"
+
+
+def precision_for_error(error: float) -> int:
+    """Smallest precision whose standard error 1.04 / sqrt(2**p) is <= `error`."""
+    if not 0 < error < 1:
+        raise ValueError("error must be between 0 and 1")
+    p = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(p, MIN_PRECISION), MAX_PRECISION)
+
+
+def hash64(value) -> int:
+    """Stable 64-bit hash, identical across processes so shard sketches can be merged."""
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    """HyperLogLog sketch with a sparse representation for small cardinalities.
+
+    Most callers dial a handful of numbers per window, so registers start in
+    a dict holding only the non-zero entries and switch to a dense bytearray
+    of 2**precision bytes once that is smaller. Sketches with the same
+    precision merge by register-wise max, which makes the union of HOP panes
+    or of per-shard sketches exact with respect to the sketch itself.
+    """
+
+    __slots__ = ("precision", "_sparse", "_dense")
+
+    def __init__(self, precision: Optional[int] = None, error: Optional[float] = None):
+        if precision is None:
+            precision = precision_for_error(error if error is not None else DEFAULT_ERROR)
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.precision = precision
+        self._sparse: Optional[dict] = {}
+        self._dense: Optional[bytearray] = None
+
+    @property
+    def m(self) -> int:
+        return 1 << self.precision
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def _sparse_limit(self) -> int:
+        # In memory a dict entry costs about as much as 32 dense registers
+        return self.m >> 5
+
+    def _densify(self) -> None:
+        dense = bytearray(self.m)
+        for index, rank in self._sparse.items():
+            dense[index] = rank
+        self._dense = dense
+        self._sparse = None
+
+    def add(self, value) -> None:
+        self.add_hash(hash64(value))
+
+    def add_hash(self, h: int) -> None:
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if self._dense is not None:
+            if rank > self._dense[index]:
+                self._dense[index] = rank
+            return
+        if rank > self._sparse.get(index, 0):
+            self._sparse[index] = rank
+            if len(self._sparse) > self._sparse_limit():
+                self._densify()
+
+    def update(self, values: Iterable) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Merge `other` into this sketch (register-wise max)."""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        if other._dense is None:
+            if self._dense is None:
+                sparse = self._sparse
+                for index, rank in other._sparse.items():
+                    if rank > sparse.get(index, 0):
+                        sparse[index] = rank
+                if len(sparse) > self._sparse_limit():
+                    self._densify()
+            else:
+                dense = self._dense
+                for index, rank in other._sparse.items():
+                    if rank > dense[index]:
+                        dense[index] = rank
+            return
+        if self._dense is None:
+            self._densify()
+        self._dense = bytearray(map(max, self._dense, other._dense))
+
+    def copy(self) -> "HyperLogLog":
+        sketch = HyperLogLog(self.precision)
+        if self._dense is not None:
+            sketch._sparse = None
+            sketch._dense = bytearray(self._dense)
+        else:
+            sketch._sparse = dict(self._sparse)
+        return sketch
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"]) -> "HyperLogLog":
+        """New sketch counting the union of `sketches` (at least one required)."""
+        sketches = iter(sketches)
+        result = next(sketches).copy()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        m = self.m
+        if self._dense is None:
+            zeros = m - len(self._sparse)
+            total = zeros + sum(map(_INV_POW2.__getitem__, self._sparse.values()))
+        else:
+            zeros = self._dense.count(0)
+            total = sum(map(_INV_POW2.__getitem__, self._dense))
+        estimate = _alpha(m) * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is far more accurate in the small range
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def sizeof(self) -> int:
+        """Approximate size in bytes of the sketch in memory."""
+        registers = self._dense if self._dense is not None else self._sparse
+        return sys.getsizeof(self) + sys.getsizeof(registers)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the sketch, e.g. to ship it between shards."""
+        if self._dense is not None:
+            return _DENSE + bytes([self.precision]) + bytes(self._dense)
+        items = sorted(self._sparse.items())
+        return (_SPARSE + bytes([self.precision])
+                + b"".join(struct.pack(">HB", index, rank) for index, rank in items))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        kind, precision = data[:1], data[1]
+        sketch = cls(precision)
+        if kind == _DENSE:
+            if len(data) - 2 != sketch.m:
+                raise ValueError("corrupted dense sketch")
+            sketch._sparse = None
+            sketch._dense = bytearray(data[2:])
+        elif kind == _SPARSE:
+            sketch._sparse = {index: rank for index, rank in struct.iter_unpack(">HB", data[2:])}
+        else:
+            raise ValueError("unknown sketch encoding")
+        return sketch
+
+    def __repr__(self) -> str:
+        mode = "dense" if self._dense is not None else "sparse"
+        return f"HyperLogLog(precision={self.precision}, {mode}, count~{self.count()})"
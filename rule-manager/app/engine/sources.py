@@ -0,0 +1,64 @@
+"""Record sources for the embedded rule engine."""
+
+import csv
+import json
+import logging
+from typing import Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = {"val_euro": float, "economicUnitValue": float, "duration": int}
+
+
+def _convert(record: dict) -> dict:
+    """Apply the same numeric conversions as csv-to-kafka.conf."""
+    for field, cast in NUMERIC_FIELDS.items():
+        value = record.get(field)
+        if isinstance(value, str):
+            try:
+                record[field] = cast(value) if value else None
+            except ValueError:
+                record[field] = None
+    return record
+
+
+def iter_csv_records(paths: Iterable[str]) -> Iterator[dict]:
+    """Call records from simulator CSV files (header row required), in file order."""
+    for path in paths:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield _convert(row)
+
+
+def iter_json_lines(paths: Iterable[str]) -> Iterator[dict]:
+    """Call records from JSON-lines files, e.g. a dump of the call-data-raw topic."""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def iter_kafka_records(consumer, poll_timeout: float = 1.0,
+                       max_idle_polls: Optional[int] = None) -> Iterator[dict]:
+    """Decode JSON messages from a Kafka-like consumer.
+
+    `consumer.poll(timeout)` must return None or a message exposing `value()`
+    and `error()` (the confluent-kafka interface). Iteration stops after
+    `max_idle_polls` consecutive empty polls, or never if it is None.
+    """
+    idle = 0
+    while max_idle_polls is None or idle < max_idle_polls:
+        message = consumer.poll(poll_timeout)
+        if message is None:
+            idle += 1
+            continue
+        idle = 0
+        if message.error():
+            logger.warning(f"Kafka consumer error: {message.error()}")
+            continue
+        try:
+            yield json.loads(message.value())
+        except (TypeError, ValueError):
+            logger.warning("Skipping undecodable message")
@@ -0,0 +1,37 @@
+"""Event-time window definitions for the embedded rule engine."""
+
+
+class TumblingWindow:
+    """Fixed, non-overlapping windows of `size_seconds` (Flink TUMBLE)."""
+
+    def __init__(self, size_seconds: float):
+        self.size_ms = int(size_seconds * 1000)
+        self.slide_ms = self.size_ms
+
+    @property
+    def panes_per_window(self) -> int:
+        return 1
+
+    def __repr__(self) -> str:
+        return f"TumblingWindow({self.size_ms / 1000:g})"
+
+
+class HoppingWindow:
+    """Overlapping windows of `size_seconds` starting every `slide_seconds` (Flink HOP).
+
+    The engine keeps state per slide-sized pane and merges `size / slide` panes
+    when a window fires, so the size must be a multiple of the slide.
+    """
+
+    def __init__(self, size_seconds: float, slide_seconds: float):
+        self.size_ms = int(size_seconds * 1000)
+        self.slide_ms = int(slide_seconds * 1000)
+        if self.slide_ms <= 0 or self.size_ms % self.slide_ms:
+            raise ValueError("HoppingWindow size must be a positive multiple of slide")
+
+    @property
+    def panes_per_window(self) -> int:
+        return self.size_ms // self.slide_ms
+
+    def __repr__(self) -> str:
+        return f"HoppingWindow({self.size_ms / 1000:g}, {self.slide_ms / 1000:g})"
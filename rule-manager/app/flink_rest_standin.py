@@ -0,0 +1,175 @@
+"""Local stand-in for the parts of the Flink REST API read by rule_metrics.py.
+
+Every rule runs as its own "job" (one StreamingRuleEngine each), fed by a
+thread that replays call records at --rate events/s with event times set to
+the current time, so rates, watermark lag and state behave like a live job.
+Served endpoints (same JSON shape as Flink, only the fields we read):
+
+    GET /jobs/overview
+    GET /jobs/<jid>
+    GET /jobs/<jid>/vertices/<vid>/subtasks/metrics[?get=...&agg=sum]
+    GET /jobs/<jid>/vertices/<vid>/watermarks
+    GET /jobs/<jid>/checkpoints
+
+Usage:
+    python app/flink_rest_standin.py ../simulatore-python/data/*.csv [--rate 2000] [--port 8081]
+    METRICS_SOURCE=flink FLINK_URL=http://localhost:8081 python app/main.py
+"""
+
+import sys
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from typing import Iterator, List
+from flask import Flask, abort, jsonify, request
+from engine import DistinctCountRule, HoppingWindow, StreamingRuleEngine, TumblingWindow, iter_csv_records
+
+SENT_METRIC = "call_alerts[4]__Writer.numRecordsSend"
+
+def default_rules() -> List[DistinctCountRule]:
+    """The distinct-count rules of sql-rules/, plus a hopping variant"""
+    return [
+        DistinctCountRule("high_frequency_caller", TumblingWindow(600), threshold=10),
+        DistinctCountRule("burst_caller", HoppingWindow(300, 60), threshold=5),
+        DistinctCountRule("wide_called_spread", TumblingWindow(60), threshold=3, key_field="raw_called_number",
+                          distinct_field="raw_caller_number")
+    ]
+
+def synthetic_records(callers: int = 5000) -> Iterator[dict]:
+    """Calls among `callers` numbers when no CSV is given"""
+    rng = random.Random(7)
+    for i in itertools.count():
+        yield {
+            "xdrid": f"standin-{i}",
+            "raw_caller_number": f"39{rng.randrange(callers):08d}",
+            "raw_called_number": f"39{rng.randrange(callers * 4):08d}",
+            "duration": rng.randrange(1, 600),
+            "val_euro": round(rng.random(), 2)
+        }
+
+class StandinJob:
+    def __init__(self, rule: DistinctCountRule):
+        self.rule = rule
+        self.engine = StreamingRuleEngine([rule])
+        self.jid = hashlib.md5(rule.name.encode()).hexdigest()
+        self.source_vid = hashlib.md5(f"{rule.name}/source".encode()).hexdigest()
+        self.sink_vid = hashlib.md5(f"{rule.name}/sink".encode()).hexdigest()
+        self.start_time = int(time.time() * 1000)
+        self.checkpoint_bytes = None
+
+class Standin:
+    def __init__(self, rules: List[DistinctCountRule], records: Iterator[dict], rate: float,
+                 checkpoint_interval: float = 10.0):
+        self.jobs = {job.jid: job for job in map(StandinJob, rules)}
+        self.records = records
+        self.rate = rate
+        self.checkpoint_interval = checkpoint_interval
+        self.lock = threading.Lock()
+
+    def run(self):
+        """Replay records in 100 ms batches; checkpoint (state size) every checkpoint_interval"""
+        batch_size = max(1, int(self.rate / 10))
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        while True:
+            started = time.monotonic()
+            now_ms = int(time.time() * 1000)
+            batch = [{**record, "event_timestamp": now_ms} for record in itertools.islice(self.records, batch_size)]
+            if not batch:
+                return
+            with self.lock:
+                for job in self.jobs.values():
+                    job.engine.process_batch(batch)
+                if started >= next_checkpoint:
+                    for job in self.jobs.values():
+                        job.checkpoint_bytes = job.engine.state_bytes()
+                    next_checkpoint = started + self.checkpoint_interval
+            time.sleep(max(0.0, 0.1 - (time.monotonic() - started)))
+
+    def job(self, jid: str) -> StandinJob:
+        job = self.jobs.get(jid)
+        if job is None:
+            abort(404)
+        return job
+
+def create_app(standin: Standin) -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/jobs/overview")
+    def jobs_overview():
+        now = int(time.time() * 1000)
+        return jsonify({"jobs": [
+            {"jid": job.jid, "name": job.rule.name, "state": "RUNNING", "start-time": job.start_time,
+             "end-time": -1, "duration": now - job.start_time, "last-modification": job.start_time}
+            for job in standin.jobs.values()
+        ]})
+
+    @app.route("/jobs/<jid>")
+    def job_detail(jid):
+        job = standin.job(jid)
+        with standin.lock:
+            events, accepted = job.engine.events, job.rule.events
+        return jsonify({
+            "jid": job.jid,
+            "name": job.rule.name,
+            "state": "RUNNING",
+            "start-time": job.start_time,
+            "vertices": [
+                {"id": job.source_vid, "name": "Source: calls_stream[1] -> Calc[2]", "parallelism": 1,
+                 "status": "RUNNING", "metrics": {"read-records": 0, "write-records": events}},
+                {"id": job.sink_vid, "name": "WindowAggregate[3] -> call_alerts[4]: Writer", "parallelism": 1,
+                 "status": "RUNNING", "metrics": {"read-records": accepted, "write-records": 0}}
+            ]
+        })
+
+    @app.route("/jobs/<jid>/vertices/<vid>/subtasks/metrics")
+    def subtask_metrics(jid, vid):
+        job = standin.job(jid)
+        if vid != job.sink_vid:
+            return jsonify([])
+        requested = request.args.get("get")
+        if not requested:
+            return jsonify([{"id": SENT_METRIC}])
+        with standin.lock:
+            alerts = job.rule.alerts
+        return jsonify([{"id": SENT_METRIC, "min": alerts, "max": alerts, "avg": alerts, "sum": alerts}
+                        for name in requested.split(",") if name == SENT_METRIC])
+
+    @app.route("/jobs/<jid>/vertices/<vid>/watermarks")
+    def watermarks(jid, vid):
+        job = standin.job(jid)
+        with standin.lock:
+            watermark = job.engine.watermark
+        value = str(watermark if watermark is not None else -2 ** 63)
+        return jsonify([{"id": "0.currentInputWatermark", "value": value}])
+
+    @app.route("/jobs/<jid>/checkpoints")
+    def checkpoints(jid):
+        job = standin.job(jid)
+        if job.checkpoint_bytes is None:
+            return jsonify({"counts": {"completed": 0}, "latest": {"completed": None}})
+        return jsonify({"counts": {"completed": 1},
+                        "latest": {"completed": {"state_size": job.checkpoint_bytes,
+                                                 "checkpointed_size": job.checkpoint_bytes}}})
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="call CSVs to replay in a loop (synthetic calls if none)")
+    parser.add_argument("--rate", type=float, default=2000.0, help="events per second")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args(argv)
+
+    if args.paths:
+        records = itertools.cycle(list(iter_csv_records(args.paths)))
+    else:
+        records = synthetic_records()
+    standin = Standin(default_rules(), records, args.rate)
+    threading.Thread(target=standin.run, name="standin-replay", daemon=True).start()
+    create_app(standin).run(host="0.0.0.0", port=args.port)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,47 @@
-# pip install flask google-generativeai
+# pip install flask google-generativeai (modalità ASGI: starlette uvicorn)
 
 # PROMPT ##############
 # Esempio di utilizzo:
 # curl -X POST http://localhost:5001/generate_rule -H "Content-Type: application/json" \
 #   -d '{"rule": "caller che chiama piu di 10 called in 10 min", "rule_name": "high_frequency_caller"}'
+#
+# La risposta include "validation" (sql_validator.py: schema delle tabelle, stato non limitato,
+# stima dello stato) e "rule_status": "validated", oppure "error" se lo script non supera la
+# validazione. In quel caso viene salvato in sql-rules/invalid/, fuori da start-rule-bundle.sh
+# e start-manual-rule.sh. Per validare uno script esistente:
+# curl -X POST http://localhost:5001/validate_rule -H "Content-Type: application/json" \
+#   -d '{"filename": "top-callers-rule.sql"}'
+#
+# Con SERVER_MODE=asgi gira su uvicorn: al massimo GENERATION_CONCURRENCY chiamate a Gemini
+# in parallelo, richieste identiche in corso condividono la stessa chiamata, e oltre
+# GENERATION_QUEUE richieste in attesa la risposta è 429 con Retry-After.
+#
+# Metriche per regola (rule_metrics.py), campionate ogni METRICS_INTERVAL secondi dalla REST API
+# di Flink (FLINK_URL, oppure flink_rest_standin.py in locale); con METRICS_DSN anche alert/s e
+# latenza end-to-end da call_alerts, e ogni campione scritto nella tabella rule_metrics:
+# curl http://localhost:5001/rule_metrics
+# curl "http://localhost:5001/rule_metrics/high_frequency_caller?since=1760000000"
+#
+# All'avvio si connette all'archivio delle regole su OpenSearch (RULE_STORE, OPENSEARCH_HOST),
+# installa il template degli indici calls-* e ogni METRICS_PUBLISH_EVERY campioni scrive le
+# ultime metriche in Rule.metrics delle regole salvate.
 
 
 from flask import Flask, request, jsonify
 import google.generativeai as genai
 import os
+import sys
 import datetime
 import logging
+import threading
 from logging.handlers import RotatingFileHandler
+from sql_cache import GeneratedRuleCache, ScriptIndex, context_version
+from flink_ddl import CALLS_STREAM_DDL, CALL_ALERTS_DDL
+from sql_validator import validate_sql, validation_status
+from rule_metrics import FlinkRestMetricsSource, MetricsCollector, PostgresMetricsStore
+# services/ usa import relativi al package app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services import OpenSearchService
 
 # Determina la directory base e imposta permessi
 def setup_directory(dir_path):
@@ -37,9 +67,12 @@ logger = logging.getLogger(__name__)
 # Configurazione directory
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
 SQL_DIR = os.path.join(BASE_DIR, 'sql-rules')
+# Script che non superano la validazione: non vengono mai avviati
+INVALID_DIRNAME = 'invalid'
+INVALID_SQL_DIR = os.path.join(SQL_DIR, INVALID_DIRNAME)
 
 # Crea e configura le directory necessarie
-for directory in [LOG_DIR, SQL_DIR]:
+for directory in [LOG_DIR, SQL_DIR, INVALID_SQL_DIR]:
     if not setup_directory(directory):
         logger.warning(f"Could not set up directory {directory} - may have permission issues")
     else:
@@ -77,6 +110,8 @@ if not GENAI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable is not set")
 genai.configure(api_key=GENAI_API_KEY)
 
+GEMINI_MODEL = 'gemini-2.0-flash'
+
 # Contesto SQL per Gemini
 CONTEXT = """
 Sei un esperto di Apache Flink SQL specializzato nella generazione di query per il rilevamento frodi telefoniche in tempo reale.
@@ -84,59 +119,9 @@ Quando ricevi una richiesta, devi restituire SOLO lo script SQL Flink senza spie
 
 IMPORTANTE:
 - Lo script deve sempre partire con la definizione delle tabelle:
-CREATE TABLE calls_stream (
-    `event_type` STRING,
-    `kafka_timestamp` TIMESTAMP_LTZ(3) METADATA FROM 'timestamp',
-    `carrier_out` STRING,
-    `@timestamp` TIMESTAMP_LTZ(3),
-    `tenant` STRING,
-    `economicUnitValue` DOUBLE,
-    `selling_dest` STRING,
-    `paese_destinazione` STRING,
-    `event_timestamp` TIMESTAMP_LTZ(3),
-    `routing_dest` STRING,
-    `duration` INT,
-    `val_euro` DOUBLE,
-    `raw_called_number` STRING,
-    `raw_caller_number` STRING,
-    `carrier_in` STRING,
-    `xdrid` STRING,
-    `other_party_country` STRING,
-    WATERMARK FOR `event_timestamp` AS `event_timestamp` - INTERVAL '5' SECOND
-) WITH (
-    'connector' = 'kafka',
-    'topic' = 'call-data-raw',
-    'properties.bootstrap.servers' = 'kafka:29092',
-    'properties.group.id' = 'flink-rule-group',
-    'format' = 'json',
-    'json.timestamp-format.standard' = 'ISO-8601',
-    'json.fail-on-missing-field' = 'false',
-    'json.ignore-parse-errors' = 'true',
-    'scan.startup.mode' = 'earliest-offset',
-    'properties.fetch.min.bytes' = '1048576',
-    'properties.fetch.max.wait.ms' = '10000'
-);
-
-CREATE TABLE call_alerts (
-    xdrid STRING,
-    tenant STRING,
-    val_euro DOUBLE,
-    duration INT,
-    raw_caller_number STRING,
-    raw_called_number STRING,
-    `timestamp` TIMESTAMP_LTZ(3),
-    event_time TIMESTAMP_LTZ(3),
-    carrier_in STRING,
-    carrier_out STRING,
-    selling_dest STRING,
-    rule_name STRING
-) WITH (
-    'connector' = 'kafka',
-    'topic' = 'call-alerts',
-    'properties.bootstrap.servers' = 'kafka:29092',
-    'format' = 'json',
-    'json.timestamp-format.standard' = 'ISO-8601'
-);
+""" + CALLS_STREAM_DDL + """
+
+""" + CALL_ALERTS_DDL + """
 
 LINEE GUIDA:
 1. Usa GROUP BY e finestre temporali (TUMBLE o HOP) per aggregare i dati nel periodo specificato
@@ -164,6 +149,180 @@ LINEE GUIDA:
 Rispondi solo con lo script SQL Flink, senza testo aggiuntivo.
 """
 
+# Cache delle regole generate e indice dei contenuti di SQL_DIR (nessuno script scritto due volte)
+rule_cache = GeneratedRuleCache(SQL_DIR, context_version(CONTEXT, GEMINI_MODEL))
+script_index = ScriptIndex(SQL_DIR)
+invalid_index = ScriptIndex(INVALID_SQL_DIR)
+
+# Modalità di servizio: "flask" (server di sviluppo) oppure "asgi" (uvicorn, chiamate al modello
+# concorrenti con limite, richieste identiche in corso unificate e 429 oltre la coda)
+SERVER_MODE = os.getenv('SERVER_MODE', 'flask')
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '4'))
+GENERATION_QUEUE = int(os.getenv('GENERATION_QUEUE', '16'))
+GENERATION_QUEUE_TIMEOUT = float(os.getenv('GENERATION_QUEUE_TIMEOUT', '30'))
+
+# Metriche delle regole in esecuzione: METRICS_SOURCE "flink" (REST API su FLINK_URL) oppure "none"
+METRICS_SOURCE = os.getenv('METRICS_SOURCE', 'flink')
+FLINK_URL = os.getenv('FLINK_URL', 'http://jobmanager:8081')
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '15'))
+METRICS_RETENTION = int(os.getenv('METRICS_RETENTION', '5760'))
+METRICS_DSN = os.getenv('METRICS_DSN')
+# Ogni METRICS_PUBLISH_EVERY campioni l'ultimo di ogni regola va in Rule.metrics su OpenSearch
+METRICS_PUBLISH_EVERY = int(os.getenv('METRICS_PUBLISH_EVERY', '4'))
+
+metrics_collector = None
+if METRICS_SOURCE == 'flink':
+    metrics_collector = MetricsCollector(
+        FlinkRestMetricsSource(FLINK_URL),
+        interval=METRICS_INTERVAL,
+        retention=METRICS_RETENTION,
+        store=PostgresMetricsStore(METRICS_DSN) if METRICS_DSN else None,
+        publish_every=METRICS_PUBLISH_EVERY
+    )
+
+# Archivio delle regole su OpenSearch: alla connessione installa anche il template degli indici
+# calls-* (scritti da logstash-output o pipeline/opensearch_indexer.py) e riceve Rule.metrics dal
+# collector; RULE_STORE "opensearch" oppure "none"
+RULE_STORE = os.getenv('RULE_STORE', 'opensearch')
+rule_store = None
+
+def connect_rule_store():
+    """Connessione a OpenSearch, con i tentativi di OpenSearchService, fuori dal thread principale"""
+    global rule_store
+    try:
+        rule_store = OpenSearchService()
+    except Exception as e:
+        logger.warning(f"OpenSearch rule store unavailable, calls-* template not installed: {str(e)}")
+        return
+    if metrics_collector is not None:
+        metrics_collector.rule_service = rule_store
+
+def start_rule_store():
+    if RULE_STORE == 'opensearch':
+        threading.Thread(target=connect_rule_store, name="rule-store", daemon=True).start()
+
+def call_model(prompt):
+    """Chiamata (bloccante) a Gemini, ritorna il testo generato"""
+    return genai.GenerativeModel(GEMINI_MODEL).generate_content(prompt).text
+
+def validate_script(script):
+    """Validazione statica dello script (schema, stato non limitato, stima dello stato)"""
+    result = validate_sql(script)
+    if not result.is_valid:
+        logger.warning(f"Script SQL non valido: {'; '.join(result.issues)}")
+    return result
+
+def save_script(script, filename):
+    """Valida lo script e lo salva in SQL_DIR, oppure in INVALID_SQL_DIR se non è valido.
+
+    Ritorna (nome del file relativo a SQL_DIR, scritto ora, risultato della validazione).
+    """
+    result = validate_script(script)
+    filename = os.path.basename(filename)
+    if result.is_valid:
+        filename, written = script_index.save(script, filename)
+    else:
+        filename, written = invalid_index.save(script, filename)
+        filename = os.path.join(INVALID_DIRNAME, filename)
+    return filename, written, result
+
+def rule_response(filename, script, cached, result):
+    return {
+        "status": "Script SQL generato con successo",
+        "filename": filename,
+        "script": script,
+        "cached": cached,
+        "rule_status": validation_status(result).value,
+        "validation": result.model_dump(mode="json")
+    }
+
+def validate_request(payload):
+    """Valida {"script": ...} oppure {"filename": ...} in SQL_DIR; ritorna (risposta, codice HTTP)"""
+    script = payload.get("script")
+    filename = payload.get("filename")
+    if not script and filename:
+        filepath = os.path.join(SQL_DIR, os.path.basename(filename))
+        if not os.path.exists(filepath):
+            return {"error": f"File not found: {filename}"}, 404
+        with open(filepath) as f:
+            script = f.read()
+    if not script:
+        return {"error": "Missing 'script' or 'filename' parameter"}, 400
+    result = validate_script(script)
+    return {**result.model_dump(mode="json"), "rule_status": validation_status(result).value}, 200
+
+def cached_rule(user_request, rule_name):
+    """Risposta dalla cache per richiesta (normalizzata) e nome regola, oppure None"""
+    cached = rule_cache.get(user_request, rule_name)
+    if cached is None:
+        return None
+    # Validato di nuovo: il validatore può essere cambiato da quando lo script è in cache
+    filename, written, result = save_script(cached["script"], cached["filename"])
+    if written:
+        logger.info(f"Script SQL in cache ripristinato in: {os.path.join(SQL_DIR, filename)}")
+    logger.info(f"Regola {rule_name} servita dalla cache ({filename})")
+    return rule_response(filename, cached["script"], True, result)
+
+def generate_rule_script(user_request, rule_name):
+    """Genera lo script con Gemini, lo salva in SQL_DIR e in cache"""
+    # Aggiorna il contesto con il nome della regola
+    context_with_name = f"{CONTEXT}\n\nRichiesta: {user_request}\nNome Regola: {rule_name}"
+
+    # Chiamata a Gemini
+    response_text = call_model(context_with_name)
+
+    # Pulisci il codice generato e rimuovi eventuali delimitatori markdown
+    generated_code = response_text.strip().replace("```sql", "").replace("```", "")
+
+    # Genera un nome file basato sul timestamp
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    filename = f"rule_{timestamp}.sql"
+
+    # Salva lo script SQL nella directory sql-rules (sql-rules/invalid se non supera la
+    # validazione), a meno che uno identico esista già
+    filename, written, result = save_script(generated_code, filename)
+    filepath = os.path.join(SQL_DIR, filename)
+    rule_cache.put(user_request, rule_name, filename, generated_code)
+
+    if written:
+        logger.info(f"Script SQL salvato in: {filepath}")
+    else:
+        logger.info(f"Script SQL identico a {filepath}, nessun nuovo file")
+
+    return rule_response(filename, generated_code, False, result)
+
+def missing_parameter(user_request, rule_name):
+    if not user_request:
+        return "Missing 'rule' parameter"
+    if not rule_name:
+        return "Missing 'rule_name' parameter"
+    return None
+
+def rule_metrics_request(rule_name=None, since=None):
+    """Ultimo campione di ogni regola, oppure la serie di rule_name; ritorna (risposta, codice HTTP)"""
+    if metrics_collector is None:
+        return {"error": "Metrics collection is disabled (METRICS_SOURCE=none)"}, 503
+    if rule_name is None:
+        return {
+            "rules": {name: metrics_collector.summary(name) for name in metrics_collector.rule_names()},
+            "collector": metrics_collector.stats()
+        }, 200
+    try:
+        since = float(since) if since else None
+    except ValueError:
+        return {"error": "'since' must be epoch seconds"}, 400
+    points = metrics_collector.points(rule_name, since)
+    if points is None:
+        return {"error": f"No metrics for rule: {rule_name}"}, 404
+    return {"rule_name": rule_name, "interval_s": metrics_collector.interval, "points": points}, 200
+
+def cache_stats_payload():
+    return {
+        **rule_cache.stats(),
+        "sql_files": len(script_index),
+        "duplicate_files": [{"filename": f, "duplicate_of": o} for f, o in script_index.duplicates]
+    }
+
 @app.route("/generate_rule", methods=["POST"])
 def generate_rule():
     try:
@@ -171,36 +330,12 @@ def generate_rule():
         user_request = request.json.get("rule", "")
         rule_name = request.json.get("rule_name", "")
         
-        if not user_request:
-            return jsonify({"error": "Missing 'rule' parameter"}), 400
-        if not rule_name:
-            return jsonify({"error": "Missing 'rule_name' parameter"}), 400
+        error = missing_parameter(user_request, rule_name)
+        if error:
+            return jsonify({"error": error}), 400
             
-        # Aggiorna il contesto con il nome della regola
-        context_with_name = f"{CONTEXT}\n\nRichiesta: {user_request}\nNome Regola: {rule_name}"
-
-        # Chiamata a Gemini
-        response = genai.GenerativeModel('gemini-2.0-flash').generate_content(context_with_name)
-
-        # Pulisci il codice generato e rimuovi eventuali delimitatori markdown
-        generated_code = response.text.strip().replace("```sql", "").replace("```", "")
-
-        # Genera un nome file basato sul timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"rule_{timestamp}.sql"
-
-        # Salva lo script SQL nella directory sql-rules
-        filepath = os.path.join(SQL_DIR, filename)
-        with open(filepath, "w") as f:
-            f.write(generated_code)
-        
-        logger.info(f"Script SQL salvato in: {filepath}")
-
-        return jsonify({
-            "status": "Script SQL generato con successo",
-            "filename": filename,
-            "script": generated_code
-        })
+        # Stessa richiesta (normalizzata) e stesso nome regola: risponde dalla cache senza chiamare Gemini
+        return jsonify(cached_rule(user_request, rule_name) or generate_rule_script(user_request, rule_name))
 
     except Exception as e:
         logger.error(f"Error generating SQL rule: {str(e)}", exc_info=True)
@@ -210,5 +345,110 @@ def generate_rule():
             "request": user_request
         }), 500
 
+@app.route("/validate_rule", methods=["POST"])
+def validate_rule():
+    body, status = validate_request(request.json or {})
+    return jsonify(body), status
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(cache_stats_payload())
+
+@app.route("/rule_metrics", methods=["GET"])
+def rule_metrics():
+    body, status = rule_metrics_request()
+    return jsonify(body), status
+
+@app.route("/rule_metrics/<rule_name>", methods=["GET"])
+def rule_metrics_series(rule_name):
+    body, status = rule_metrics_request(rule_name, request.args.get("since"))
+    return jsonify(body), status
+
+def create_asgi_app():
+    """Stessi endpoint come app Starlette, con le generazioni eseguite tramite SingleFlight"""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from single_flight import Overloaded, SingleFlight
+
+    gate = SingleFlight(GENERATION_CONCURRENCY, GENERATION_QUEUE, GENERATION_QUEUE_TIMEOUT)
+
+    async def generate_rule_async(request):
+        user_request = ""
+        try:
+            payload = await request.json()
+            user_request = payload.get("rule", "")
+            rule_name = payload.get("rule_name", "")
+
+            error = missing_parameter(user_request, rule_name)
+            if error:
+                return JSONResponse({"error": error}, status_code=400)
+
+            # Lettura della cache, scrittura dello script e validazione fuori dall'event loop
+            result = await asyncio.to_thread(cached_rule, user_request, rule_name)
+            if result is None:
+                # Richieste identiche già in corso attendono la stessa chiamata al modello
+                result, coalesced = await gate.run(rule_cache.key(user_request, rule_name),
+                                                   generate_rule_script, user_request, rule_name)
+                if coalesced:
+                    result = {**result, "coalesced": True}
+            return JSONResponse(result)
+
+        except Overloaded as e:
+            logger.warning(f"Rule generation rejected: {str(e)}")
+            return JSONResponse({
+                "error": "Too many rule generations in progress, retry later",
+                "details": str(e)
+            }, status_code=429, headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            logger.error(f"Error generating SQL rule: {str(e)}", exc_info=True)
+            return JSONResponse({
+                "error": "Failed to generate SQL rule",
+                "details": str(e),
+                "request": user_request
+            }, status_code=500)
+
+    async def validate_rule_async(request):
+        body, status = await asyncio.to_thread(validate_request, await request.json())
+        return JSONResponse(body, status_code=status)
+
+    async def cache_stats_async(request):
+        return JSONResponse({**cache_stats_payload(), "generation": gate.stats()})
+
+    async def rule_metrics_async(request):
+        body, status = rule_metrics_request(request.path_params.get("rule_name"), request.query_params.get("since"))
+        return JSONResponse(body, status_code=status)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        start_rule_store()
+        if metrics_collector is not None:
+            metrics_collector.start()
+        yield
+        gate.shutdown()
+        if metrics_collector is not None:
+            metrics_collector.stop()
+
+    return Starlette(
+        routes=[
+            Route("/generate_rule", generate_rule_async, methods=["POST"]),
+            Route("/validate_rule", validate_rule_async, methods=["POST"]),
+            Route("/cache_stats", cache_stats_async, methods=["GET"]),
+            Route("/rule_metrics", rule_metrics_async, methods=["GET"]),
+            Route("/rule_metrics/{rule_name}", rule_metrics_async, methods=["GET"])
+        ],
+        lifespan=lifespan
+    )
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
+    if SERVER_MODE == 'asgi':
+        import uvicorn
+        logger.info(f"Serving ASGI: {GENERATION_CONCURRENCY} concurrent generations, queue {GENERATION_QUEUE}")
+        uvicorn.run(create_asgi_app(), host="0.0.0.0", port=5001)
+    else:
+        start_rule_store()
+        if metrics_collector is not None:
+            metrics_collector.start()
+        app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
 from enum import Enum
 
@@ -95,11 +95,48 @@ class Rule(BaseModel):
         }
         use_enum_values = True
 
+class RuleSummary(BaseModel):
+    """Rule without the natural language and generated code, for list views"""
+    rule_id: str = Field(..., description="Unique identifier for the rule")
+    name: str = Field(..., description="Display name of the rule")
+    status: RuleStatus = Field(..., description="Current status of the rule")
+    created_at: datetime = Field(..., description="Timestamp when the rule was created")
+    updated_at: Optional[datetime] = Field(None, description="Timestamp of last update")
+    deployed_at: Optional[datetime] = Field(None, description="Timestamp of last deployment")
+    version: int = Field(..., description="Version number of the rule")
+    is_active: bool = Field(..., description="Whether the rule is currently active")
+    tags: List[str] = Field(
+        default_factory=list,
+        description="Optional tags for categorizing rules"
+    )
+
+    class Config:
+        json_encoders = {
+            datetime: lambda v: v.isoformat()
+        }
+        use_enum_values = True
+
+class RulePage(BaseModel):
+    """One page of a cursor-based rule listing"""
+    rules: List[Union[Rule, RuleSummary]] = Field(default_factory=list, description="Rules in this page")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Opaque cursor for the next page, None on the last page"
+    )
+
 class ValidationResult(BaseModel):
     """Model for code validation results"""
     is_valid: bool = Field(..., description="Whether the code passed validation")
     issues: List[str] = Field(default_factory=list, description="List of validation issues")
     suggestions: List[str] = Field(default_factory=list, description="Improvement suggestions")
+    state_estimates: List[dict] = Field(
+        default_factory=list,
+        description="Estimated keyed state of each stateful query in the script"
+    )
+    estimated_state_bytes: Optional[int] = Field(
+        None,
+        description="Estimated total state of the script, None if it has no stateful query"
+    )
     validated_at: datetime = Field(default_factory=datetime.now, description="When validation was performed")
 
 class RuleDeployment(BaseModel):
@@ -0,0 +1,403 @@
+"""Merge the active SQL rules into one Flink job reading calls_stream once.
+
+Every script in sql-rules/ declares its own calls_stream source, so N
+deployed rules read and decode call-data-raw N times in one consumer group.
+The bundle has:
+- one canonical calls_stream with its own consumer group;
+- a calls_shared view projecting only the columns the rules use, filtered by
+  the OR of the rule filters when every rule has one;
+- one window_agg_<n> view per (window, GROUP BY keys) shared by two or more
+  rules, computing each distinct aggregate once (FILTER (WHERE ...) keeps
+  per-rule filters); those rules become a filter over the view;
+- every INSERT in one EXECUTE STATEMENT SET, so the planner builds a single
+  job and reuses the common sub-plans.
+
+Rules whose query has another shape are included unchanged apart from
+reading calls_shared. Scripts that fail sql_validator are left out.
+
+Usage:
+    python app/rule_bundler.py sql-rules/*.sql -o sql-rules/bundle/active-rules.sql
+"""
+
+import os
+import re
+import sys
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+from flink_ddl import CALLS_STREAM_DDL, CALL_ALERTS_DDL
+from sql_validator import (AGGREGATES, CANONICAL_TABLES, WINDOW_FUNCTIONS, _IDENT, _INTERVAL, _balanced,
+                           _split_top_level, parse_create_table, split_statements, unquote, validate_sql)
+
+BUNDLE_GROUP_ID = "flink-rule-bundle"
+BUNDLE_JOB_NAME = "rule-bundle"
+SHARED_VIEW = "calls_shared"
+SOURCE_COLUMNS = list(CANONICAL_TABLES["calls_stream"]["columns"])
+WATERMARK_COLUMN = CANONICAL_TABLES["calls_stream"]["watermark"][0]
+WINDOW_COLUMNS = ("window_start", "window_end", "window_time")
+
+_LEGACY_BOUNDS = {"START": "window_start", "END": "window_end", "ROWTIME": "window_time"}
+
+def _depths(text: str) -> List[int]:
+    """Parenthesis depth of every character, -1 inside quotes"""
+    depths, depth, quote = [], 0, None
+    for ch in text:
+        if quote:
+            depths.append(-1)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", "`"):
+            quote = ch
+            depths.append(-1)
+            continue
+        if ch == ")":
+            depth -= 1
+        depths.append(depth)
+        if ch == "(":
+            depth += 1
+    return depths
+
+def _top_level(text: str, pattern: str) -> List[re.Match]:
+    depths = _depths(text)
+    return [m for m in re.finditer(pattern, text, re.IGNORECASE) if depths[m.start()] == 0]
+
+def _replace_identifier(text: str, old: str, new: str) -> str:
+    """Replace a table identifier outside string literals"""
+    parts = re.split(r"('(?:[^']|'')*')", text)
+    pattern = rf"(?<![\w`.])`?{re.escape(old)}`?(?![\w`])"
+    return "".join(part if i % 2 else re.sub(pattern, new, part) for i, part in enumerate(parts))
+
+def _normalize(text: str) -> str:
+    parts = re.split(r"('(?:[^']|'')*')", text)
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part).strip().upper() for i, part in enumerate(parts))
+
+def used_columns(statement: str) -> Optional[List[str]]:
+    """calls_stream columns referenced by a statement, None if it selects *"""
+    if re.search(r"SELECT\s+(?:DISTINCT\s+)?\*", statement, re.IGNORECASE):
+        return None
+    text = re.sub(r"'(?:[^']|'')*'", "''", statement)
+    tokens = {unquote(token) for token in re.findall(r"`[^`]+`|\w+", text)}
+    return [column for column in SOURCE_COLUMNS if column in tokens]
+
+def parse_aggregate_query(statement: str) -> Optional[Dict[str, Any]]:
+    """INSERT INTO t SELECT ... FROM <calls_stream window> [WHERE] GROUP BY ... [HAVING], or None.
+
+    Legacy GROUP BY TUMBLE(col, ...)/HOP(col, ...) windows are rewritten as
+    window table-valued functions over calls_shared.
+    """
+    insert = re.match(rf"INSERT\s+INTO\s+({_IDENT})\s+(SELECT\b.*)", statement, re.IGNORECASE | re.DOTALL)
+    if not insert:
+        return None
+    query = insert.group(2)
+    if _top_level(query, r"\b(JOIN|UNION|ORDER\s+BY|LIMIT|OVER|SELECT\s+DISTINCT)\b"):
+        return None
+    clauses = {}
+    for name, pattern in (("from", r"\bFROM\b"), ("where", r"\bWHERE\b"), ("group", r"\bGROUP\s+BY\b"),
+                          ("having", r"\bHAVING\b")):
+        found = _top_level(query, pattern)
+        if len(found) > 1:
+            return None
+        if found:
+            clauses[name] = found[0]
+    if "from" not in clauses or "group" not in clauses:
+        return None
+    order = sorted(clauses.items(), key=lambda item: item[1].start())
+    if [name for name, _ in order] != [n for n in ("from", "where", "group", "having") if n in clauses]:
+        return None
+    parts = {"select": query[len("SELECT"):clauses["from"].start()]}
+    for i, (name, match) in enumerate(order):
+        end = order[i + 1][1].start() if i + 1 < len(order) else len(query)
+        parts[name] = query[match.end():end].strip()
+
+    group = [item.strip() for item in _split_top_level(parts["group"], ",") if item.strip()]
+    source = parts["from"]
+    tvf = re.fullmatch(rf"TABLE\s*\(\s*({'|'.join(WINDOW_FUNCTIONS)})\s*\(\s*TABLE\s+`?calls_stream`?\s*,\s*"
+                       rf"DESCRIPTOR\s*\(\s*({_IDENT})\s*\)((?:\s*,\s*{_INTERVAL})+)\s*\)\s*\)(?:\s+(?:AS\s+)?\w+)?",
+                       source, re.IGNORECASE | re.DOTALL)
+    if tvf:
+        function, column, intervals = tvf.group(1).upper(), unquote(tvf.group(2)), tvf.group(3)
+        keys = [item for item in group if unquote(item).lower() not in WINDOW_COLUMNS]
+        select = parts["select"]
+    elif re.fullmatch(r"`?calls_stream`?", source, re.IGNORECASE):
+        legacy = [item for item in group if re.match(r"(TUMBLE|HOP)\s*\(", item, re.IGNORECASE)]
+        if len(legacy) != 1:
+            return None
+        window = re.fullmatch(rf"(TUMBLE|HOP)\s*\(\s*({_IDENT})((?:\s*,\s*{_INTERVAL})+)\s*\)", legacy[0],
+                              re.IGNORECASE | re.DOTALL)
+        if not window:
+            return None
+        function, column, intervals = window.group(1).upper(), unquote(window.group(2)), window.group(3)
+        keys = [item for item in group if item is not legacy[0]]
+        select = re.sub(rf"\b{function}_(START|END|ROWTIME)\s*\([^()]*\)",
+                        lambda m: _LEGACY_BOUNDS[m.group(1).upper()], parts["select"], flags=re.IGNORECASE)
+        if re.search(r"\b(TUMBLE|HOP)_\w+\s*\(", select, re.IGNORECASE):
+            return None
+    else:
+        return None
+    if any(not re.fullmatch(_IDENT, key) for key in keys):
+        return None
+    interval_list = ", ".join(i.strip() for i in intervals.split(",") if i.strip())
+    return {
+        "target": unquote(insert.group(1)),
+        "select": select.strip(),
+        "where": parts.get("where"),
+        "having": parts.get("having"),
+        "keys": [unquote(key) for key in keys],
+        "window": f"{function}(TABLE {SHARED_VIEW}, DESCRIPTOR(`{column}`), {interval_list})"
+    }
+
+def _aggregate_calls(text: str) -> List[Tuple[int, int]]:
+    """(start, end) of the outermost aggregate calls in text"""
+    calls = []
+    for match in re.finditer(rf"\b({'|'.join(AGGREGATES)})\s*\(", text, re.IGNORECASE):
+        if calls and match.start() < calls[-1][1]:
+            continue
+        end = match.end() + len(_balanced(text, match.end() - 1)) + 1
+        calls.append((match.start(), end))
+    return calls
+
+class _AggregateView:
+    """One shared window aggregation: keys, window and the aliased aggregates of its rules"""
+
+    def __init__(self, name: str, window: str, keys: List[str]):
+        self.name = name
+        self.window = window
+        self.keys = keys
+        self.aggregates: Dict[Tuple[str, Optional[str]], str] = {}
+        self.presence: Dict[str, str] = {}
+        self.expressions: List[Tuple[str, str]] = []
+        self.window_time = False
+
+    def alias(self, call: str, where: Optional[str]) -> str:
+        key = (_normalize(call), _normalize(where) if where else None)
+        if key not in self.aggregates:
+            alias = f"agg_{len(self.aggregates)}"
+            self.aggregates[key] = alias
+            self.expressions.append((f"{call} FILTER (WHERE {where})" if where else call, alias))
+        return self.aggregates[key]
+
+    def presence_alias(self, where: str) -> str:
+        key = _normalize(where)
+        if key not in self.presence:
+            alias = f"rows_{len(self.presence)}"
+            self.presence[key] = alias
+            self.expressions.append((f"COUNT(*) FILTER (WHERE {where})", alias))
+        return self.presence[key]
+
+    def rewrite(self, text: str, where: Optional[str]) -> str:
+        out, last = [], 0
+        for start, end in _aggregate_calls(text):
+            out.append(text[last:start])
+            out.append(self.alias(text[start:end], where))
+            last = end
+        out.append(text[last:])
+        return "".join(out)
+
+    def ddl(self) -> str:
+        columns = [f"`{key}`" for key in self.keys] + ["window_start", "window_end"]
+        if self.window_time:
+            columns.append("window_time")
+        columns += [f"{expression} AS {alias}" for expression, alias in self.expressions]
+        keys = ", ".join([f"`{key}`" for key in self.keys] + ["window_start", "window_end"])
+        select = ",\n    ".join(columns)
+        return (f"CREATE TEMPORARY VIEW {self.name} AS\nSELECT\n    {select}\n"
+                f"FROM TABLE({self.window})\nGROUP BY {keys}")
+
+def _references_raw_columns(text: str, keys: List[str]) -> bool:
+    remaining = used_columns(re.sub(r"\bAS\s+(`[^`]+`|\w+)", "", text, flags=re.IGNORECASE))
+    return remaining is None or any(column not in keys for column in remaining)
+
+def bundle_scripts(scripts: List[Tuple[str, str]], include_invalid: bool = False) -> Dict[str, Any]:
+    """Bundle (name, sql) scripts; returns {sql, included, skipped, shared_views, merged_rules, warnings}"""
+    skipped: List[Dict[str, Any]] = []
+    warnings: List[str] = []
+    rules = []
+    for name, sql in scripts:
+        result = validate_sql(sql)
+        if not result.is_valid and not include_invalid:
+            skipped.append({"name": name, "reason": "; ".join(result.issues)})
+            continue
+        statements = split_statements(sql)
+        inserts = [s for s in statements if re.match(r"INSERT\s+INTO\b", s, re.IGNORECASE)]
+        if not inserts:
+            skipped.append({"name": name, "reason": "no INSERT INTO"})
+            continue
+        rules.append((name, statements, inserts))
+
+    # Sink tables and views, renamed when two rules declare the same name differently
+    declared: Dict[str, str] = {"call_alerts": _normalize(CALL_ALERTS_DDL)}
+    ddl: List[str] = []
+    # Rule statements reading calls_stream: the shared projection must cover their columns too
+    readers: List[str] = []
+    # The planner reuses the shared source and views only with these on (the defaults, but a rule may SET
+    # them); the job name is what rule_metrics reports the job's metrics under
+    settings: Dict[str, str] = {"table.optimizer.reuse-sub-plan-enabled": "true",
+                                "table.optimizer.reuse-source-enabled": "true",
+                                "pipeline.name": BUNDLE_JOB_NAME}
+    queries: List[Tuple[str, str]] = []
+    for name, statements, inserts in rules:
+        renames: Dict[str, str] = {}
+        for statement in statements:
+            upper = statement.upper()
+            if upper.startswith("SET"):
+                setting = re.match(r"SET\s+'([^']+)'\s*=\s*'([^']*)'", statement, re.IGNORECASE)
+                if setting:
+                    key, value = setting.groups()
+                    if key in settings and settings[key] != value:
+                        warnings.append(f"{name}: SET '{key}' = '{value}' ignored, bundle uses '{settings[key]}'")
+                    settings.setdefault(key, value)
+                continue
+            table = parse_create_table(statement) if re.match(r"CREATE\s+(TEMPORARY\s+)?TABLE", upper) else None
+            view = re.match(rf"CREATE\s+(?:TEMPORARY\s+)?VIEW\s+(?:IF\s+NOT\s+EXISTS\s+)?({_IDENT})", statement,
+                            re.IGNORECASE)
+            object_name = table["name"] if table else unquote(view.group(1)) if view else None
+            if object_name is None or object_name == "calls_stream":
+                continue
+            text = statement
+            for old, new in renames.items():
+                text = _replace_identifier(text, old, new)
+            normalized = _normalize(re.sub(rf"^(CREATE\s+(?:TEMPORARY\s+)?(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?)"
+                                           rf"{_IDENT}", r"\1", text, flags=re.IGNORECASE))
+            if object_name in declared:
+                if declared[object_name] == normalized or object_name == "call_alerts":
+                    continue
+                new_name = object_name
+                suffix = 2
+                while new_name in declared:
+                    new_name = f"{object_name}_{suffix}"
+                    suffix += 1
+                renames[object_name] = new_name
+                text = _replace_identifier(text, object_name, new_name)
+                warnings.append(f"{name}: {object_name} declared differently by another rule, renamed {new_name}")
+                object_name = new_name
+            declared[object_name] = normalized
+            shared = _replace_identifier(text, "calls_stream", SHARED_VIEW)
+            if shared != text:
+                readers.append(text)
+            ddl.append(shared)
+        for insert in inserts:
+            for old, new in renames.items():
+                insert = _replace_identifier(insert, old, new)
+            queries.append((name, insert))
+
+    # Shared projection and pre-filter
+    columns = {WATERMARK_COLUMN}
+    select_all = False
+    for statement in readers + [insert for _, insert in queries]:
+        used = used_columns(statement)
+        if used is None:
+            select_all = True
+        else:
+            columns.update(used)
+    filters: List[Optional[str]] = []
+    parsed = []
+    for name, insert in queries:
+        query = parse_aggregate_query(insert)
+        parsed.append(query)
+        filters.append(query["where"] if query else None)
+    projection = "*" if select_all else ", ".join(f"`{c}`" for c in SOURCE_COLUMNS if c in columns)
+    shared_filter = None
+    if filters and all(filters):
+        shared_filter = " OR ".join(f"({f})" for f in dict.fromkeys(filters))
+    shared_view = f"CREATE TEMPORARY VIEW {SHARED_VIEW} AS\nSELECT {projection}\nFROM calls_stream"
+    if shared_filter:
+        shared_view += f"\nWHERE {shared_filter}"
+
+    # Window aggregations shared by rules with the same window and keys
+    groups: Dict[Tuple[str, Tuple[str, ...]], List[int]] = {}
+    for i, query in enumerate(parsed):
+        if query is not None:
+            groups.setdefault((_normalize(query["window"]), tuple(sorted(query["keys"]))), []).append(i)
+    views: List[_AggregateView] = []
+    statements_out: List[str] = [None] * len(queries)
+    merged = 0
+    for (_, keys), members in groups.items():
+        if len(members) < 2:
+            continue
+        view = _AggregateView(f"window_agg_{len(views) + 1}", parsed[members[0]]["window"], list(keys))
+        rewritten = {}
+        for i in members:
+            query = parsed[i]
+            select = view.rewrite(query["select"], query["where"])
+            having = view.rewrite(query["having"], query["where"]) if query["having"] else None
+            if _references_raw_columns(select + " " + (having or ""), list(keys)):
+                continue
+            conditions = []
+            if query["where"]:
+                conditions.append(f"{view.presence_alias(query['where'])} > 0")
+            if having:
+                conditions.append(f"({having})")
+            view.window_time |= bool(re.search(r"\bwindow_time\b", select, re.IGNORECASE))
+            statement = f"INSERT INTO {query['target']}\nSELECT\n    {select}\nFROM {view.name}"
+            if conditions:
+                statement += f"\nWHERE {' AND '.join(conditions)}"
+            rewritten[i] = statement
+        if len(rewritten) < 2:
+            continue
+        # Drop expressions registered by rules that could not be merged
+        for i, statement in rewritten.items():
+            statements_out[i] = statement
+        view.expressions = [(e, a) for e, a in view.expressions
+                            if any(re.search(rf"\b{a}\b", s) for s in rewritten.values())]
+        views.append(view)
+        merged += len(rewritten)
+
+    for i, (_, insert) in enumerate(queries):
+        if statements_out[i] is None:
+            statements_out[i] = _replace_identifier(insert, "calls_stream", SHARED_VIEW)
+
+    source = CALLS_STREAM_DDL.rstrip(";").replace("'properties.group.id' = 'flink-rule-group'",
+                                                 f"'properties.group.id' = '{BUNDLE_GROUP_ID}'")
+    names = ", ".join(name for name, _, _ in rules)
+    parts = [f"-- Bundle of {len(rules)} rules: {names}"]
+    parts += [f"SET '{key}' = '{value}';" for key, value in settings.items()]
+    parts.append(source + ";")
+    parts.append(CALL_ALERTS_DDL)
+    # Before the rule DDL: sql-client runs statements in order and rule views read calls_shared
+    parts.append(shared_view + ";")
+    parts += [statement + ";" for statement in ddl]
+    parts += [view.ddl() + ";" for view in views]
+    parts.append("EXECUTE STATEMENT SET\nBEGIN\n\n" + "\n\n".join(s + ";" for s in statements_out) + "\n\nEND;")
+
+    return {
+        "sql": "\n\n".join(parts) + "\n",
+        "included": [name for name, _, _ in rules],
+        "skipped": skipped,
+        "inserts": len(queries),
+        "shared_views": [view.name for view in views],
+        "merged_rules": merged,
+        "warnings": warnings
+    }
+
+def bundle_files(paths: List[str], include_invalid: bool = False) -> Dict[str, Any]:
+    scripts = []
+    for path in paths:
+        with open(path) as f:
+            scripts.append((os.path.basename(path), f.read()))
+    return bundle_scripts(scripts, include_invalid)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="SQL rule scripts to bundle")
+    parser.add_argument("-o", "--output", help="write the bundle here instead of stdout")
+    parser.add_argument("--include-invalid", action="store_true", help="bundle scripts that fail validation too")
+    args = parser.parse_args(argv)
+
+    bundle = bundle_files(args.paths, args.include_invalid)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(bundle["sql"])
+    else:
+        sys.stdout.write(bundle["sql"])
+    report = sys.stderr if not args.output else sys.stdout
+    print(f"Bundled {len(bundle['included'])} rules ({bundle['inserts']} INSERTs, {bundle['merged_rules']} "
+          f"on {len(bundle['shared_views'])} shared window aggregations)", file=report)
+    for skipped in bundle["skipped"]:
+        print(f"  skipped {skipped['name']}: {skipped['reason']}", file=report)
+    for warning in bundle["warnings"]:
+        print(f"  warning: {warning}", file=report)
+    return 0 if bundle["included"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
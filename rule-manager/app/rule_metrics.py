@@ -0,0 +1,456 @@
+"""Per-rule runtime metrics for Rule.metrics, RuleDeployment.metrics and Grafana.
+
+A MetricsCollector samples one source every `interval` seconds:
+- EngineMetricsSource: the rules of an embedded StreamingRuleEngine;
+- FlinkRestMetricsSource: the running jobs of a Flink REST API (the
+  jobmanager, or flink_rest_standin.py locally), one job per rule, named
+  after the rule (SET 'pipeline.name');
+and, with a Postgres DSN, the alerts inserted into call_alerts in the same
+interval: alerts/s and end-to-end latency (event_time -> processing_time)
+per rule_name, which also covers rules running inside a bundled job.
+
+Counters become rates between two samples. Each rule keeps its last
+`retention` samples in a RuleSeries (one float array per metric) and, with
+a DSN, every sample is also written to the rule_metrics table. With a
+rule_service, every `publish_every` samples the latest one of each rule is
+written into Rule.metrics of the stored rule.
+
+Metrics per sample: events_per_s, alerts_per_s, state_bytes,
+watermark_lag_ms (sampling time - watermark), latency_p50_ms, latency_p99_ms.
+"""
+
+import math
+import json
+import asyncio
+import time
+import logging
+import threading
+import urllib.request
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from models import Rule, RuleDeployment
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = ("events_per_s", "alerts_per_s", "state_bytes", "watermark_lag_ms", "latency_p50_ms",
+                 "latency_p99_ms")
+
+DEFAULT_INTERVAL = 15.0
+DEFAULT_RETENTION = 5760  # 24h at the default interval
+DEFAULT_PUBLISH_EVERY = 4  # samples, 1 minute at the default interval
+
+# Watermark reported by Flink before the first one (Long.MIN_VALUE)
+NO_WATERMARK = -2 ** 63
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return float(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))])
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(timespec="seconds")
+
+class RuleSeries:
+    """Ring buffer with the last `capacity` samples of one rule.
+
+    One array of doubles per metric plus one for the sample time, NaN for
+    a metric not available in a sample: 8 bytes per value instead of a
+    dict per sample.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._ts = array("d", [math.nan]) * capacity
+        self._values = {field: array("d", [math.nan]) * capacity for field in METRIC_FIELDS}
+        self._next = 0
+        self._size = 0
+
+    def append(self, ts: float, point: Dict[str, Optional[float]]):
+        i = self._next
+        self._ts[i] = ts
+        for field, values in self._values.items():
+            value = point.get(field)
+            values[i] = math.nan if value is None else value
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _point(self, i: int) -> Dict[str, Any]:
+        point = {"ts": _iso(self._ts[i])}
+        for field, values in self._values.items():
+            value = values[i]
+            point[field] = None if math.isnan(value) else int(value) if field == "state_bytes" else value
+        return point
+
+    def points(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Samples in time order, only those after `since` (epoch seconds) if given"""
+        start = (self._next - self._size) % self.capacity
+        indexes = [(start + k) % self.capacity for k in range(self._size)]
+        return [self._point(i) for i in indexes if since is None or self._ts[i] > since]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self._point((self._next - 1) % self.capacity) if self._size else None
+
+    @property
+    def nbytes(self) -> int:
+        return self._ts.itemsize * self.capacity * (len(self._values) + 1)
+
+class EngineMetricsSource:
+    """Counters of the rules of an embedded StreamingRuleEngine.
+
+    The engine is not thread-safe: when it is driven by another thread, pass
+    the lock that thread holds around process_batch()/flush().
+    """
+
+    def __init__(self, engine, lock: Optional[threading.Lock] = None):
+        self.engine = engine
+        self.lock = lock
+
+    def sample(self) -> Dict[str, Dict[str, Any]]:
+        if self.lock is None:
+            return self._sample()
+        with self.lock:
+            return self._sample()
+
+    def _sample(self) -> Dict[str, Dict[str, Any]]:
+        samples = {}
+        for name, stats in self.engine.rule_stats().items():
+            samples[name] = {
+                "events": stats["events"],
+                "alerts": stats["alerts"],
+                "state_bytes": stats["state_bytes"],
+                "watermark_ms": stats["watermark"]
+            }
+        for rule in self.engine.rules:
+            latencies = rule.latencies_ms
+            samples[rule.name]["latencies_ms"] = [latencies.popleft() for _ in range(len(latencies))]
+        return samples
+
+class FlinkRestMetricsSource:
+    """Running jobs of the Flink REST API, one per rule.
+
+    events: records leaving the source vertex; alerts: records sent by the
+    sink writer (numRecordsSend), when the job exposes it; watermark: lowest
+    input watermark of the last vertex; state: size of the latest completed
+    checkpoint. Jobs with the same name are told apart by a job id prefix.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _get(self, path: str) -> Any:
+        with urllib.request.urlopen(f"{self.base_url}{path}", timeout=self.timeout) as response:
+            return json.load(response)
+
+    def sample(self) -> Dict[str, Dict[str, Any]]:
+        jobs = [job for job in self._get("/jobs/overview")["jobs"] if job["state"] == "RUNNING"]
+        names = Counter(job["name"] for job in jobs)
+        samples = {}
+        for job in jobs:
+            name = job["name"] if names[job["name"]] == 1 else f"{job['name']}#{job['jid'][:8]}"
+            try:
+                samples[name] = self._job(job["jid"])
+            except Exception as e:
+                logger.warning(f"Could not read metrics of Flink job {job['jid']} ({name}): {str(e)}")
+        return samples
+
+    def _job(self, jid: str) -> Dict[str, Any]:
+        vertices = self._get(f"/jobs/{jid}")["vertices"]
+        source, sink = vertices[0], vertices[-1]
+
+        sent = self._get(f"/jobs/{jid}/vertices/{sink['id']}/subtasks/metrics")
+        sent_ids = [m["id"] for m in sent if m["id"].endswith("numRecordsSend")]
+        alerts = None
+        if sent_ids:
+            totals = self._get(f"/jobs/{jid}/vertices/{sink['id']}/subtasks/metrics"
+                               f"?get={','.join(sent_ids)}&agg=sum")
+            alerts = sum(m["sum"] for m in totals)
+
+        watermarks = self._get(f"/jobs/{jid}/vertices/{sink['id']}/watermarks")
+        inputs = [int(float(w["value"])) for w in watermarks if w["id"].endswith("currentInputWatermark")]
+        watermark = min(inputs) if inputs and min(inputs) > NO_WATERMARK else None
+
+        latest = self._get(f"/jobs/{jid}/checkpoints").get("latest") or {}
+        completed = latest.get("completed") or {}
+        return {
+            "job_id": jid,
+            "events": source["metrics"].get("write-records"),
+            "alerts": alerts,
+            "state_bytes": completed.get("state_size"),
+            "watermark_ms": watermark
+        }
+
+ALERT_LATENCY_SQL = """
+SELECT rule_name,
+       COUNT(*),
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms),
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms)
+FROM (
+    SELECT rule_name, EXTRACT(EPOCH FROM processing_time - event_time) * 1000 AS latency_ms
+    FROM call_alerts
+    WHERE processing_time > to_timestamp(%s) AND processing_time <= to_timestamp(%s)
+) alerts
+GROUP BY rule_name
+"""
+
+INSERT_METRICS_SQL = f"""
+INSERT INTO rule_metrics (ts, rule_name, job_id, {", ".join(METRIC_FIELDS)})
+VALUES %s
+ON CONFLICT (rule_name, ts) DO NOTHING
+"""
+
+class PostgresMetricsStore:
+    """rule_metrics writer and call_alerts latency reader on one connection (psycopg2)"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+
+    def _connection(self):
+        import psycopg2
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.dsn)
+            self._conn.autocommit = True
+        return self._conn
+
+    def _run(self, fn):
+        try:
+            with self._connection().cursor() as cur:
+                return fn(cur)
+        except Exception:
+            # Reconnect on the next call
+            if self._conn is not None:
+                self._conn.close()
+            raise
+
+    def alert_latencies(self, since: float, until: float) -> Dict[str, Dict[str, Any]]:
+        """Alerts inserted in (since, until] per rule: count and latency percentiles"""
+        def query(cur):
+            cur.execute(ALERT_LATENCY_SQL, (since, until))
+            return {rule_name: {"alerts": count, "latency_p50_ms": p50, "latency_p99_ms": p99}
+                    for rule_name, count, p50, p99 in cur.fetchall()}
+        return self._run(query)
+
+    def insert(self, ts: float, points: Dict[str, Dict[str, Any]], job_ids: Dict[str, str]):
+        from psycopg2.extras import execute_values
+        sampled_at = datetime.fromtimestamp(ts, tz=timezone.utc)
+        rows = [(sampled_at, name, job_ids.get(name), *(point[f] for f in METRIC_FIELDS))
+                for name, point in points.items()]
+        if rows:
+            self._run(lambda cur: execute_values(cur, INSERT_METRICS_SQL, rows))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+class MetricsCollector:
+    """Samples a source periodically and keeps a RuleSeries per rule"""
+
+    def __init__(self, source, interval: float = DEFAULT_INTERVAL, retention: int = DEFAULT_RETENTION,
+                 store: Optional[PostgresMetricsStore] = None, clock=time.time, rule_service=None,
+                 publish_every: int = DEFAULT_PUBLISH_EVERY):
+        self.source = source
+        self.interval = interval
+        self.retention = retention
+        self.store = store
+        # OpenSearchService (sync client: publish runs in the sampling thread), may be set later
+        self.rule_service = rule_service
+        self.publish_every = publish_every
+        self.clock = clock
+        self.series: Dict[str, RuleSeries] = {}
+        self.job_ids: Dict[str, str] = {}
+        self.samples = 0
+        self.errors = 0
+        self.store_errors = 0
+        self.published = 0
+        self.publish_errors = 0
+        self._published_samples = 0
+        self._previous: Dict[str, tuple] = {}  # rule -> (sampled at, events, alerts)
+        self._last_sample: Optional[float] = None
+        # End of the last window read from call_alerts: after a failed read the next one covers the gap
+        self._store_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _rate(value: Optional[float], previous: Optional[float], elapsed: float) -> Optional[float]:
+        if value is None or previous is None or elapsed <= 0:
+            return None
+        # A counter that went back means the job restarted in the interval
+        return (value - previous if value >= previous else value) / elapsed
+
+    def sample_once(self) -> Dict[str, Dict[str, Any]]:
+        """Take one sample of every rule; returns {rule_name: point}"""
+        now = self.clock()
+        raw = self.source.sample()
+        since = self._store_since if self._store_since is not None else now - self.interval
+        inserted = {}
+        if self.store:
+            # Postgres being down must not lose the samples of the REST source
+            try:
+                inserted = self.store.alert_latencies(since, now)
+                self._store_since = now
+            except Exception as e:
+                self.store_errors += 1
+                logger.warning(f"Could not read alert latencies from Postgres: {str(e)}")
+
+        points = {}
+        for name in list(raw) + [name for name in inserted if name not in raw]:
+            values = raw.get(name, {})
+            sampled_at, events, alerts = self._previous.get(name, (None, None, None))
+            elapsed = now - sampled_at if sampled_at is not None else 0
+            latencies = values.get("latencies_ms") or []
+            watermark = values.get("watermark_ms")
+            point = {
+                "events_per_s": self._rate(values.get("events"), events, elapsed),
+                "alerts_per_s": self._rate(values.get("alerts"), alerts, elapsed),
+                "state_bytes": values.get("state_bytes"),
+                "watermark_lag_ms": now * 1000 - watermark if watermark is not None else None,
+                "latency_p50_ms": percentile(latencies, 0.5),
+                "latency_p99_ms": percentile(latencies, 0.99)
+            }
+            # Alerts that reached call_alerts are the end-to-end numbers, when available
+            if name in inserted:
+                row = inserted[name]
+                if now > since:
+                    point["alerts_per_s"] = row["alerts"] / (now - since)
+                if not latencies:
+                    point["latency_p50_ms"] = row["latency_p50_ms"]
+                    point["latency_p99_ms"] = row["latency_p99_ms"]
+            points[name] = point
+            if name in raw:
+                self._previous[name] = (now, values.get("events"), values.get("alerts"))
+            if values.get("job_id"):
+                self.job_ids[name] = values["job_id"]
+
+        with self._lock:
+            for name, point in points.items():
+                series = self.series.get(name)
+                if series is None:
+                    series = self.series[name] = RuleSeries(self.retention)
+                series.append(now, point)
+        self._last_sample = now
+        self.samples += 1
+        if self.store:
+            try:
+                self.store.insert(now, points, self.job_ids)
+            except Exception as e:
+                self.store_errors += 1
+                logger.warning(f"Could not write metrics to Postgres: {str(e)}")
+        return points
+
+    def _loop(self):
+        while True:
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Metrics sampling failed: {str(e)}")
+            if self.rule_service is not None and self.samples - self._published_samples >= self.publish_every:
+                self.publish_stored()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="rule-metrics", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        if self.store:
+            self.store.close()
+
+    def rule_names(self) -> List[str]:
+        with self._lock:
+            return sorted(self.series)
+
+    def points(self, rule_name: str, since: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Retained samples of a rule, None for an unknown rule"""
+        with self._lock:
+            series = self.series.get(rule_name)
+            return series.points(since) if series is not None else None
+
+    def summary(self, rule_name: str) -> Optional[Dict[str, Any]]:
+        """Latest sample of a rule, the value stored in Rule.metrics"""
+        with self._lock:
+            series = self.series.get(rule_name)
+            latest = series.latest() if series is not None else None
+        if latest is None:
+            return None
+        return {
+            "sampled_at": latest.pop("ts"),
+            **latest,
+            "job_id": self.job_ids.get(rule_name),
+            "interval_s": self.interval
+        }
+
+    def with_metrics(self, rule: Rule) -> Rule:
+        return rule.model_copy(update={"metrics": self.summary(rule.name)})
+
+    def deployment(self, rule: Rule) -> RuleDeployment:
+        return RuleDeployment(
+            rule_id=rule.rule_id,
+            job_id=self.job_ids.get(rule.name),
+            deployed_at=rule.deployed_at,
+            status=rule.status,
+            metrics=self.summary(rule.name)
+        )
+
+    async def publish(self, service, rules: Iterable[Rule]) -> int:
+        """Write the latest metrics into the stored rules (OpenSearchService or AsyncOpenSearchService)"""
+        published = 0
+        for rule in rules:
+            metrics = self.summary(rule.name)
+            if metrics is not None and await service.update_rule_metrics(rule.rule_id, metrics):
+                published += 1
+        return published
+
+    async def publish_all(self, service) -> int:
+        """publish() into every stored rule that has samples"""
+        names = set(self.rule_names())
+        rules = [rule async for rule in service.iter_rules() if rule.name in names]
+        return await self.publish(service, rules)
+
+    def publish_stored(self) -> int:
+        """publish_all() into rule_service from a thread without an event loop"""
+        self._published_samples = self.samples
+        try:
+            published = asyncio.run(self.publish_all(self.rule_service))
+        except Exception as e:
+            self.publish_errors += 1
+            logger.warning(f"Could not publish rule metrics: {str(e)}")
+            return 0
+        self.published += published
+        return published
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retained = sum(len(series) for series in self.series.values())
+            nbytes = sum(series.nbytes for series in self.series.values())
+        return {
+            "source": type(self.source).__name__,
+            "interval_s": self.interval,
+            "retention": self.retention,
+            "rules": len(self.series),
+            "samples": self.samples,
+            "errors": self.errors,
+            "store_errors": self.store_errors,
+            "published": self.published,
+            "publish_errors": self.publish_errors,
+            "retained_points": retained,
+            "series_bytes": nbytes,
+            "last_sample": _iso(self._last_sample) if self._last_sample is not None else None
+        }
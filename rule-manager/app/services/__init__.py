@@ -1,4 +1,5 @@
-from .ai_service import AIService
 from .opensearch_service import OpenSearchService
+from .async_opensearch_service import AsyncOpenSearchService
+from .rule_cache import RuleCache, CachedRuleService
 
-__all__ = ['AIService', 'OpenSearchService']
\ No newline at end of file
+__all__ = ['OpenSearchService', 'AsyncOpenSearchService', 'RuleCache', 'CachedRuleService']
\ No newline at end of file
@@ -0,0 +1,370 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from opensearchpy import AsyncOpenSearch, AIOHttpConnection, ConnectionError, NotFoundError, RequestError
+from ..models import Rule, RuleUpdate, RulePage
+from .opensearch_service import (
+    CALLS_INDEX_TEMPLATE, CALLS_TEMPLATE_NAME, DEFAULT_PAGE_SIZE, EXPORT_PAGE_SIZE, RULES_INDEX_MAPPINGS,
+    RecentWrites, calls_template_outdated,
+    list_query, parse_page, seq_no_query, status_doc, update_body
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncOpenSearchService:
+    """Non-blocking counterpart of OpenSearchService built on AsyncOpenSearch.
+
+    Requests share a pool of keep-alive aiohttp connections, so concurrent
+    calls do not block the event loop nor open a connection each. Creating
+    the service never waits for OpenSearch: call start() from the running
+    loop to connect and create the index in the background, retrying every
+    `retry_delay` seconds. A connection error during a request schedules the
+    same background reconnect, and requests wait up to `ready_timeout`
+    seconds for the cluster to be reachable again.
+    """
+
+    def __init__(self, pool_size: Optional[int] = None, ready_timeout: float = 30.0):
+        self.retry_delay = 5  # seconds
+        self.ready_timeout = ready_timeout
+        self.index = "rules"
+
+        # Get configuration from environment
+        self.host = os.getenv('OPENSEARCH_HOST', 'opensearch')
+        self.port = int(os.getenv('OPENSEARCH_PORT', '9200'))
+        self.user = os.getenv('OPENSEARCH_USER', 'admin')
+        self.password = os.getenv('OPENSEARCH_PASSWORD', 'admin')
+        self.pool_size = pool_size or int(os.getenv('OPENSEARCH_POOL_SIZE', '20'))
+        # "false" (default), "wait_for" or "true"; see RecentWrites
+        self.refresh = os.getenv('OPENSEARCH_REFRESH', 'false')
+        self.recent_writes = RecentWrites(float(os.getenv('OPENSEARCH_READ_YOUR_WRITES_SECONDS', '2')))
+
+        self.client = AsyncOpenSearch(
+            hosts=[{'host': self.host, 'port': self.port}],
+            http_auth=(self.user, self.password),
+            use_ssl=False,   # Disabled for development
+            verify_certs=False,
+            ssl_show_warn=False,
+            connection_class=AIOHttpConnection,
+            maxsize=self.pool_size,
+            retry_on_timeout=True,
+            max_retries=3
+        )
+        self._ready = asyncio.Event()
+        self._connect_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> asyncio.Task:
+        """Connect in the background (idempotent); must be called from a running loop."""
+        if self._connect_task is None or self._connect_task.done():
+            self._connect_task = asyncio.get_running_loop().create_task(self._connect_loop())
+        return self._connect_task
+
+    async def _connect_loop(self):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self.client.info()
+                await self._ensure_index()
+                await self._ensure_calls_template()
+                self._ready.set()
+                logger.info(f"Successfully connected to OpenSearch at {self.host}:{self.port}")
+                return
+            except ConnectionError:
+                logger.warning(f"Failed to connect to OpenSearch (attempt {attempt}). Retrying in {self.retry_delay} seconds...")
+            except Exception as e:
+                logger.error(f"Error initializing OpenSearch: {str(e)}. Retrying in {self.retry_delay} seconds...")
+            await asyncio.sleep(self.retry_delay)
+
+    def _reconnect(self):
+        """Mark OpenSearch as unreachable and reconnect in the background."""
+        if self._ready.is_set():
+            logger.warning("Lost connection to OpenSearch, reconnecting in the background")
+        self._ready.clear()
+        self.start()
+
+    async def _wait_ready(self):
+        if self._ready.is_set():
+            return
+        self.start()
+        try:
+            await asyncio.wait_for(self._ready.wait(), self.ready_timeout)
+        except asyncio.TimeoutError:
+            raise Exception(f"Could not connect to OpenSearch at {self.host}:{self.port}")
+
+    async def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the background connection; returns False on timeout."""
+        self.start()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        """Stop reconnecting and release the pooled connections."""
+        if self._connect_task is not None and not self._connect_task.done():
+            self._connect_task.cancel()
+            try:
+                await self._connect_task
+            except asyncio.CancelledError:
+                pass
+        await self.client.close()
+
+    async def _ensure_index(self):
+        """Ensure the rules index exists with correct mappings"""
+        if not await self.client.indices.exists(index=self.index):
+            await self.client.indices.create(
+                index=self.index,
+                body={"mappings": RULES_INDEX_MAPPINGS}
+            )
+            logger.info(f"Created index '{self.index}' with mappings")
+        else:
+            await self._ensure_tags_mapping()
+
+    async def _ensure_calls_template(self):
+        """Install or upgrade the calls-* index template"""
+        try:
+            try:
+                current = await self.client.indices.get_index_template(name=CALLS_TEMPLATE_NAME)
+            except NotFoundError:
+                current = {}
+            if calls_template_outdated(current):
+                await self.client.indices.put_index_template(name=CALLS_TEMPLATE_NAME, body=CALLS_INDEX_TEMPLATE)
+                logger.info(f"Installed index template '{CALLS_TEMPLATE_NAME}' version {CALLS_INDEX_TEMPLATE['version']}")
+        except RequestError as e:
+            logger.warning(f"Could not install index template '{CALLS_TEMPLATE_NAME}': {str(e)}")
+
+    async def _ensure_tags_mapping(self):
+        """Add the tags keyword mapping to indices created before it existed"""
+        try:
+            await self.client.indices.put_mapping(
+                index=self.index,
+                body={"properties": {"tags": RULES_INDEX_MAPPINGS["properties"]["tags"]}}
+            )
+        except RequestError as e:
+            logger.warning(f"Could not map 'tags' as keyword, tag filters may not match: {str(e)}")
+
+    async def store_rule(self, rule: Rule) -> Rule:
+        """Store a new rule in OpenSearch"""
+        await self._wait_ready()
+        try:
+            document = rule.model_dump()
+            response = await self.client.index(
+                index=self.index,
+                body=document,
+                id=rule.rule_id,
+                refresh=self.refresh
+            )
+
+            if response['result'] not in ['created', 'updated']:
+                raise Exception("Failed to store rule in OpenSearch")
+
+            self.recent_writes.put(rule.rule_id, rule)
+            logger.info(f"Successfully stored rule {rule.rule_id}")
+            return rule
+        except ConnectionError:
+            self._reconnect()
+            raise
+        except Exception as e:
+            logger.error(f"Error storing rule: {str(e)}")
+            raise
+
+    async def get_rule(self, rule_id: str) -> Optional[Rule]:
+        """Retrieve a rule by ID"""
+        result = await self.get_rule_versioned(rule_id)
+        return result[0] if result else None
+
+    async def get_rule_versioned(self, rule_id: str) -> Optional[Tuple[Rule, int, int]]:
+        """Retrieve a rule with its _seq_no and _primary_term"""
+        await self._wait_ready()
+        try:
+            response = await self.client.get(
+                index=self.index,
+                id=rule_id
+            )
+            return Rule(**response['_source']), response['_seq_no'], response['_primary_term']
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found")
+            return None
+        except ConnectionError as e:
+            self._reconnect()
+            logger.error(f"Error retrieving rule {rule_id}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Error retrieving rule {rule_id}: {str(e)}")
+            return None
+
+    async def list_rules(self) -> List[Rule]:
+        """List all rules, newest first"""
+        return [rule async for rule in self.iter_rules(include_code=True)]
+
+    async def list_rules_page(self, status: Optional[str] = None, is_active: Optional[bool] = None,
+                              tags: Optional[List[str]] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                              cursor: Optional[str] = None, include_code: bool = False) -> RulePage:
+        """One page of rules, newest first; see OpenSearchService.list_rules_page"""
+        await self._wait_ready()
+        try:
+            response = await self.client.search(
+                index=self.index,
+                body=list_query(status, is_active, tags, page_size, cursor, include_code)
+            )
+            page = parse_page(response, page_size, include_code)
+            return self.recent_writes.apply_page(page, status, is_active, tags, cursor, include_code)
+        except ConnectionError:
+            self._reconnect()
+            raise
+        except Exception as e:
+            logger.error(f"Error listing rules: {str(e)}")
+            raise
+
+    async def iter_rules(self, status: Optional[str] = None, is_active: Optional[bool] = None,
+                         tags: Optional[List[str]] = None, include_code: bool = False,
+                         page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[Any]:
+        """Stream every matching rule page by page, for exports of any size"""
+        cursor = None
+        while True:
+            page = await self.list_rules_page(status, is_active, tags, page_size, cursor, include_code)
+            for rule in page.rules:
+                yield rule
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    async def rule_seq_nos(self) -> Dict[str, Tuple[int, int]]:
+        """(_seq_no, _primary_term) of every rule, without fetching any _source"""
+        await self._wait_ready()
+        versions = {}
+        cursor = None
+        try:
+            while True:
+                response = await self.client.search(index=self.index, body=seq_no_query(cursor=cursor))
+                hits = response['hits']['hits']
+                for hit in hits:
+                    versions[hit['_id']] = (hit['_seq_no'], hit['_primary_term'])
+                if len(hits) < EXPORT_PAGE_SIZE:
+                    return versions
+                cursor = hits[-1]['sort']
+        except ConnectionError:
+            self._reconnect()
+            raise
+
+    async def _update(self, rule_id: str, body: Dict[str, Any]) -> Rule:
+        """Apply an update and return the resulting rule from the same response"""
+        response = await self.client.update(
+            index=self.index,
+            id=rule_id,
+            body=body,
+            refresh=self.refresh,
+            _source=True
+        )
+        if response['result'] not in ['updated', 'noop']:
+            raise Exception("Failed to update rule in OpenSearch")
+        rule = Rule(**response['get']['_source'])
+        self.recent_writes.put(rule_id, rule)
+        return rule
+
+    async def update_rule(self, rule_id: str, rule_update: RuleUpdate, scala_code: Optional[str] = None) -> Optional[Rule]:
+        """Update an existing rule in a single round-trip"""
+        await self._wait_ready()
+        try:
+            # Prepare update data
+            update_data = rule_update.model_dump(exclude_unset=True)
+            update_data['updated_at'] = datetime.now().isoformat()
+            increment = {}
+
+            if scala_code:
+                update_data['scala_code'] = scala_code
+                increment['version'] = 1
+
+            rule = await self._update(rule_id, update_body(update_data, increment))
+            logger.info(f"Successfully updated rule {rule_id}")
+            return rule
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for update")
+            return None
+        except ConnectionError:
+            self._reconnect()
+            raise
+        except Exception as e:
+            logger.error(f"Error updating rule {rule_id}: {str(e)}")
+            raise
+
+    async def delete_rule(self, rule_id: str) -> bool:
+        """Delete a rule"""
+        await self._wait_ready()
+        try:
+            response = await self.client.delete(
+                index=self.index,
+                id=rule_id,
+                refresh=self.refresh
+            )
+            success = response['result'] == 'deleted'
+            if success:
+                self.recent_writes.put(rule_id, None)
+                logger.info(f"Successfully deleted rule {rule_id}")
+            return success
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for deletion")
+            return False
+        except ConnectionError as e:
+            self._reconnect()
+            logger.error(f"Error deleting rule {rule_id}: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Error deleting rule {rule_id}: {str(e)}")
+            return False
+
+    async def update_rule_status(self, rule_id: str, status: str) -> Optional[Rule]:
+        """Update rule status in a single round-trip"""
+        await self._wait_ready()
+        try:
+            rule = await self._update(rule_id, {"doc": status_doc(status)})
+            logger.info(f"Successfully updated status to '{status}' for rule {rule_id}")
+            return rule
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for status update")
+            return None
+        except ConnectionError as e:
+            self._reconnect()
+            logger.error(f"Error updating status for rule {rule_id}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Error updating status for rule {rule_id}: {str(e)}")
+            return None
+
+    async def update_rule_metrics(self, rule_id: str, metrics: Dict[str, Any]) -> bool:
+        """Replace the runtime metrics of a rule; neither updated_at nor version change"""
+        await self._wait_ready()
+        try:
+            await self._update(rule_id, {"doc": {"metrics": metrics}})
+            return True
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for metrics update")
+            return False
+        except ConnectionError as e:
+            self._reconnect()
+            logger.error(f"Error updating metrics for rule {rule_id}: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Error updating metrics for rule {rule_id}: {str(e)}")
+            return False
+
+    async def check_health(self) -> bool:
+        """Check if OpenSearch is healthy and accessible (never waits for a reconnect)"""
+        if not self._ready.is_set():
+            self.start()
+            return False
+        try:
+            await self.client.info()
+            return True
+        except Exception as e:
+            if isinstance(e, ConnectionError):
+                self._reconnect()
+            logger.error(f"OpenSearch health check failed: {str(e)}")
+            return False
@@ -1,13 +1,278 @@
 import os
 import time
+import json
+import base64
 import logging
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from opensearchpy import OpenSearch, ConnectionError, RequestError, NotFoundError
-from ..models import Rule, RuleUpdate
+from ..models import Rule, RuleUpdate, RuleSummary, RulePage
 
 logger = logging.getLogger(__name__)
 
+RULES_INDEX_MAPPINGS = {
+    "properties": {
+        "rule_id": {"type": "keyword"},
+        "name": {"type": "text"},
+        "natural_language": {"type": "text"},
+        "scala_code": {"type": "text"},
+        "status": {"type": "keyword"},
+        "created_at": {"type": "date"},
+        "updated_at": {"type": "date"},
+        "deployed_at": {"type": "date"},
+        "version": {"type": "integer"},
+        "is_active": {"type": "boolean"},
+        "tags": {"type": "keyword"},
+        # Runtime metrics written by rule_metrics.MetricsCollector, stored but not indexed
+        "metrics": {"type": "object", "enabled": False}
+    }
+}
+
+def _keyword(aggregated: bool = False) -> Dict[str, Any]:
+    # doc_values only on fields the dashboards aggregate on; the others are only filtered.
+    # Aggregations go to a doc-values-only ".keyword" sub-field, the same path as in the
+    # calls-* indices created before the template (text + .keyword), so the dashboards and
+    # the rollup job work on both mappings.
+    mapping = {"type": "keyword", "doc_values": False}
+    if aggregated:
+        mapping["fields"] = {"keyword": {"type": "keyword", "index": False}}
+    return mapping
+
+# Composable template for the daily call indices written by kafka-to-opensearch.conf and
+# pipeline/opensearch_indexer.py, installed when a service connects (main.py at startup).
+# Bump "version" on every change: a template with the same or a newer version is left
+# alone. It only applies to indices created afterwards.
+CALLS_TEMPLATE_NAME = "calls"
+CALLS_INDEX_TEMPLATE = {
+    "index_patterns": ["calls-*"],
+    "priority": 100,
+    "version": 3,
+    "template": {
+        "settings": {
+            "index": {
+                "number_of_shards": 1,
+                "refresh_interval": "5s",
+                "codec": "best_compression",
+                # Newest calls first on disk: time-range queries and sorted views stop early
+                "sort.field": "event_timestamp",
+                "sort.order": "desc"
+            }
+        },
+        "mappings": {
+            "dynamic_templates": [
+                {"strings_as_keywords": {"match_mapping_type": "string", "mapping": _keyword()}}
+            ],
+            "properties": {
+                "@timestamp": {"type": "date"},
+                "event_timestamp": {"type": "date"},
+                "kafka_timestamp": {"type": "date", "index": False, "doc_values": False},
+                "xdrid": _keyword(),
+                "tenant": _keyword(),
+                "raw_caller_number": _keyword(),
+                "raw_called_number": _keyword(),
+                "other_party_country": _keyword(),
+                "service_type__desc": _keyword(),
+                "op35": _keyword(),
+                "event_type": _keyword(),
+                # Also grouped on by the rollup job (pipeline/rollup_job.py)
+                "carrier_in": _keyword(aggregated=True),
+                "selling_dest": _keyword(aggregated=True),
+                "routing_dest": _keyword(aggregated=True),
+                "carrier_out": _keyword(aggregated=True),
+                "paese_destinazione": _keyword(aggregated=True),
+                "val_euro": {"type": "scaled_float", "scaling_factor": 100},
+                "economicUnitValue": {"type": "scaled_float", "scaling_factor": 100, "doc_values": False},
+                "duration": {"type": "integer"}
+            }
+        }
+    }
+}
+
+def calls_template_outdated(response: Dict[str, Any]) -> bool:
+    """True if a GET _index_template/calls response has no template or an older version"""
+    templates = response.get("index_templates", [])
+    if not templates:
+        return True
+    installed = templates[0].get("index_template", {}).get("version") or 0
+    return installed < CALLS_INDEX_TEMPLATE["version"]
+
+# Fields of RuleSummary, fetched instead of the whole _source by list views
+SUMMARY_FIELDS = list(RuleSummary.model_fields)
+
+# Newest first; rule_id breaks ties between rules created in the same millisecond
+LIST_SORT = [{"created_at": {"order": "desc"}}, {"rule_id": {"order": "desc"}}]
+
+DEFAULT_PAGE_SIZE = 50
+EXPORT_PAGE_SIZE = 500
+
+def encode_cursor(sort_values: List[Any]) -> str:
+    """Opaque cursor from the sort values of the last hit of a page"""
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(LIST_SORT):
+        raise ValueError("Invalid cursor")
+    return values
+
+def list_query(status: Optional[str] = None, is_active: Optional[bool] = None,
+               tags: Optional[List[str]] = None, page_size: int = DEFAULT_PAGE_SIZE,
+               cursor: Optional[str] = None, include_code: bool = False) -> Dict[str, Any]:
+    """Search body for one page of rules; tags match if the rule has any of them"""
+    filters = []
+    if status is not None:
+        filters.append({"term": {"status": getattr(status, "value", status)}})
+    if is_active is not None:
+        filters.append({"term": {"is_active": is_active}})
+    if tags:
+        filters.append({"terms": {"tags": list(tags)}})
+    body = {
+        "query": {"bool": {"filter": filters}} if filters else {"match_all": {}},
+        "sort": LIST_SORT,
+        "size": page_size,
+        "_source": True if include_code else {"includes": SUMMARY_FIELDS},
+        "track_total_hits": False
+    }
+    if cursor:
+        body["search_after"] = decode_cursor(cursor)
+    return body
+
+def parse_page(response: Dict[str, Any], page_size: int, include_code: bool) -> RulePage:
+    model = Rule if include_code else RuleSummary
+    hits = response['hits']['hits']
+    rules = [model(**hit['_source']) for hit in hits]
+    next_cursor = encode_cursor(hits[-1]['sort']) if len(hits) == page_size else None
+    return RulePage(rules=rules, next_cursor=next_cursor)
+
+def seq_no_query(page_size: int = EXPORT_PAGE_SIZE, cursor: Optional[List[Any]] = None) -> Dict[str, Any]:
+    """Search body returning only _id, _seq_no and _primary_term of every rule"""
+    body = {
+        "query": {"match_all": {}},
+        "sort": LIST_SORT,
+        "size": page_size,
+        "_source": False,
+        "seq_no_primary_term": True,
+        "track_total_hits": False
+    }
+    if cursor:
+        body["search_after"] = cursor
+    return body
+
+# Merges params.doc into the source like a partial "doc" update (nested objects
+# are merged, not replaced) and adds params.increment in place, so an update that
+# bumps the version needs no prior read
+UPDATE_SCRIPT = """
+List pending = new ArrayList();
+pending.add([ctx._source, params.doc]);
+for (int i = 0; i < pending.size(); ++i) {
+    List pair = pending.get(i);
+    Map target = pair.get(0);
+    Map source = pair.get(1);
+    for (entry in source.entrySet()) {
+        def current = target.get(entry.getKey());
+        if (current instanceof Map && entry.getValue() instanceof Map) {
+            pending.add([current, entry.getValue()]);
+        } else {
+            target.put(entry.getKey(), entry.getValue());
+        }
+    }
+}
+for (entry in params.increment.entrySet()) {
+    def current = ctx._source[entry.getKey()];
+    ctx._source[entry.getKey()] = (current == null ? 0 : current) + entry.getValue();
+}
+"""
+
+def update_body(doc: Dict[str, Any], increment: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Scripted update body for UPDATE_SCRIPT"""
+    return {
+        "script": {
+            "lang": "painless",
+            "source": UPDATE_SCRIPT,
+            "params": {"doc": doc, "increment": increment or {}}
+        }
+    }
+
+def status_doc(status: str) -> Dict[str, Any]:
+    """Fields written by update_rule_status"""
+    now = datetime.now().isoformat()
+    return {
+        "status": status,
+        "updated_at": now,
+        **({"deployed_at": now} if status == "deployed" else {})
+    }
+
+def sort_key(rule: Any) -> Tuple[int, str]:
+    """LIST_SORT values of a rule, as OpenSearch returns them (epoch millis, rule_id)"""
+    created_at = rule.created_at
+    if created_at.tzinfo is None:
+        # Stored without offset, which OpenSearch reads as UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return int(created_at.timestamp() * 1000), rule.rule_id
+
+def rule_matches(rule: Rule, status: Optional[str] = None, is_active: Optional[bool] = None,
+                 tags: Optional[List[str]] = None) -> bool:
+    """Whether a rule passes the filters of list_query"""
+    if status is not None and getattr(rule.status, "value", rule.status) != getattr(status, "value", status):
+        return False
+    if is_active is not None and rule.is_active != is_active:
+        return False
+    return not tags or bool(set(tags) & set(rule.tags or []))
+
+class RecentWrites:
+    """Read-your-writes overlay for searches.
+
+    Writes no longer force a refresh, so a search may not see a rule stored,
+    updated or deleted by this process until the next refresh of the index
+    (1s by default). The written state is kept for `ttl` seconds and merged
+    into list pages; GET by id is realtime and needs no overlay.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}  # rule_id -> (expires_at, Rule or None if deleted)
+
+    def put(self, rule_id: str, rule: Optional[Rule]):
+        if self.ttl > 0:
+            self._entries[rule_id] = (time.monotonic() + self.ttl, rule)
+
+    def _live(self) -> Dict[str, Optional[Rule]]:
+        now = time.monotonic()
+        for rule_id, (expires_at, _) in list(self._entries.items()):
+            if expires_at <= now:
+                self._entries.pop(rule_id, None)
+        return {rule_id: rule for rule_id, (_, rule) in list(self._entries.items())}
+
+    def apply_page(self, page: RulePage, status: Optional[str] = None, is_active: Optional[bool] = None,
+                   tags: Optional[List[str]] = None, cursor: Optional[str] = None,
+                   include_code: bool = False) -> RulePage:
+        """Page with the recent writes that fall in its window of the sort order.
+
+        The window goes from the cursor it was read after (excluded) to its own
+        next_cursor (included; unbounded on the last page), so every recent
+        write lands on exactly one page and the cursors stay valid. A page can
+        therefore hold a few more or fewer rules than page_size.
+        """
+        entries = self._live()
+        if not entries:
+            return page
+        after = tuple(decode_cursor(cursor)) if cursor else None
+        until = tuple(decode_cursor(page.next_cursor)) if page.next_cursor else None
+
+        merged = {rule.rule_id: rule for rule in page.rules}
+        for rule_id, rule in entries.items():
+            merged.pop(rule_id, None)
+            if rule is None or not rule_matches(rule, status, is_active, tags):
+                continue
+            key = sort_key(rule)
+            if (after is None or key < after) and (until is None or key >= until):
+                merged[rule_id] = rule if include_code else RuleSummary(**rule.model_dump(include=set(SUMMARY_FIELDS)))
+        rules = sorted(merged.values(), key=sort_key, reverse=True)
+        return RulePage(rules=rules, next_cursor=page.next_cursor)
+
 class OpenSearchService:
     def __init__(self):
         self.max_retries = 5
@@ -19,10 +284,14 @@ class OpenSearchService:
         self.port = int(os.getenv('OPENSEARCH_PORT', '9200'))
         self.user = os.getenv('OPENSEARCH_USER', 'admin')
         self.password = os.getenv('OPENSEARCH_PASSWORD', 'admin')
+        # "false" (default), "wait_for" or "true"; see RecentWrites
+        self.refresh = os.getenv('OPENSEARCH_REFRESH', 'false')
+        self.recent_writes = RecentWrites(float(os.getenv('OPENSEARCH_READ_YOUR_WRITES_SECONDS', '2')))
         
         # Initialize client with retries
         self.client = self._initialize_client()
         self._ensure_index()
+        self._ensure_calls_template()
 
     def _initialize_client(self) -> OpenSearch:
         """Initialize OpenSearch client with retry logic"""
@@ -53,30 +322,41 @@ class OpenSearchService:
         """Ensure the rules index exists with correct mappings"""
         try:
             if not self.client.indices.exists(index=self.index):
-                mappings = {
-                    "properties": {
-                        "rule_id": {"type": "keyword"},
-                        "name": {"type": "text"},
-                        "natural_language": {"type": "text"},
-                        "scala_code": {"type": "text"},
-                        "status": {"type": "keyword"},
-                        "created_at": {"type": "date"},
-                        "updated_at": {"type": "date"},
-                        "deployed_at": {"type": "date"},
-                        "version": {"type": "integer"},
-                        "is_active": {"type": "boolean"}
-                    }
-                }
-                
                 self.client.indices.create(
                     index=self.index,
-                    body={"mappings": mappings}
+                    body={"mappings": RULES_INDEX_MAPPINGS}
                 )
                 logger.info(f"Created index '{self.index}' with mappings")
+            else:
+                self._ensure_tags_mapping()
         except Exception as e:
             logger.error(f"Error ensuring index existence: {str(e)}")
             raise
 
+    def _ensure_calls_template(self):
+        """Install or upgrade the calls-* index template"""
+        try:
+            try:
+                current = self.client.indices.get_index_template(name=CALLS_TEMPLATE_NAME)
+            except NotFoundError:
+                current = {}
+            if calls_template_outdated(current):
+                self.client.indices.put_index_template(name=CALLS_TEMPLATE_NAME, body=CALLS_INDEX_TEMPLATE)
+                logger.info(f"Installed index template '{CALLS_TEMPLATE_NAME}' version {CALLS_INDEX_TEMPLATE['version']}")
+        except RequestError as e:
+            # Rules keep working, new calls-* indices fall back to dynamic mapping
+            logger.warning(f"Could not install index template '{CALLS_TEMPLATE_NAME}': {str(e)}")
+
+    def _ensure_tags_mapping(self):
+        """Add the tags keyword mapping to indices created before it existed"""
+        try:
+            self.client.indices.put_mapping(
+                index=self.index,
+                body={"properties": {"tags": RULES_INDEX_MAPPINGS["properties"]["tags"]}}
+            )
+        except RequestError as e:
+            logger.warning(f"Could not map 'tags' as keyword, tag filters may not match: {str(e)}")
+
     async def store_rule(self, rule: Rule) -> Rule:
         """Store a new rule in OpenSearch"""
         try:
@@ -85,12 +365,13 @@ class OpenSearchService:
                 index=self.index,
                 body=document,
                 id=rule.rule_id,
-                refresh=True
+                refresh=self.refresh
             )
             
             if response['result'] not in ['created', 'updated']:
                 raise Exception("Failed to store rule in OpenSearch")
             
+            self.recent_writes.put(rule.rule_id, rule)
             logger.info(f"Successfully stored rule {rule.rule_id}")
             return rule
         except Exception as e:
@@ -99,12 +380,17 @@ class OpenSearchService:
 
     async def get_rule(self, rule_id: str) -> Optional[Rule]:
         """Retrieve a rule by ID"""
+        result = await self.get_rule_versioned(rule_id)
+        return result[0] if result else None
+
+    async def get_rule_versioned(self, rule_id: str) -> Optional[Tuple[Rule, int, int]]:
+        """Retrieve a rule with its _seq_no and _primary_term"""
         try:
             response = self.client.get(
                 index=self.index,
                 id=rule_id
             )
-            return Rule(**response['_source'])
+            return Rule(**response['_source']), response['_seq_no'], response['_primary_term']
         except NotFoundError:
             logger.warning(f"Rule {rule_id} not found")
             return None
@@ -113,55 +399,93 @@ class OpenSearchService:
             return None
 
     async def list_rules(self) -> List[Rule]:
-        """List all rules"""
+        """List all rules, newest first"""
+        try:
+            return [rule async for rule in self.iter_rules(include_code=True)]
+        except Exception as e:
+            logger.error(f"Error listing rules: {str(e)}")
+            raise
+
+    async def list_rules_page(self, status: Optional[str] = None, is_active: Optional[bool] = None,
+                              tags: Optional[List[str]] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                              cursor: Optional[str] = None, include_code: bool = False) -> RulePage:
+        """One page of rules, newest first, using search_after on (created_at, rule_id).
+
+        Without include_code the pages hold RuleSummary objects and the large
+        natural_language/scala_code fields are not fetched. Pages reflect the
+        index as of its last refresh, plus this process's own recent writes
+        (see RecentWrites).
+        """
         try:
             response = self.client.search(
                 index=self.index,
-                body={
-                    "query": {"match_all": {}},
-                    "sort": [{"created_at": {"order": "desc"}}]
-                },
-                size=100  # Adjust as needed
+                body=list_query(status, is_active, tags, page_size, cursor, include_code)
             )
-            
-            rules = []
-            for hit in response['hits']['hits']:
-                rules.append(Rule(**hit['_source']))
-            
-            return rules
+            page = parse_page(response, page_size, include_code)
+            return self.recent_writes.apply_page(page, status, is_active, tags, cursor, include_code)
         except Exception as e:
             logger.error(f"Error listing rules: {str(e)}")
             raise
 
+    async def iter_rules(self, status: Optional[str] = None, is_active: Optional[bool] = None,
+                         tags: Optional[List[str]] = None, include_code: bool = False,
+                         page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[Any]:
+        """Stream every matching rule page by page, for exports of any size"""
+        cursor = None
+        while True:
+            page = await self.list_rules_page(status, is_active, tags, page_size, cursor, include_code)
+            for rule in page.rules:
+                yield rule
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    async def rule_seq_nos(self) -> Dict[str, Tuple[int, int]]:
+        """(_seq_no, _primary_term) of every rule, without fetching any _source"""
+        versions = {}
+        cursor = None
+        while True:
+            response = self.client.search(index=self.index, body=seq_no_query(cursor=cursor))
+            hits = response['hits']['hits']
+            for hit in hits:
+                versions[hit['_id']] = (hit['_seq_no'], hit['_primary_term'])
+            if len(hits) < EXPORT_PAGE_SIZE:
+                return versions
+            cursor = hits[-1]['sort']
+
+    def _update(self, rule_id: str, body: Dict[str, Any]) -> Rule:
+        """Apply an update and return the resulting rule from the same response"""
+        response = self.client.update(
+            index=self.index,
+            id=rule_id,
+            body=body,
+            refresh=self.refresh,
+            _source=True
+        )
+        if response['result'] not in ['updated', 'noop']:
+            raise Exception("Failed to update rule in OpenSearch")
+        rule = Rule(**response['get']['_source'])
+        self.recent_writes.put(rule_id, rule)
+        return rule
+
     async def update_rule(self, rule_id: str, rule_update: RuleUpdate, scala_code: Optional[str] = None) -> Optional[Rule]:
-        """Update an existing rule"""
+        """Update an existing rule in a single round-trip"""
         try:
-            existing_rule = await self.get_rule(rule_id)
-            if not existing_rule:
-                logger.warning(f"Rule {rule_id} not found for update")
-                return None
-
             # Prepare update data
             update_data = rule_update.model_dump(exclude_unset=True)
-            update_data['updated_at'] = datetime.now()
+            update_data['updated_at'] = datetime.now().isoformat()
+            increment = {}
             
             if scala_code:
                 update_data['scala_code'] = scala_code
-                update_data['version'] = existing_rule.version + 1
-
-            # Update in OpenSearch
-            response = self.client.update(
-                index=self.index,
-                id=rule_id,
-                body={"doc": update_data},
-                refresh=True
-            )
-
-            if response['result'] != 'updated':
-                raise Exception("Failed to update rule in OpenSearch")
+                increment['version'] = 1
 
+            rule = self._update(rule_id, update_body(update_data, increment))
             logger.info(f"Successfully updated rule {rule_id}")
-            return await self.get_rule(rule_id)
+            return rule
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for update")
+            return None
         except Exception as e:
             logger.error(f"Error updating rule {rule_id}: {str(e)}")
             raise
@@ -172,10 +496,11 @@ class OpenSearchService:
             response = self.client.delete(
                 index=self.index,
                 id=rule_id,
-                refresh=True
+                refresh=self.refresh
             )
             success = response['result'] == 'deleted'
             if success:
+                self.recent_writes.put(rule_id, None)
                 logger.info(f"Successfully deleted rule {rule_id}")
             return success
         except NotFoundError:
@@ -186,28 +511,11 @@ class OpenSearchService:
             return False
 
     async def update_rule_status(self, rule_id: str, status: str) -> Optional[Rule]:
-        """Update rule status"""
+        """Update rule status in a single round-trip"""
         try:
-            now = datetime.now().isoformat()
-            update_body = {
-                "doc": {
-                    "status": status,
-                    "updated_at": now,
-                    **({"deployed_at": now} if status == "deployed" else {})
-                }
-            }
-            
-            response = self.client.update(
-                index=self.index,
-                id=rule_id,
-                body=update_body,
-                refresh=True
-            )
-            
-            if response['result'] == 'updated':
-                logger.info(f"Successfully updated status to '{status}' for rule {rule_id}")
-                return await self.get_rule(rule_id)
-            return None
+            rule = self._update(rule_id, {"doc": status_doc(status)})
+            logger.info(f"Successfully updated status to '{status}' for rule {rule_id}")
+            return rule
         except NotFoundError:
             logger.warning(f"Rule {rule_id} not found for status update")
             return None
@@ -215,6 +523,18 @@ class OpenSearchService:
             logger.error(f"Error updating status for rule {rule_id}: {str(e)}")
             return None
 
+    async def update_rule_metrics(self, rule_id: str, metrics: Dict[str, Any]) -> bool:
+        """Replace the runtime metrics of a rule; neither updated_at nor version change"""
+        try:
+            self._update(rule_id, {"doc": {"metrics": metrics}})
+            return True
+        except NotFoundError:
+            logger.warning(f"Rule {rule_id} not found for metrics update")
+            return False
+        except Exception as e:
+            logger.error(f"Error updating metrics for rule {rule_id}: {str(e)}")
+            return False
+
     async def check_health(self) -> bool:
         """Check if OpenSearch is healthy and accessible"""
         try:
@@ -0,0 +1,205 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ..models import Rule
+
+logger = logging.getLogger(__name__)
+
+class RuleCache:
+    """Process-local TTL + LRU cache of rules keyed by rule_id.
+
+    Each entry remembers the rule version and the _seq_no/_primary_term it
+    was read at, so reconcile() can drop exactly the entries changed by
+    other processes. The result of list_rules is cached as a single entry,
+    dropped by any local write or by invalidate_list().
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # rule_id -> (expires_at, rule, seq_no, primary_term)
+        self._entries: "OrderedDict[str, Tuple[float, Rule, Optional[int], Optional[int]]]" = OrderedDict()
+        self._list: Optional[Tuple[float, List[Rule]]] = None
+        self._lock = threading.Lock()
+
+    def get(self, rule_id: str, version: Optional[int] = None) -> Optional[Rule]:
+        """Cached rule, or None on a miss (absent, expired or a different version)"""
+        with self._lock:
+            entry = self._entries.get(rule_id)
+            if entry is not None and entry[0] > self.clock() and (version is None or entry[1].version == version):
+                self._entries.move_to_end(rule_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[rule_id]
+            self.misses += 1
+            return None
+
+    def put(self, rule: Rule, seq_no: Optional[int] = None, primary_term: Optional[int] = None):
+        with self._lock:
+            self._entries[rule.rule_id] = (self.clock() + self.ttl, rule, seq_no, primary_term)
+            self._entries.move_to_end(rule.rule_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_list(self) -> Optional[List[Rule]]:
+        with self._lock:
+            if self._list is not None and self._list[0] > self.clock():
+                self.hits += 1
+                return self._list[1]
+            self._list = None
+            self.misses += 1
+            return None
+
+    def put_list(self, rules: List[Rule]):
+        with self._lock:
+            self._list = (self.clock() + self.ttl, rules)
+
+    def invalidate(self, rule_id: str):
+        """Drop a rule (and the cached list) after a local write"""
+        with self._lock:
+            if self._entries.pop(rule_id, None) is not None:
+                self.invalidations += 1
+            self._list = None
+
+    def invalidate_list(self):
+        with self._lock:
+            self._list = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._list = None
+
+    def reconcile(self, versions: Dict[str, Tuple[int, int]]) -> int:
+        """Drop entries whose (_seq_no, _primary_term) differs from `versions`.
+
+        `versions` maps every existing rule_id to its current pair; entries
+        for rules missing from it were deleted. Returns the entries dropped.
+        """
+        dropped = 0
+        with self._lock:
+            for rule_id, (_, _, seq_no, primary_term) in list(self._entries.items()):
+                if versions.get(rule_id) != (seq_no, primary_term):
+                    del self._entries[rule_id]
+                    dropped += 1
+            self.invalidations += dropped
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl
+        }
+
+class CachedRuleService:
+    """OpenSearchService / AsyncOpenSearchService with a RuleCache in front of reads.
+
+    get_rule and list_rules are served from the cache; every write made
+    through this object invalidates the affected rule. Changes made by other
+    processes are picked up by reconcile(), run at most every
+    `reconcile_interval` seconds before a read: one search that returns only
+    _seq_no/_primary_term per rule. Other methods are delegated unchanged.
+    """
+
+    def __init__(self, service, cache: Optional[RuleCache] = None, reconcile_interval: float = 5.0):
+        self.service = service
+        self.cache = cache or RuleCache()
+        self.reconcile_interval = reconcile_interval
+        self.reconciles = 0
+        self._last_reconcile = time.monotonic()
+        self._versions: Dict[str, Tuple[int, int]] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    async def reconcile(self) -> int:
+        """Drop cached rules changed or deleted elsewhere; returns how many were dropped"""
+        self._last_reconcile = time.monotonic()
+        try:
+            versions = await self.service.rule_seq_nos()
+        except Exception as e:
+            logger.warning(f"Rule cache reconcile failed, keeping entries until TTL: {str(e)}")
+            return 0
+        self.reconciles += 1
+        dropped = self.cache.reconcile(versions)
+        if versions != self._versions:
+            # A rule was added, changed or deleted since the last reconcile
+            self.cache.invalidate_list()
+        self._versions = versions
+        if dropped:
+            logger.info(f"Rule cache reconcile dropped {dropped} stale entries")
+        return dropped
+
+    async def _maybe_reconcile(self):
+        if time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+            await self.reconcile()
+
+    async def get_rule(self, rule_id: str, version: Optional[int] = None) -> Optional[Rule]:
+        """Rule by ID, from the cache when fresh (and matching `version` if given)"""
+        await self._maybe_reconcile()
+        rule = self.cache.get(rule_id, version)
+        if rule is not None:
+            return rule
+        result = await self.service.get_rule_versioned(rule_id)
+        if result is None:
+            return None
+        rule, seq_no, primary_term = result
+        self.cache.put(rule, seq_no, primary_term)
+        return rule if version is None or rule.version == version else None
+
+    async def list_rules(self) -> List[Rule]:
+        await self._maybe_reconcile()
+        rules = self.cache.get_list()
+        if rules is None:
+            rules = await self.service.list_rules()
+            self.cache.put_list(rules)
+        return rules
+
+    async def store_rule(self, rule: Rule) -> Rule:
+        try:
+            return await self.service.store_rule(rule)
+        finally:
+            self.cache.invalidate(rule.rule_id)
+
+    async def update_rule(self, rule_id: str, *args, **kwargs) -> Optional[Rule]:
+        try:
+            return await self.service.update_rule(rule_id, *args, **kwargs)
+        finally:
+            self.cache.invalidate(rule_id)
+
+    async def update_rule_status(self, rule_id: str, status: str) -> Optional[Rule]:
+        try:
+            return await self.service.update_rule_status(rule_id, status)
+        finally:
+            self.cache.invalidate(rule_id)
+
+    async def update_rule_metrics(self, rule_id: str, metrics: Dict[str, Any]) -> bool:
+        try:
+            return await self.service.update_rule_metrics(rule_id, metrics)
+        finally:
+            self.cache.invalidate(rule_id)
+
+    async def delete_rule(self, rule_id: str) -> bool:
+        try:
+            return await self.service.delete_rule(rule_id)
+        finally:
+            self.cache.invalidate(rule_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "reconciles": self.reconciles}
@@ -0,0 +1,175 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = ".cache"
+
+def normalize_request(text: str) -> str:
+    """Canonical form of a rule request: case, spacing and trailing punctuation don't matter"""
+    return " ".join(text.lower().split()).rstrip(" .!?;:")
+
+def normalize_script(script: str) -> str:
+    """Canonical form of a SQL script for deduplication: trailing spaces and blank edges ignored"""
+    return "\n".join(line.rstrip() for line in script.strip().splitlines())
+
+def script_digest(script: str) -> str:
+    return hashlib.sha256(normalize_script(script).encode("utf-8")).hexdigest()
+
+def context_version(*parts: str) -> str:
+    """Short fingerprint of everything besides the request that shapes the output (prompt, model)"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def _write_atomic(path: str, text: str):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+class ScriptIndex:
+    """Content index of the .sql files in a directory, so a script is written only once.
+
+    Built at startup by hashing every existing file; files that are already
+    duplicates of each other are reported but left in place.
+    """
+
+    def __init__(self, sql_dir: str):
+        self.sql_dir = sql_dir
+        self._by_digest: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.duplicates: List[Tuple[str, str]] = []
+        self.rebuild()
+
+    def rebuild(self):
+        by_digest: Dict[str, str] = {}
+        duplicates = []
+        for path in sorted(glob.glob(os.path.join(self.sql_dir, "*.sql"))):
+            try:
+                with open(path) as f:
+                    digest = script_digest(f.read())
+            except OSError as e:
+                logger.warning(f"Could not index {path}: {str(e)}")
+                continue
+            filename = os.path.basename(path)
+            if digest in by_digest:
+                duplicates.append((filename, by_digest[digest]))
+            else:
+                by_digest[digest] = filename
+        with self._lock:
+            self._by_digest = by_digest
+            self.duplicates = duplicates
+        for filename, original in duplicates:
+            logger.info(f"SQL rule {filename} duplicates {original}")
+        logger.info(f"Indexed {len(by_digest)} distinct SQL rules in {self.sql_dir} ({len(duplicates)} duplicates)")
+
+    def lookup(self, script: str) -> Optional[str]:
+        """Filename already holding this script, if any (and still on disk)"""
+        digest = script_digest(script)
+        with self._lock:
+            filename = self._by_digest.get(digest)
+            if filename is not None and not os.path.exists(os.path.join(self.sql_dir, filename)):
+                del self._by_digest[digest]
+                filename = None
+            return filename
+
+    def save(self, script: str, filename: str) -> Tuple[str, bool]:
+        """Write `script` as `filename` unless an identical script exists.
+
+        Returns the filename holding the script and whether it was written now.
+        A taken filename gets a numeric suffix instead of being overwritten.
+        """
+        digest = script_digest(script)
+        with self._lock:
+            existing = self._by_digest.get(digest)
+            if existing is not None and os.path.exists(os.path.join(self.sql_dir, existing)):
+                return existing, False
+            stem, ext = os.path.splitext(filename)
+            suffix = 1
+            while os.path.exists(os.path.join(self.sql_dir, filename)):
+                filename = f"{stem}_{suffix}{ext}"
+                suffix += 1
+            _write_atomic(os.path.join(self.sql_dir, filename), script)
+            self._by_digest[digest] = filename
+            return filename, True
+
+    def __len__(self) -> int:
+        return len(self._by_digest)
+
+class GeneratedRuleCache:
+    """Persistent cache of generated SQL keyed on (normalized request, rule_name, context version).
+
+    Entries are small JSON files under <sql_dir>/.cache pointing at the .sql
+    file that holds the script, so a repeated request is answered without
+    calling the model and survives restarts. Changing the prompt or the model
+    changes the context version and bypasses older entries.
+    """
+
+    def __init__(self, sql_dir: str, version: str):
+        self.directory = os.path.join(sql_dir, CACHE_DIRNAME)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, user_request: str, rule_name: str) -> str:
+        payload = f"{self.version}\0{normalize_request(user_request)}\0{rule_name.strip()}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, user_request: str, rule_name: str) -> Optional[Dict[str, Any]]:
+        """Cached entry {request, rule_name, filename, script, created_at}, or None"""
+        key = self.key(user_request, rule_name)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and os.path.exists(self._path(key)):
+                try:
+                    with open(self._path(key)) as f:
+                        entry = json.load(f)
+                    self._memory[key] = entry
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring unreadable cache entry {key}: {str(e)}")
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, user_request: str, rule_name: str, filename: str, script: str) -> Dict[str, Any]:
+        key = self.key(user_request, rule_name)
+        entry = {
+            "request": normalize_request(user_request),
+            "rule_name": rule_name.strip(),
+            "filename": filename,
+            "script": script,
+            "context_version": self.version,
+            "created_at": datetime.now().isoformat()
+        }
+        with self._lock:
+            _write_atomic(self._path(key), json.dumps(entry))
+            self._memory[key] = entry
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(glob.glob(os.path.join(self.directory, "*.json"))),
+            "context_version": self.version
+        }
@@ -0,0 +1,443 @@
+"""Offline validation of generated Flink SQL rules before they are submitted.
+
+Parses the script statement by statement (no Flink needed) and reports:
+- calls_stream / call_alerts declarations that differ from the canonical DDL;
+- queries whose state never expires (GROUP BY or DISTINCT without a window,
+  regular joins on the stream, unbounded OVER windows);
+- windows on a column without a watermark;
+- sink options that flush one record per request;
+- a rough per-key state estimate for every aggregating query.
+
+Usage:
+    python app/sql_validator.py sql-rules/*.sql [--expected-keys 100000] [--max-state-mb 512]
+"""
+
+import re
+import sys
+import math
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+from flink_ddl import CANONICAL_DDL
+from models import RuleStatus, ValidationResult
+
+DEFAULT_EXPECTED_KEYS = 100_000
+DEFAULT_DISTINCT_PER_KEY = 10
+DEFAULT_MAX_STATE_BYTES = 512 * 1024 * 1024
+
+# Rough sizes of RocksDB state entries (serialized key + value + per-entry overhead)
+KEY_COLUMN_BYTES = 24
+ENTRY_OVERHEAD_BYTES = 48
+ACCUMULATOR_BYTES = 16
+DISTINCT_VALUE_BYTES = 40
+
+# Options that make a sink send one request per record
+PER_RECORD_FLUSH_OPTIONS = ("sink.bulk-flush.max-actions", "sink.buffer-flush.max-rows")
+
+WINDOW_FUNCTIONS = ("TUMBLE", "HOP", "CUMULATE", "SESSION")
+AGGREGATES = ("COUNT", "SUM", "MIN", "MAX", "AVG", "LISTAGG", "COLLECT", "FIRST_VALUE", "LAST_VALUE")
+
+_UNITS = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+_INTERVAL = r"INTERVAL\s+'(\d+)'\s+(SECOND|MINUTE|HOUR|DAY)S?"
+_IDENT = r"`[^`]+`|[\w.]+"
+
+def strip_comments(sql: str) -> str:
+    """Remove -- and /* */ comments, leaving quoted strings and identifiers untouched"""
+    out = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", "`"):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    if ch == "'" and end + 1 < n and sql[end + 1] == "'":
+                        end += 2
+                        continue
+                    break
+                end += 1
+            out.append(sql[i:end + 1])
+            i = end + 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    """Split on `separator` outside parentheses and quotes"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def split_statements(sql: str) -> List[str]:
+    """Statements of a script, without comments; STATEMENT SET wrappers are dropped"""
+    statements = []
+    for part in _split_top_level(strip_comments(sql), ";"):
+        statement = part.strip()
+        statement = re.sub(r"^(EXECUTE\s+STATEMENT\s+SET\s+BEGIN|BEGIN\s+STATEMENT\s+SET)\s*", "", statement,
+                           flags=re.IGNORECASE)
+        if statement and statement.upper() != "END":
+            statements.append(statement)
+    return statements
+
+def unquote(identifier: str) -> str:
+    return identifier.strip().strip("`")
+
+def interval_seconds(text: str) -> Optional[int]:
+    match = re.search(_INTERVAL, text, re.IGNORECASE)
+    return int(match.group(1)) * _UNITS[match.group(2).upper()] if match else None
+
+def _balanced(text: str, open_at: int) -> str:
+    """Content of the parenthesis opening at text[open_at]"""
+    depth = 0
+    for i in range(open_at, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return text[open_at + 1:i]
+    return text[open_at + 1:]
+
+def _enclosing_function(text: str, pos: int) -> Optional[str]:
+    """Name of the function call whose parentheses contain text[pos], if any"""
+    depth = 0
+    for i in range(pos - 1, -1, -1):
+        if text[i] == ")":
+            depth += 1
+        elif text[i] == "(":
+            if depth == 0:
+                name = re.search(r"(\w+)\s*$", text[:i])
+                return name.group(1).upper() if name else None
+            depth -= 1
+    return None
+
+def parse_create_table(statement: str) -> Optional[Dict[str, Any]]:
+    """{name, columns: {name: type}, watermark: (column, delay_s) or None, options} of a CREATE TABLE"""
+    match = re.match(rf"CREATE\s+(?:TEMPORARY\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?({_IDENT})\s*\(",
+                     statement, re.IGNORECASE)
+    if not match:
+        return None
+    body = _balanced(statement, match.end() - 1)
+    columns: Dict[str, str] = {}
+    watermark = None
+    for element in _split_top_level(body, ","):
+        element = element.strip()
+        upper = element.upper()
+        if upper.startswith("WATERMARK"):
+            wm = re.match(rf"WATERMARK\s+FOR\s+({_IDENT})\s+AS\s+(.*)", element, re.IGNORECASE | re.DOTALL)
+            if wm:
+                watermark = (unquote(wm.group(1)), interval_seconds(wm.group(2)) or 0)
+        elif upper.startswith(("PRIMARY KEY", "CONSTRAINT")) or not element:
+            continue
+        else:
+            col = re.match(rf"({_IDENT})\s+(.*)", element, re.DOTALL)
+            if col:
+                col_type = re.split(r"\s+(?:METADATA|NOT\s+NULL|COMMENT|AS)\b", col.group(2), maxsplit=1,
+                                    flags=re.IGNORECASE)[0]
+                columns[unquote(col.group(1))] = re.sub(r"\s+", "", col_type).upper()
+    options = {}
+    rest = statement[match.end() - 1 + len(body) + 2:]
+    with_match = re.search(r"\bWITH\s*\(", rest, re.IGNORECASE)
+    if with_match:
+        for key, value in re.findall(r"'((?:[^']|'')*)'\s*=\s*'((?:[^']|'')*)'", _balanced(rest, with_match.end() - 1)):
+            options[key] = value.replace("''", "'")
+    return {"name": unquote(match.group(1)), "columns": columns, "watermark": watermark, "options": options}
+
+CANONICAL_TABLES = {name: parse_create_table(ddl) for name, ddl in CANONICAL_DDL.items()}
+
+def _check_table(table: Dict[str, Any], issues: List[str], suggestions: List[str]):
+    canonical = CANONICAL_TABLES.get(table["name"])
+    if canonical is None:
+        return
+    name = table["name"]
+    for column, col_type in table["columns"].items():
+        expected = canonical["columns"].get(column)
+        if expected is None:
+            if name == "call_alerts":
+                issues.append(f"call_alerts.{column} is not in the canonical schema read by the alert consumers")
+            elif table["watermark"] and table["watermark"][0] == column:
+                issues.append(f"{name}.{column} carries the watermark but is not in the canonical schema: "
+                              f"if the events don't have it the watermark never advances")
+            else:
+                suggestions.append(f"{name}.{column} is not in the canonical schema and may always be NULL")
+        elif expected != col_type:
+            issues.append(f"{name}.{column} is {col_type}, the canonical schema has {expected}")
+    missing = [column for column in canonical["columns"] if column not in table["columns"]]
+    if missing and name == "call_alerts":
+        issues.append(f"call_alerts is missing columns {', '.join(missing)} of the canonical schema")
+    for key in ("connector", "topic", "format", "properties.bootstrap.servers"):
+        if key in canonical["options"] and table["options"].get(key) != canonical["options"][key]:
+            issues.append(f"{name} has '{key}' = '{table['options'].get(key)}', "
+                          f"expected '{canonical['options'][key]}'")
+    if name == "calls_stream":
+        if table["watermark"] is None:
+            issues.append("calls_stream declares no WATERMARK: event-time windows never close")
+
+def _check_sink_options(table: Dict[str, Any], issues: List[str]):
+    for key in PER_RECORD_FLUSH_OPTIONS:
+        if table["options"].get(key) == "1":
+            issues.append(f"{table['name']} has '{key}' = '1': one request per record; use at least 1000 "
+                          f"together with a flush interval")
+
+def _windows(statement: str) -> List[Dict[str, Any]]:
+    """Windows used by a query: table-valued functions and legacy GROUP BY windows"""
+    windows = []
+    for match in re.finditer(rf"\b({'|'.join(WINDOW_FUNCTIONS)})\s*\(\s*TABLE\s+({_IDENT})\s*,\s*"
+                             rf"DESCRIPTOR\s*\(\s*({_IDENT})\s*\)((?:\s*,\s*{_INTERVAL})+)",
+                             statement, re.IGNORECASE):
+        intervals = [int(v) * _UNITS[u.upper()] for v, u in re.findall(_INTERVAL, match.group(4), re.IGNORECASE)]
+        windows.append({"function": match.group(1).upper(), "table": unquote(match.group(2)),
+                        "column": unquote(match.group(3)), "intervals": intervals})
+    for match in re.finditer(rf"\b({'|'.join(WINDOW_FUNCTIONS)})\s*\(\s*({_IDENT})\s*((?:,\s*{_INTERVAL}\s*)+)\)",
+                             statement, re.IGNORECASE):
+        intervals = [int(v) * _UNITS[u.upper()] for v, u in re.findall(_INTERVAL, match.group(3), re.IGNORECASE)]
+        windows.append({"function": match.group(1).upper(), "table": None,
+                        "column": unquote(match.group(2)), "intervals": intervals})
+    return windows
+
+def _group_keys(statement: str) -> Optional[List[str]]:
+    """Non-window GROUP BY keys of the outermost grouped query, None without GROUP BY"""
+    match = re.search(r"\bGROUP\s+BY\b", statement, re.IGNORECASE)
+    if not match:
+        return None
+    rest = statement[match.end():]
+    end = re.search(r"\b(HAVING|ORDER\s+BY|LIMIT|WINDOW|UNION)\b", rest, re.IGNORECASE)
+    clause = rest[:end.start()] if end else rest
+    # Stop at a closing parenthesis belonging to an enclosing subquery
+    depth = 0
+    for i, ch in enumerate(clause):
+        depth += ch == "("
+        depth -= ch == ")"
+        if depth < 0:
+            clause = clause[:i]
+            break
+    keys = []
+    for item in _split_top_level(clause, ","):
+        item = item.strip()
+        if not item or re.match(rf"({'|'.join(WINDOW_FUNCTIONS)})\s*\(", item, re.IGNORECASE):
+            continue
+        if unquote(item).lower() in ("window_start", "window_end", "window_time"):
+            continue
+        keys.append(unquote(item))
+    return keys
+
+def _open_windows(window: Optional[Dict[str, Any]]) -> int:
+    if window is None:
+        return 1
+    if window["function"] == "HOP" and len(window["intervals"]) >= 2 and window["intervals"][0]:
+        # HOP(TABLE t, DESCRIPTOR(c), slide, size); legacy HOP(c, slide, size)
+        slide, size = window["intervals"][0], window["intervals"][1]
+        return max(1, math.ceil(size / slide))
+    return 1
+
+def estimate_state(statement: str, keys: List[str], window: Optional[Dict[str, Any]], watermark_delay: int,
+                   expected_keys: int, distinct_per_key: int) -> Dict[str, Any]:
+    """Rough keyed state of an aggregating query, per key and in total"""
+    upper = statement.upper()
+    distinct = len(re.findall(r"\bCOUNT\s*\(\s*DISTINCT\b", upper))
+    aggregates = sum(len(re.findall(rf"\b{name}\s*\(", upper)) for name in AGGREGATES) - distinct
+    per_window = (ENTRY_OVERHEAD_BYTES + KEY_COLUMN_BYTES * max(1, len(keys)) + ACCUMULATOR_BYTES * aggregates
+                  + distinct * distinct_per_key * (DISTINCT_VALUE_BYTES + ENTRY_OVERHEAD_BYTES))
+    open_windows = _open_windows(window)
+    bytes_per_key = per_window * open_windows
+    estimate = {
+        "keys": keys,
+        "aggregates": aggregates,
+        "distinct_aggregates": distinct,
+        "window": window["function"] if window else None,
+        "open_windows_per_key": open_windows,
+        "bytes_per_key": bytes_per_key,
+        "expected_keys": expected_keys,
+        "estimated_bytes": bytes_per_key * expected_keys,
+        "bounded": window is not None
+    }
+    if window is not None:
+        size = window["intervals"][-1] if window["function"] in ("HOP", "CUMULATE") else window["intervals"][0]
+        estimate["retention_seconds"] = size + watermark_delay
+    return estimate
+
+def validate_sql(sql: str, expected_keys: int = DEFAULT_EXPECTED_KEYS,
+                 distinct_per_key: int = DEFAULT_DISTINCT_PER_KEY,
+                 max_state_bytes: int = DEFAULT_MAX_STATE_BYTES) -> ValidationResult:
+    """Validate a Flink SQL script; issues make it invalid, suggestions don't"""
+    issues: List[str] = []
+    suggestions: List[str] = []
+    estimates: List[Dict[str, Any]] = []
+    tables: Dict[str, Dict[str, Any]] = {}
+    # view name -> first table it reads, to resolve the watermark of windows over views
+    views: Dict[str, Optional[str]] = {}
+    state_ttl = None
+    queries: List[Tuple[str, Optional[str]]] = []
+
+    statements = split_statements(sql)
+    if not statements:
+        return ValidationResult(is_valid=False, issues=["The script contains no SQL statements"])
+
+    for statement in statements:
+        upper = statement.upper()
+        if upper.startswith("CREATE") and re.match(r"CREATE\s+(TEMPORARY\s+)?TABLE", upper):
+            table = parse_create_table(statement)
+            if table is None:
+                issues.append(f"Could not parse: {statement[:60]}...")
+                continue
+            tables[table["name"]] = table
+            _check_table(table, issues, suggestions)
+            _check_sink_options(table, issues)
+        elif re.match(r"CREATE\s+(TEMPORARY\s+)?VIEW", upper):
+            view = re.match(rf"CREATE\s+(?:TEMPORARY\s+)?VIEW\s+(?:IF\s+NOT\s+EXISTS\s+)?({_IDENT})\s+AS\s+(.*)",
+                            statement, re.IGNORECASE | re.DOTALL)
+            if view:
+                source_table = re.search(rf"\b(?:FROM|TABLE)\s+(?!TABLE\b)({_IDENT})", view.group(2), re.IGNORECASE)
+                views[unquote(view.group(1))] = unquote(source_table.group(1)) if source_table else None
+                queries.append((view.group(2), None))
+        elif upper.startswith("SET"):
+            ttl = re.match(r"SET\s+'table\.exec\.state\.ttl'\s*=\s*'([^']+)'", statement, re.IGNORECASE)
+            if ttl:
+                state_ttl = ttl.group(1)
+        elif upper.startswith("INSERT"):
+            target = re.match(rf"INSERT\s+(?:INTO|OVERWRITE)\s+({_IDENT})", statement, re.IGNORECASE)
+            queries.append((statement, unquote(target.group(1)) if target else None))
+        elif upper.startswith(("SELECT", "WITH")):
+            queries.append((statement, None))
+
+    if not any(target for _, target in queries):
+        issues.append("No INSERT INTO: the script only prints results in the sql-client, nothing reaches call_alerts")
+
+    source = tables.get("calls_stream")
+    watermark = source["watermark"] if source else None
+    for statement, target in queries:
+        if target is not None and target not in tables:
+            issues.append(f"INSERT INTO {target}: table {target} is not declared in the script")
+        # Common table expressions count as views
+        views.update((unquote(name), None) for name in re.findall(rf"({_IDENT})\s+AS\s*\(\s*SELECT\b", statement,
+                                                          re.IGNORECASE))
+        for ref in re.finditer(rf"\b(?:FROM|JOIN|TABLE)\s+({_IDENT})", statement, re.IGNORECASE):
+            name = unquote(ref.group(1))
+            if name.upper() in ("TABLE", "LATERAL", "UNNEST") or name in tables or name in views:
+                continue
+            # FROM inside EXTRACT(HOUR FROM ts), TRIM(... FROM s), SUBSTRING(s FROM 1) is not a table
+            if _enclosing_function(statement, ref.start()) in ("EXTRACT", "TRIM", "SUBSTRING", "OVERLAY", "POSITION"):
+                continue
+            issues.append(f"Table {name} is used but not declared in the script")
+        if target == "call_alerts" and not re.search(r"\bAS\s+rule_name\b", statement, re.IGNORECASE):
+            suggestions.append("INSERT INTO call_alerts should select the rule name literal AS rule_name")
+
+        windows = _windows(statement)
+        for window in windows:
+            name = window["table"] or "calls_stream"
+            seen = set()
+            while name in views and name not in seen and views[name]:
+                seen.add(name)
+                name = views[name]
+            table = tables.get(name)
+            table_watermark = table["watermark"] if table else None
+            if table_watermark is None:
+                issues.append(f"{window['function']} window on {window['column']}: the table has no watermark, "
+                              f"the window never closes")
+            elif window["column"] != table_watermark[0]:
+                issues.append(f"{window['function']} window on {window['column']}, but the watermark is on "
+                              f"{table_watermark[0]}: use the watermark column")
+
+        keys = _group_keys(statement)
+        if keys is not None or re.search(r"\bSELECT\s+DISTINCT\b", statement, re.IGNORECASE):
+            if not windows:
+                message = ("GROUP BY without a window" if keys is not None else "SELECT DISTINCT without a window")
+                if state_ttl:
+                    suggestions.append(f"{message}: state is bounded only by table.exec.state.ttl = {state_ttl}")
+                else:
+                    issues.append(f"{message}: one state entry per key is kept forever; aggregate over "
+                                  f"TUMBLE/HOP on event_timestamp or set table.exec.state.ttl")
+            estimate = estimate_state(statement, keys or [], windows[0] if windows else None,
+                                      watermark[1] if watermark else 0, expected_keys, distinct_per_key)
+            if target:
+                estimate["target"] = target
+            estimates.append(estimate)
+
+        for join in re.finditer(r"\bJOIN\b", statement, re.IGNORECASE):
+            following = statement[join.end():]
+            next_join = re.search(r"\bJOIN\b", following, re.IGNORECASE)
+            clause = following[:next_join.start()] if next_join else following
+            if re.search(r"FOR\s+SYSTEM_TIME\s+AS\s+OF", clause, re.IGNORECASE):
+                continue
+            if re.search(r"\bBETWEEN\b.*\bINTERVAL\b", clause, re.IGNORECASE | re.DOTALL):
+                continue
+            if re.search(r"window_start\s*=", clause, re.IGNORECASE):
+                continue
+            if re.search(r"\bUNNEST\b|\bLATERAL\b", clause[:40], re.IGNORECASE):
+                continue
+            issues.append("Regular JOIN on the stream: both inputs are kept in state forever; use an interval "
+                          "join (BETWEEN ... INTERVAL), a window join or a temporal join")
+
+        if re.search(r"\bOVER\b.*\bUNBOUNDED\s+PRECEDING\b", statement, re.IGNORECASE | re.DOTALL):
+            suggestions.append("OVER window with UNBOUNDED PRECEDING keeps one accumulator per key forever; "
+                               "prefer a bounded RANGE INTERVAL")
+
+    total = sum(estimate["estimated_bytes"] for estimate in estimates) if estimates else None
+    if total is not None and total > max_state_bytes:
+        issues.append(f"Estimated state {total / 2**20:,.0f} MiB for {expected_keys:,} keys exceeds the "
+                      f"{max_state_bytes / 2**20:,.0f} MiB limit")
+    if any(estimate["distinct_aggregates"] for estimate in estimates):
+        suggestions.append("COUNT(DISTINCT) keeps every distinct value per key and window; with many values "
+                           "per key consider APPROX_COUNT_DISTINCT or the engine's approximate mode")
+
+    return ValidationResult(
+        is_valid=not issues,
+        issues=list(dict.fromkeys(issues)),
+        suggestions=list(dict.fromkeys(suggestions)),
+        state_estimates=estimates,
+        estimated_state_bytes=total
+    )
+
+def validate_file(path: str, **kwargs) -> ValidationResult:
+    with open(path) as f:
+        return validate_sql(f.read(), **kwargs)
+
+def validation_status(result: ValidationResult) -> RuleStatus:
+    """Status a rule moves to after validation"""
+    return RuleStatus.VALIDATED if result.is_valid else RuleStatus.ERROR
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="SQL scripts to validate")
+    parser.add_argument("--expected-keys", type=int, default=DEFAULT_EXPECTED_KEYS,
+                        help="distinct keys (e.g. callers) per window used for the state estimate")
+    parser.add_argument("--distinct-per-key", type=int, default=DEFAULT_DISTINCT_PER_KEY,
+                        help="distinct values per key for COUNT(DISTINCT) estimates")
+    parser.add_argument("--max-state-mb", type=float, default=DEFAULT_MAX_STATE_BYTES / 2**20)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.paths:
+        result = validate_file(path, expected_keys=args.expected_keys, distinct_per_key=args.distinct_per_key,
+                               max_state_bytes=int(args.max_state_mb * 2**20))
+        failed += not result.is_valid
+        state = (f", state ~{result.estimated_state_bytes / 2**20:,.1f} MiB"
+                 if result.estimated_state_bytes is not None else "")
+        print(f"{'OK  ' if result.is_valid else 'FAIL'} {path}{state}")
+        for issue in result.issues:
+            print(f"     issue: {issue}")
+        for suggestion in result.suggestions:
+            print(f"     suggestion: {suggestion}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
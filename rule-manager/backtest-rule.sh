@@ -0,0 +1,5 @@
+#!/bin/bash
+
+# Backtest in event time sui CSV del simulatore (precisione sulle etichette <file>.csv.labels), es.:
+# ./backtest-rule.sh --rule high_frequency_caller:600:10 --sql sql-rules/rule_20250403212634.sql
+python3 app/backtest.py ../simulatore-python/data/*.csv "$@"
@@ -0,0 +1,135 @@
+"""
+Storage and ingest cost of call indices: dynamic mapping vs the calls-* template.
+
+Needs a real OpenSearch (the in-memory fake has no storage). Indexes the
+same --docs call records, in _bulk requests of --batch-size, into two
+scratch indices outside the calls-* pattern:
+
+    bench-calls-dynamic     no mappings, default settings (what calls-* got before)
+    bench-calls-template    settings and mappings of CALLS_INDEX_TEMPLATE
+
+then refreshes, force-merges each to one segment and compares ingest rate,
+store size and number of mapped fields. The indices are deleted at the end
+unless --keep is given.
+
+Usage (from rule-manager/):
+    OPENSEARCH_HOST=localhost python -m benchmarks.bench_calls_template [--docs 500000] [--batch-size 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from opensearchpy import OpenSearch
+
+from app.services.opensearch_service import CALLS_INDEX_TEMPLATE
+
+CARRIERS = ["TIM", "Vodafone", "WindTre", "Iliad", "Telefonica", "Orange", "Deutsche Telekom", "Rostelecom"]
+COUNTRIES = [("IT", "Italy"), ("ES", "Spain"), ("FR", "France"), ("DE", "Germany"), ("AU", "Australia"),
+             ("LV", "Latvia"), ("CU", "Cuba"), ("SN", "Senegal")]
+CITIES = ["Rome", "Milan", "Madrid", "Paris", "Berlin", "Moscow", "Havana", "Dakar"]
+
+
+def call_records(count, seed=5):
+    """Call documents as written by csv-to-kafka.conf, one call every 20 ms from a fixed start."""
+    rng = random.Random(seed)
+    start = datetime(2025, 3, 27, 8, 0, tzinfo=timezone.utc)
+    for i in range(count):
+        code, country = rng.choice(COUNTRIES)
+        city = rng.choice(CITIES)
+        event = (start + timedelta(milliseconds=20 * i)).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        ingest = (start + timedelta(milliseconds=20 * i + rng.randrange(500, 5000))).isoformat(
+            timespec="milliseconds").replace("+00:00", "Z")
+        value = round(rng.uniform(0.1, 10), 2)
+        yield {
+            "tenant": "Sparkle", "val_euro": value, "duration": rng.randrange(1, 3600),
+            "economicUnitValue": value, "other_party_country": code, "routing_dest": city,
+            "service_type__desc": "Voice", "op35": "", "carrier_in": rng.choice(CARRIERS),
+            "carrier_out": rng.choice(CARRIERS), "selling_dest": city,
+            "raw_caller_number": f"39{rng.randrange(10 ** 9):09d}", "raw_called_number": f"39{rng.randrange(10 ** 10):010d}",
+            "paese_destinazione": country, "event_timestamp": event,
+            "xdrid": str(uuid.UUID(int=rng.getrandbits(128))), "event_type": "call_record",
+            "kafka_timestamp": ingest, "@timestamp": ingest,
+        }
+
+
+def bulk_bodies(index, docs, batch_size):
+    lines = []
+    for doc in docs:
+        lines.append(json.dumps({"index": {"_index": index, "_id": doc["xdrid"]}}))
+        lines.append(json.dumps(doc))
+        if len(lines) == 2 * batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def field_count(mapping):
+    count = 0
+    for field in mapping.get("properties", {}).values():
+        count += 1 + field_count(field) + len(field.get("fields", {}))
+    return count
+
+
+def run(client, index, body, docs, batch_size):
+    if client.indices.exists(index=index):
+        client.indices.delete(index=index)
+    client.indices.create(index=index, body=body)
+    elapsed = 0.0
+    for payload in bulk_bodies(index, call_records(docs), batch_size):
+        start = time.perf_counter()
+        response = client.bulk(body=payload, filter_path="errors,items.*.error")
+        elapsed += time.perf_counter() - start
+        if response.get("errors"):
+            raise RuntimeError(f"bulk errors in {index}: {response['items'][:3]}")
+    client.indices.refresh(index=index)
+    client.indices.forcemerge(index=index, max_num_segments=1, request_timeout=600)
+    stats = client.indices.stats(index=index, metric="store,docs")["indices"][index]["primaries"]
+    mapping = client.indices.get_mapping(index=index)[index]["mappings"]
+    return {"rate": docs / elapsed, "store": stats["store"]["size_in_bytes"],
+            "docs": stats["docs"]["count"], "fields": field_count(mapping)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch indices")
+    args = parser.parse_args()
+
+    client = OpenSearch(
+        hosts=[{"host": os.getenv("OPENSEARCH_HOST", "localhost"), "port": int(os.getenv("OPENSEARCH_PORT", "9200"))}],
+        http_auth=(os.getenv("OPENSEARCH_USER", "admin"), os.getenv("OPENSEARCH_PASSWORD", "admin")),
+        use_ssl=False, verify_certs=False, ssl_show_warn=False, timeout=120,
+    )
+    template = CALLS_INDEX_TEMPLATE["template"]
+    # No replicas on either side: they would only add noise to a single-node comparison
+    template_body = {"settings": {"index": {**template["settings"]["index"], "number_of_replicas": 0}},
+                     "mappings": template["mappings"]}
+    runs = [
+        ("dynamic mapping", "bench-calls-dynamic", {"settings": {"index": {"number_of_shards": 1,
+                                                                           "number_of_replicas": 0}}}),
+        ("calls-* template", "bench-calls-template", template_body),
+    ]
+    print(f"{args.docs:,} calls, bulk of {args.batch_size}")
+    results = {}
+    try:
+        for name, index, body in runs:
+            results[name] = result = run(client, index, body, args.docs, args.batch_size)
+            print(f"{name:<18} {result['rate']:>9,.0f} docs/s  store {result['store'] / 2 ** 20:8.1f} MiB  "
+                  f"({result['store'] / result['docs']:.0f} B/doc)  {result['fields']} mapped fields")
+    finally:
+        if not args.keep:
+            for _, index, _ in runs:
+                client.indices.delete(index=index, ignore_unavailable=True)
+    before, after = results["dynamic mapping"], results["calls-* template"]
+    print(f"store {after['store'] / before['store']:.0%} of dynamic, ingest x{after['rate'] / before['rate']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
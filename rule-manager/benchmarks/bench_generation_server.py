@@ -0,0 +1,152 @@
+"""
+Load test of /generate_rule: Flask development server vs SERVER_MODE=asgi.
+
+main.call_model is replaced by a stub that takes --model-ms per call and,
+like a rate-limited model API, serves at most --model-slots calls at once
+(further calls wait for a slot). Each scenario fires its requests at the
+same time from --clients concurrent clients:
+
+- burst: --distinct different rules, each submitted by several analysts;
+- overload: every request is a different rule, more than the ASGI
+  concurrency limit plus queue can take.
+
+Every scenario uses fresh rule texts, so the generated SQL cache never
+answers. Reports p50/p99 latency of successful requests, 429s and model calls.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_generation_server [--clients 64] [--distinct 16] [--model-ms 500]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+from benchmarks.bench_opensearch import percentile
+
+
+class StubModel:
+    def __init__(self, delay, slots):
+        self.delay = delay
+        self.slots = threading.Semaphore(slots)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls += 1
+        rule_name = prompt.rsplit("Nome Regola:", 1)[1].strip()
+        with self.slots:
+            time.sleep(self.delay)
+        return f"```sql\nINSERT INTO call_alerts\nSELECT *, '{rule_name}' AS rule_name FROM calls_stream;\n```"
+
+
+def load_main(app_dir):
+    os.environ["APP_DIR"] = app_dir
+    os.environ.setdefault("GEMINI_API_KEY", "stub")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+    import main
+    return main
+
+
+def serve_flask(main, port):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", port, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def serve_asgi(main, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(main.create_asgi_app(), host="127.0.0.1", port=port,
+                                           log_level="error", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+async def fire(port, bodies, clients):
+    """POST every body, at most `clients` at a time; returns (status, latency) per request"""
+    results = []
+    queue = iter(bodies)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=clients),
+                                     timeout=aiohttp.ClientTimeout(total=600)) as session:
+        async def client():
+            for body in queue:
+                start = time.perf_counter()
+                async with session.post(f"http://127.0.0.1:{port}/generate_rule", json=body) as response:
+                    await response.read()
+                    results.append((response.status, time.perf_counter() - start))
+        await asyncio.gather(*(client() for _ in range(clients)))
+    return results
+
+
+def report(name, results, calls, elapsed):
+    ok = [latency for status, latency in results if status == 200]
+    rejected = sum(1 for status, _ in results if status == 429)
+    line = f"  {name:<6} ok {len(ok):>4}  429 {rejected:>4}  model calls {calls:>4}  wall {elapsed:>5.1f}s"
+    if ok:
+        line += f"  p50 {percentile(ok, 0.5):>6.2f}s  p99 {percentile(ok, 0.99):>6.2f}s"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=16)
+    parser.add_argument("--overload", type=int, default=100, help="distinct requests in the overload scenario")
+    parser.add_argument("--model-ms", type=float, default=500.0)
+    parser.add_argument("--model-slots", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4, help="GENERATION_CONCURRENCY")
+    parser.add_argument("--queue", type=int, default=16, help="GENERATION_QUEUE")
+    parser.add_argument("--port", type=int, default=9301)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as app_dir:
+        main_module = load_main(app_dir)
+        logging.getLogger("main").setLevel(logging.ERROR)
+        logging.getLogger("sql_cache").setLevel(logging.ERROR)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        main_module.GENERATION_CONCURRENCY = args.concurrency
+        main_module.GENERATION_QUEUE = args.queue
+        model = StubModel(args.model_ms / 1000, args.model_slots)
+        main_module.call_model = model
+
+        scenarios = {
+            "burst": lambda tag: [{"rule": f"{tag} caller con piu di {i % args.distinct + 3} called in 2 minuti",
+                                   "rule_name": f"{tag}_rule_{i % args.distinct}"} for i in range(args.clients)],
+            "overload": lambda tag: [{"rule": f"{tag} durata oltre {i} secondi", "rule_name": f"{tag}_long_{i}"}
+                                     for i in range(args.overload)],
+        }
+        print(f"stub model {args.model_ms:g} ms, {args.model_slots} slots; ASGI concurrency {args.concurrency}, "
+              f"queue {args.queue}")
+        for scenario, make_bodies in scenarios.items():
+            bodies = make_bodies(scenario)
+            print(f"{scenario}: {len(bodies)} requests, {len({b['rule_name'] for b in bodies})} distinct")
+            for offset, (mode, serve) in enumerate((("flask", serve_flask), ("asgi", serve_asgi))):
+                port = args.port + offset
+                stop = serve(main_module, port)
+                calls = model.calls
+                tagged = [{**body, "rule": f"{mode} {body['rule']}", "rule_name": f"{mode}_{body['rule_name']}"}
+                          for body in bodies]
+                start = time.perf_counter()
+                results = asyncio.run(fire(port, tagged, max(args.clients, len(tagged))))
+                report(mode, results, model.calls - calls, time.perf_counter() - start)
+                stop()
+            args.port += 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Accuracy vs memory of the HyperLogLog distinct-count mode (app.engine.sketches).
+
+Distinct called numbers per caller come from the simulator CSVs; since those
+contain almost only one-off callers, --heavy-callers synthetic callers with
+log-uniform cardinalities up to --max-cardinality are added, reusing the
+simulator called numbers. For each error target the per-caller estimates
+are compared with the exact sets (relative error over the callers above the
+threshold, threshold decisions over all callers), the 4-way shard merge is
+checked against a single sketch, and the top-callers rule (> 3 distinct) is
+run exact and approximate through the engine.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_hll [--csv FILE ...] [--heavy-callers 200] [--max-cardinality 100000]
+"""
+
+import argparse
+import glob
+import math
+import os
+import random
+import sys
+import time
+
+from app.engine import (DistinctCountRule, HyperLogLog, StreamingRuleEngine, TumblingWindow,
+                        iter_csv_records, precision_for_error)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CSVS = [
+    os.path.join(REPO_ROOT, "output20250327220646.csv_ori"),
+    os.path.join(REPO_ROOT, "simulatore-python", "preview_data.csv"),
+    *sorted(glob.glob(os.path.join(REPO_ROOT, "simulatore-python", "data", "*.csv"))),
+    *sorted(glob.glob(os.path.join(REPO_ROOT, "data", "*.csv"))),
+]
+ERRORS = [0.01, 0.02, 0.05, 0.1]
+THRESHOLD = 3
+
+
+def load_distinct(paths):
+    records = list(iter_csv_records(paths))
+    distinct = {}
+    for record in records:
+        distinct.setdefault(record["raw_caller_number"], set()).add(record["raw_called_number"])
+    return records, distinct
+
+
+def add_heavy_callers(distinct, count, max_cardinality, seed=42):
+    rng = random.Random(seed)
+    pool = sorted(set().union(*distinct.values())) if distinct else []
+    for i in range(count):
+        cardinality = int(math.exp(rng.uniform(math.log(THRESHOLD + 1), math.log(max_cardinality))))
+        values = set(rng.sample(pool, min(len(pool), cardinality // 2)))
+        while len(values) < cardinality:
+            values.add(f"{rng.randrange(10**12):012d}")
+        distinct[f"heavy{i:05d}"] = values
+
+
+def exact_bytes(distinct):
+    return sum(sys.getsizeof(v) + sum(map(sys.getsizeof, v)) for v in distinct.values())
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sketch_accuracy(distinct, error):
+    precision = precision_for_error(error)
+    rel_errors, memory, disagreements, merge_mismatches = [], 0, 0, 0
+    start = time.perf_counter()
+    for values in distinct.values():
+        sketch = HyperLogLog(precision)
+        sketch.update(values)
+        estimate = sketch.count()
+        if len(values) > THRESHOLD:
+            rel_errors.append(abs(estimate - len(values)) / len(values))
+        memory += sketch.sizeof()
+        if (estimate > THRESHOLD) != (len(values) > THRESHOLD):
+            disagreements += 1
+
+        ordered = sorted(values)
+        shards = [HyperLogLog(precision) for _ in range(4)]
+        for i, value in enumerate(ordered):
+            shards[i % 4].add(value)
+        merged = HyperLogLog.from_bytes(shards[0].to_bytes())
+        for shard in shards[1:]:
+            merged.merge(HyperLogLog.from_bytes(shard.to_bytes()))
+        if merged.count() != estimate:
+            merge_mismatches += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "error": error,
+        "precision": precision,
+        "mean": sum(rel_errors) / len(rel_errors),
+        "p99": percentile(rel_errors, 0.99),
+        "max": max(rel_errors),
+        "memory": memory,
+        "disagreements": disagreements,
+        "merge_mismatches": merge_mismatches,
+        "seconds": elapsed,
+    }
+
+
+def run_rule(records, **kwargs):
+    engine = StreamingRuleEngine([DistinctCountRule("top_callers", TumblingWindow(120), THRESHOLD, **kwargs)])
+    alerts = {(a["raw_caller_number"], a["event_time"]) for a in engine.run(records)}
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", nargs="+", default=[p for p in DEFAULT_CSVS if os.path.exists(p)])
+    parser.add_argument("--heavy-callers", type=int, default=200)
+    parser.add_argument("--max-cardinality", type=int, default=100_000)
+    args = parser.parse_args()
+
+    records, distinct = load_distinct(args.csv)
+    print(f"Simulator data: {len(records):,} records, {len(distinct):,} callers from {len(args.csv)} files")
+    exact_rule = run_rule(records)
+    add_heavy_callers(distinct, args.heavy_callers, args.max_cardinality)
+    values = sum(len(v) for v in distinct.values())
+    print(f"With {args.heavy_callers} heavy callers: {len(distinct):,} callers, {values:,} distinct pairs")
+    print(f"Exact sets: {exact_bytes(distinct) / 2**20:,.1f} MiB")
+    print()
+    print(f"{'error':>6} {'p':>3} {'mean err':>9} {'p99 err':>8} {'max err':>8} {'MiB':>8} "
+          f"{'>3 diff':>8} {'merge diff':>10} {'time s':>7}")
+    for error in ERRORS:
+        r = sketch_accuracy(distinct, error)
+        print(f"{r['error']:>6.2f} {r['precision']:>3} {r['mean']:>9.4f} {r['p99']:>8.4f} {r['max']:>8.4f} "
+              f"{r['memory'] / 2**20:>8.2f} {r['disagreements']:>8} {r['merge_mismatches']:>10} "
+              f"{r['seconds']:>7.2f}")
+
+    print()
+    print(f"Top-callers rule on the simulator records (TUMBLE 2 min, > {THRESHOLD} distinct):")
+    print(f"  exact: {len(exact_rule)} alerts")
+    for error in ERRORS:
+        approx = run_rule(records, approximate=True, error=error)
+        print(f"  approximate error={error}: {len(approx)} alerts, "
+              f"{len(approx - exact_rule)} extra, {len(exact_rule - approx)} missed")
+
+
+if __name__ == "__main__":
+    main()
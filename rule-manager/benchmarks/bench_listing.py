@@ -0,0 +1,93 @@
+"""
+Rule listing: full-source match_all (size=100) vs cursor pages of RuleSummary.
+
+Stores --rules rules with --code-kb KB of generated code each in the fake
+OpenSearch, then times one list view page, a filtered page and a full
+export, reporting the bytes the cluster had to send for each.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_listing [--rules 2000] [--code-kb 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.fake_opensearch import FakeOpenSearch
+
+
+async def measure(fake, name, call, repeat):
+    sent = fake.bytes_sent
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await call()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:<44} {elapsed * 1000:>9.1f} ms {(fake.bytes_sent - sent) / repeat / 1024:>10,.0f} KB "
+          f"{len(result):>7} rules")
+
+
+async def run(args, fake):
+    from app.models import Rule
+    from app.services import AsyncOpenSearchService
+
+    service = AsyncOpenSearchService()
+    await service.wait_until_ready()
+    service.recent_writes.ttl = 0
+    base = datetime(2025, 4, 1)
+    code = "x" * (args.code_kb * 1024)
+    for i in range(args.rules):
+        await service.store_rule(Rule(
+            rule_id=str(uuid.uuid4()), name=f"rule_{i}", natural_language="caller con piu di 3 called in 2 minuti",
+            scala_code=code, status="deployed" if i % 4 == 0 else "created", created_at=base + timedelta(seconds=i),
+            version=1, is_active=i % 2 == 0, tags=["wangiri"] if i % 10 == 0 else []))
+    await asyncio.sleep(fake.refresh_interval)
+
+    async def legacy_list():
+        response = await service.client.search(index=service.index, size=100, body={
+            "query": {"match_all": {}}, "sort": [{"created_at": {"order": "desc"}}]})
+        return [Rule(**hit['_source']) for hit in response['hits']['hits']]
+
+    async def first_page():
+        return (await service.list_rules_page(page_size=100)).rules
+
+    async def filtered_page():
+        return (await service.list_rules_page(status="deployed", is_active=True, tags=["wangiri"])).rules
+
+    async def export_summaries():
+        return [rule async for rule in service.iter_rules()]
+
+    async def export_full():
+        return [rule async for rule in service.iter_rules(include_code=True)]
+
+    print(f"{args.rules} rules, {args.code_kb} KB of code each")
+    await measure(fake, "match_all size=100, full _source (before)", legacy_list, args.repeat)
+    await measure(fake, "list_rules_page(page_size=100), summaries", first_page, args.repeat)
+    await measure(fake, "list_rules_page(deployed, active, wangiri)", filtered_page, args.repeat)
+    await measure(fake, "iter_rules() summaries, all pages", export_summaries, 1)
+    await measure(fake, "iter_rules(include_code=True), all pages", export_full, 1)
+    await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=2000)
+    parser.add_argument("--code-kb", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=9203)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    fake = FakeOpenSearch(args.latency_ms, refresh_interval_ms=200)
+    fake.start_in_thread(port=args.port)
+    os.environ["OPENSEARCH_HOST"] = "127.0.0.1"
+    os.environ["OPENSEARCH_PORT"] = str(args.port)
+    asyncio.run(run(args, fake))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Latency of OpenSearchService vs AsyncOpenSearchService against a fake OpenSearch.
+
+Both services are driven from one event loop with --concurrency concurrent
+callers, as async request handlers would do. The sync service blocks the
+loop on every request, so callers are served one at a time; the async one
+overlaps them on its connection pool.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_opensearch [--requests 2000] [--concurrency 50] [--latency-ms 5]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.fake_opensearch import FakeOpenSearch
+
+
+def make_rule(i):
+    from app.models import Rule
+
+    return Rule(rule_id=str(uuid.uuid4()), name=f"rule_{i}", natural_language="caller con piu di 3 called in 2 minuti",
+                scala_code="SELECT 1", status="created", created_at=datetime.now(), version=1, is_active=False)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(call, requests, concurrency):
+    """Run `requests` calls of `call(i)` with `concurrency` workers.
+
+    Returns the latencies, the wall time and the worst event loop stall seen
+    by a 1 ms ticker running alongside (how long other handlers would wait).
+    """
+    latencies = []
+    counter = iter(range(requests))
+    max_lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal max_lag
+        while not done:
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    lag_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await lag_task
+    return latencies, elapsed, max_lag
+
+
+def report(name, latencies, elapsed, max_lag):
+    print(f"{name:<24} {len(latencies) / elapsed:>7,.0f} req/s  p50 {statistics.median(latencies) * 1000:>6.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:>6.1f} ms  max loop stall {max_lag * 1000:>7.1f} ms")
+
+
+async def run(args):
+    from app.services import AsyncOpenSearchService, OpenSearchService
+
+    start = time.perf_counter()
+    async_service = AsyncOpenSearchService(pool_size=args.concurrency)
+    async_service.start()
+    print(f"AsyncOpenSearchService() returned in {(time.perf_counter() - start) * 1000:.2f} ms")
+    await async_service.wait_until_ready()
+    start = time.perf_counter()
+    sync_service = OpenSearchService()
+    print(f"OpenSearchService() returned in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    rules = [make_rule(i) for i in range(args.rules)]
+    for rule in rules:
+        await async_service.store_rule(rule)
+    ids = [rule.rule_id for rule in rules]
+    print()
+
+    for name, service in (("sync", sync_service), ("async", async_service)):
+        result = await drive(lambda i: service.get_rule(ids[i % len(ids)]), args.requests, args.concurrency)
+        report(f"{name} get_rule", *result)
+        result = await drive(lambda i: service.list_rules(), args.requests // 10, args.concurrency)
+        report(f"{name} list_rules", *result)
+        result = await drive(lambda i: service.update_rule_status(ids[i % len(ids)], "validated"),
+                             args.requests // 4, args.concurrency)
+        report(f"{name} update_rule_status", *result)
+
+    await async_service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="latency added by the fake cluster")
+    parser.add_argument("--port", type=int, default=9201)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    FakeOpenSearch(args.latency_ms).start_in_thread(port=args.port)
+    os.environ["OPENSEARCH_HOST"] = "127.0.0.1"
+    os.environ["OPENSEARCH_PORT"] = str(args.port)
+    print(f"Fake OpenSearch on port {args.port}, {args.latency_ms:g} ms per request, "
+          f"{args.concurrency} concurrent callers")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Polling load on the rule registry with and without CachedRuleService.
+
+--concurrency pollers read --hot-rules rules by id (and the full list every
+tenth read) against the fake OpenSearch, like a deploy loop or a UI
+refreshing. Reports reads/s, requests that reached the cluster and the
+cache counters, then measures how long a change made by another process
+takes to show up through the cache (bounded by the reconcile interval plus
+the index refresh interval).
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_rule_cache [--reads 20000] [--concurrency 100] [--reconcile-interval 1]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.bench_opensearch import drive, make_rule, percentile
+from benchmarks.fake_opensearch import FakeOpenSearch
+
+
+async def run(args, fake):
+    from app.models import RuleUpdate
+    from app.services import AsyncOpenSearchService, CachedRuleService, RuleCache
+
+    service = AsyncOpenSearchService(pool_size=args.concurrency)
+    await service.wait_until_ready()
+    rules = [make_rule(i) for i in range(args.rules)]
+    for rule in rules:
+        await service.store_rule(rule)
+    hot = [rule.rule_id for rule in rules[:args.hot_rules]]
+    await asyncio.sleep(fake.refresh_interval)
+
+    cached = CachedRuleService(service, RuleCache(max_entries=args.cache_size, ttl=args.ttl),
+                               reconcile_interval=args.reconcile_interval)
+
+    def poll(target):
+        async def call(i):
+            if i % 10 == 0:
+                await target.list_rules()
+            else:
+                await target.get_rule(hot[i % len(hot)])
+        return call
+
+    print(f"{args.rules} rules, {args.hot_rules} hot, {args.concurrency} pollers, "
+          f"{args.latency_ms:g} ms cluster latency")
+    for name, target in (("uncached", service), ("cached", cached)):
+        requests = fake.requests
+        latencies, elapsed, _ = await drive(poll(target), args.reads, args.concurrency)
+        print(f"{name:<9} {len(latencies) / elapsed:>9,.0f} reads/s  p50 {percentile(latencies, 0.5) * 1000:>6.2f} ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:>6.2f} ms  cluster requests {fake.requests - requests:>7,}")
+    print(f"cache stats: {cached.stats()}")
+
+    # Staleness of a change made by another writer (not through the cache)
+    other = AsyncOpenSearchService()
+    await other.wait_until_ready()
+    await cached.get_rule(hot[0])
+    start = time.perf_counter()
+    await other.update_rule(hot[0], RuleUpdate(name="changed elsewhere"))
+    while (await cached.get_rule(hot[0])).name != "changed elsewhere":
+        await asyncio.sleep(0.01)
+    print(f"external change visible through the cache after {time.perf_counter() - start:.2f}s "
+          f"(reconcile every {args.reconcile_interval:g}s, index refresh every {fake.refresh_interval:g}s)")
+
+    # Local writes are visible immediately
+    await cached.update_rule(hot[1], RuleUpdate(name="changed locally"))
+    print(f"local change visible immediately: {(await cached.get_rule(hot[1])).name == 'changed locally'}")
+    await other.close()
+    await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--hot-rules", type=int, default=20)
+    parser.add_argument("--cache-size", type=int, default=1024)
+    parser.add_argument("--ttl", type=float, default=30.0)
+    parser.add_argument("--reconcile-interval", type=float, default=1.0)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=9204)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    fake = FakeOpenSearch(args.latency_ms)
+    fake.start_in_thread(port=args.port)
+    os.environ["OPENSEARCH_HOST"] = "127.0.0.1"
+    os.environ["OPENSEARCH_PORT"] = str(args.port)
+    asyncio.run(run(args, fake))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cost of per-rule metrics: collector overhead on the embedded engine and series size.
+
+Drives a StreamingRuleEngine with --rules rules from one thread while a
+MetricsCollector samples it from another every --interval seconds (sharing
+the engine lock), and compares throughput with the same run without
+collector. Then fills a day of samples (--retention) for every rule and
+compares the RuleSeries arrays with a list of dicts per rule.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_rule_metrics [--events 500000] [--rules 8] [--interval 0.2]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from app.engine import StreamingRuleEngine
+from benchmarks.bench_engine import synthetic_records
+from benchmarks.bench_shared_scan import make_rules
+
+# rule_metrics imports models flat, as when main.py runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+from rule_metrics import METRIC_FIELDS, EngineMetricsSource, MetricsCollector, RuleSeries  # noqa: E402
+
+
+def run(records, rules, interval):
+    engine = StreamingRuleEngine(rules)
+    lock = threading.Lock()
+    collector = MetricsCollector(EngineMetricsSource(engine, lock), interval=interval) if interval else None
+    if collector:
+        collector.start()
+    start = time.perf_counter()
+    for i in range(0, len(records), 1000):
+        with lock:
+            engine.process_batch(records[i:i + 1000])
+    with lock:
+        engine.flush()
+    elapsed = time.perf_counter() - start
+    if collector:
+        collector.stop()
+    return engine, collector, elapsed
+
+
+def measure(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--callers", type=int, default=20_000)
+    parser.add_argument("--rate", type=float, default=2000.0, help="events per second of event time")
+    parser.add_argument("--rules", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.2, help="sampling interval in seconds")
+    parser.add_argument("--retention", type=int, default=5760, help="samples kept per rule")
+    args = parser.parse_args()
+
+    records = synthetic_records(args.events, args.callers, args.rate)
+    print(f"{args.rules} rules, {args.events:,} events, sampling every {args.interval:g}s")
+    for name, interval in (("no metrics", 0), ("collector", args.interval)):
+        engine, collector, elapsed = run(records, make_rules(args.rules), interval)
+        line = f"{name:<11} {engine.events / elapsed:>9,.0f} events/s"
+        if collector:
+            stats = collector.stats()
+            line += f"  samples {stats['samples']}  errors {stats['errors']}"
+        print(line)
+
+    point = {field: 1.5 for field in METRIC_FIELDS}
+
+    def fill_series():
+        series = [RuleSeries(args.retention) for _ in range(args.rules)]
+        for s in series:
+            for i in range(args.retention):
+                s.append(1_760_000_000 + i * 15, point)
+        return series
+
+    def fill_dicts():
+        return [[{"ts": f"2025-10-09T08:{i % 60:02d}:00+00:00", **{f: 1.5 + i for f in METRIC_FIELDS}}
+                 for i in range(args.retention)] for _ in range(args.rules)]
+
+    _, series_bytes = measure(fill_series)
+    _, dict_bytes = measure(fill_dicts)
+    print(f"{args.retention:,} samples x {args.rules} rules: RuleSeries {series_bytes / 2**20:.1f} MiB, "
+          f"list of dicts {dict_bytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
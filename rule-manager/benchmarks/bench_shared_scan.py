@@ -0,0 +1,72 @@
+"""
+Many distinct-count rules in the embedded engine: one state per rule vs shared scan.
+
+Runs --rules caller/called rules with different thresholds and windows
+(tumbling and hopping, 1 to 10 minutes) over the same synthetic stream,
+first with a PaneStore per rule, then with shared_scan=True, checks that
+both produce the same alerts and reports throughput and peak state.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_shared_scan [--events 500000] [--callers 20000] [--rules 8]
+"""
+
+import argparse
+import time
+
+from app.engine import DistinctCountRule, HoppingWindow, StreamingRuleEngine, TumblingWindow
+from benchmarks.bench_engine import synthetic_records
+
+WINDOWS = [
+    lambda: TumblingWindow(120),
+    lambda: HoppingWindow(600, 120),
+    lambda: TumblingWindow(60),
+    lambda: HoppingWindow(300, 60),
+    lambda: TumblingWindow(300),
+    lambda: HoppingWindow(240, 120),
+]
+
+
+def make_rules(count):
+    return [DistinctCountRule(f"rule_{i}", WINDOWS[i % len(WINDOWS)](), threshold=3 + i % 5)
+            for i in range(count)]
+
+
+def run(records, rules, shared_scan):
+    engine = StreamingRuleEngine(rules, shared_scan=shared_scan)
+    alerts = []
+    peak_bytes = peak_keys = 0
+    sampling = 0.0
+    start = time.perf_counter()
+    for i in range(0, len(records), 1000):
+        alerts.extend(engine.process_batch(records[i:i + 1000]))
+        if i % 50_000 == 0:
+            sample_start = time.perf_counter()
+            peak_keys = max(peak_keys, engine.active_keys())
+            peak_bytes = max(peak_bytes, engine.state_bytes())
+            sampling += time.perf_counter() - sample_start
+    alerts.extend(engine.flush())
+    elapsed = time.perf_counter() - start - sampling
+    return engine, alerts, elapsed, peak_keys, peak_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--callers", type=int, default=20_000)
+    parser.add_argument("--rate", type=float, default=2000.0, help="events per second of event time")
+    parser.add_argument("--rules", type=int, default=8)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.events, args.callers, args.rate)
+    results = {}
+    print(f"{args.rules} rules, {args.events:,} events, {args.callers:,} callers")
+    for name, shared in (("per rule", False), ("shared scan", True)):
+        engine, alerts, elapsed, peak_keys, peak_bytes = run(records, make_rules(args.rules), shared)
+        results[name] = sorted((a["rule_name"], a["raw_caller_number"], a["event_time"]) for a in alerts)
+        print(f"{name:<12} {engine.events / elapsed:>9,.0f} events/s  stores {len(engine.stores):>2}  "
+              f"peak keys {peak_keys:>9,}  peak state {peak_bytes / 2**20:>7.1f} MiB  alerts {len(alerts):,}")
+    print(f"same alerts: {results['per rule'] == results['shared scan']}")
+
+
+if __name__ == "__main__":
+    main()
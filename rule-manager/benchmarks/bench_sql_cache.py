@@ -0,0 +1,102 @@
+"""
+Generated SQL cache and SQL_DIR dedup index used by /generate_rule.
+
+Replays --requests rule requests drawn from --distinct variants (differing
+only in case, spacing and punctuation, as users retype them) against a stub
+model that takes --model-ms per call, with and without the cache. Reports
+latency, model calls and the .sql files written, then the startup cost of
+indexing --files existing scripts.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_sql_cache [--requests 500] [--distinct 20] [--model-ms 200]
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from app.sql_cache import GeneratedRuleCache, ScriptIndex, context_version
+from benchmarks.bench_opensearch import percentile
+
+TEMPLATES = [
+    "caller con piu di {n} called distinti in {m} minuti",
+    "chiamate verso {n} paesi diversi in {m} minuti dallo stesso caller",
+    "durata totale superiore a {n} secondi in {m} minuti",
+]
+
+
+def make_requests(count, distinct, seed=0):
+    rng = random.Random(seed)
+    base = [(TEMPLATES[i % len(TEMPLATES)].format(n=3 + i, m=2 + i % 5), f"rule_{i}") for i in range(distinct)]
+    requests = []
+    for _ in range(count):
+        text, name = rng.choice(base)
+        variant = rng.choice([text, text.upper(), f"  {text}.", text.replace(" ", "  "), text.capitalize() + "!"])
+        requests.append((variant, name))
+    return requests
+
+
+def stub_model(text, name, delay):
+    time.sleep(delay)
+    return f"INSERT INTO call_alerts\nSELECT *, '{name}' AS rule_name\nFROM calls_stream -- {text.lower()}\n"
+
+
+def generate(sql_dir, requests, delay, cached):
+    """The /generate_rule flow, with or without the cache; returns latencies and model calls."""
+    cache = GeneratedRuleCache(sql_dir, context_version("context", "model")) if cached else None
+    index = ScriptIndex(sql_dir) if cached else None
+    latencies, calls = [], 0
+    for i, (text, name) in enumerate(requests):
+        start = time.perf_counter()
+        entry = cache.get(text, name) if cache else None
+        if entry is None:
+            script = stub_model(" ".join(text.split()).strip(" .!"), name, delay)
+            calls += 1
+            filename = f"rule_{i:06d}.sql"
+            if cached:
+                filename, _ = index.save(script, filename)
+                cache.put(text, name, filename, script)
+            else:
+                with open(os.path.join(sql_dir, filename), "w") as f:
+                    f.write(script)
+        latencies.append(time.perf_counter() - start)
+    return latencies, calls, cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--model-ms", type=float, default=200.0, help="stub model latency")
+    parser.add_argument("--files", type=int, default=5000, help="existing scripts for the index startup test")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    requests = make_requests(args.requests, args.distinct)
+    delay = args.model_ms / 1000
+    print(f"{args.requests} requests, {args.distinct} distinct rules, model {args.model_ms:g} ms per call")
+    for name, cached in (("no cache", False), ("cache", True)):
+        with tempfile.TemporaryDirectory() as sql_dir:
+            latencies, calls, cache = generate(sql_dir, requests, delay, cached)
+            files = len([f for f in os.listdir(sql_dir) if f.endswith(".sql")])
+            hits = [lat for lat in latencies if lat < delay]
+            print(f"{name:<9} total {sum(latencies):>7.1f}s  model calls {calls:>4}  .sql files {files:>4}  "
+                  f"p50 {percentile(latencies, 0.5) * 1000:>8.2f} ms")
+            if cache is not None:
+                print(f"          hit p99 {percentile(hits, 0.99) * 1000:.3f} ms  {cache.stats()}")
+
+    with tempfile.TemporaryDirectory() as sql_dir:
+        for i in range(args.files):
+            with open(os.path.join(sql_dir, f"rule_{i:06d}.sql"), "w") as f:
+                f.write(stub_model(f"regola {i % (args.files // 2 or 1)}", "r", 0))
+        start = time.perf_counter()
+        index = ScriptIndex(sql_dir)
+        print(f"\nindexing {args.files} scripts: {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"{len(index)} distinct, {len(index.duplicates)} duplicates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Concurrent rule updates: previous write path vs single round-trip updates.
+
+Previously update_rule did GET + update(refresh=true) + GET and
+update_rule_status did update(refresh=true) + GET. Now both are a single
+update returning _source, with refresh "true", "wait_for" or "false" (the
+default, with the read-your-writes overlay for list_rules).
+
+The fake cluster charges --refresh-ms per forced refresh (serialized, as
+refreshes of one shard are) and refreshes periodically every second.
+
+Usage (from rule-manager/):
+    python -m benchmarks.bench_updates [--updates 1000] [--concurrency 50] [--latency-ms 2] [--refresh-ms 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from benchmarks.bench_opensearch import drive, make_rule, percentile
+from benchmarks.fake_opensearch import FakeOpenSearch
+
+
+async def legacy_update_rule(service, rule_id, rule_update, scala_code):
+    """update_rule as it was: read, update with refresh=true, read again."""
+    existing = await service.get_rule(rule_id)
+    update_data = rule_update.model_dump(exclude_unset=True)
+    update_data['updated_at'] = datetime.now().isoformat()
+    if scala_code:
+        update_data['scala_code'] = scala_code
+        update_data['version'] = existing.version + 1
+    await service.client.update(index=service.index, id=rule_id, body={"doc": update_data}, refresh=True)
+    return await service.get_rule(rule_id)
+
+
+async def run(args, fake):
+    from app.models import RuleUpdate
+    from app.services import AsyncOpenSearchService
+    from app.services.opensearch_service import RecentWrites
+
+    service = AsyncOpenSearchService(pool_size=args.concurrency)
+    await service.wait_until_ready()
+    rules = [make_rule(i) for i in range(args.rules)]
+    for rule in rules:
+        await service.store_rule(rule)
+    ids = [rule.rule_id for rule in rules]
+    update = RuleUpdate(name="renamed", is_active=True)
+
+    modes = [
+        ("legacy (get+update+get)", None),
+        ("single, refresh=true", "true"),
+        ("single, refresh=wait_for", "wait_for"),
+        ("single, refresh=false", "false"),
+    ]
+    print(f"{'update_rule':<26} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'requests':>9} {'refreshes':>9}")
+    for name, refresh in modes:
+        if refresh is None:
+            service.refresh = "true"
+            call = lambda i: legacy_update_rule(service, ids[i % len(ids)], update, f"SELECT {i}")
+        else:
+            service.refresh = refresh
+            call = lambda i: service.update_rule(ids[i % len(ids)], update, scala_code=f"SELECT {i}")
+        requests, refreshes = fake.requests, fake.refreshes
+        latencies, elapsed, _ = await drive(call, args.updates, args.concurrency)
+        print(f"{name:<26} {len(latencies) / elapsed:>8,.0f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.1f} {(fake.requests - requests) / len(latencies):>9.1f} "
+              f"{fake.refreshes - refreshes:>9}")
+
+    # Read-your-writes: with refresh=false a list right after an update must show it
+    service.refresh = "false"
+    stale = 0
+    for i, rule_id in enumerate(ids[:20]):
+        await service.update_rule_status(rule_id, "deployed" if i % 2 else "validated")
+        listed = {rule.rule_id: rule for rule in await service.list_rules()}
+        if listed[rule_id].status != ("deployed" if i % 2 else "validated"):
+            stale += 1
+    service.recent_writes = RecentWrites(0)
+    raw_stale = 0
+    for i, rule_id in enumerate(ids[20:40]):
+        await service.update_rule_status(rule_id, "error")
+        listed = {rule.rule_id: rule for rule in await service.list_rules()}
+        if listed[rule_id].status != "error":
+            raw_stale += 1
+    print()
+    print(f"list_rules right after update (refresh=false): {stale}/20 stale with the overlay, "
+          f"{raw_stale}/20 stale without")
+    await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--refresh-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=9202)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    fake = FakeOpenSearch(args.latency_ms, args.refresh_ms)
+    fake.start_in_thread(port=args.port)
+    os.environ["OPENSEARCH_HOST"] = "127.0.0.1"
+    os.environ["OPENSEARCH_PORT"] = str(args.port)
+    start = time.perf_counter()
+    asyncio.run(run(args, fake))
+    print(f"Total {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
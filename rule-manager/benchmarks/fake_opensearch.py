@@ -0,0 +1,305 @@
+"""
+Minimal in-memory OpenSearch for the rule-manager benchmarks.
+
+Implements the endpoints used by OpenSearchService / AsyncOpenSearchService
+(info, index template get/put, index exists/create, index/get/update/delete
+document, search) with an optional fixed latency per request, to mimic a
+remote cluster.
+
+Like OpenSearch, GET by id is realtime while searches only see the documents
+as of the last refresh, which happens every --refresh-interval-ms. A write
+with refresh=true pays --refresh-ms, serialized per index; refresh=wait_for
+waits for the next periodic refresh. Scripted updates are emulated for the
+rules update script only (params.doc deep-merged, params.increment added).
+
+Usage (from rule-manager/):
+    python -m benchmarks.fake_opensearch [--port 9201] [--latency-ms 5] [--refresh-ms 20]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+
+def _merge(target, source):
+    """Partial "doc" update semantics: nested objects are merged, anything else replaced."""
+    for key, value in source.items():
+        if isinstance(target.get(key), dict) and isinstance(value, dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+class FakeOpenSearch:
+    def __init__(self, latency_ms: float = 0.0, refresh_ms: float = 0.0, refresh_interval_ms: float = 1000.0):
+        self.latency = latency_ms / 1000
+        self.refresh_cost = refresh_ms / 1000
+        self.refresh_interval = refresh_interval_ms / 1000
+        self.indices = {}
+        self.templates = {}
+        self.requests = 0
+        self.refreshes = 0
+        self.bytes_sent = 0
+        self._refresh_lock = None
+        self._runner = None
+
+    def _new_index(self, mappings=None):
+        return {"mappings": mappings or {}, "docs": {}, "visible": {}, "refreshed_at": time.monotonic()}
+
+    def _index(self, index):
+        state = self.indices.setdefault(index, self._new_index())
+        # Periodic refresh
+        if time.monotonic() - state["refreshed_at"] >= self.refresh_interval:
+            self._refresh_now(state)
+        return state
+
+    def _docs(self, index):
+        return self._index(index)["docs"]
+
+    def _refresh_now(self, state):
+        state["visible"] = {doc_id: (copy.deepcopy(doc["_source"]), doc["_seq_no"])
+                            for doc_id, doc in state["docs"].items()}
+        state["refreshed_at"] = time.monotonic()
+        self.refreshes += 1
+
+    async def _refresh(self, request, index):
+        mode = request.query.get("refresh", "false")
+        state = self._index(index)
+        if mode in ("true", ""):
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                await asyncio.sleep(self.refresh_cost)
+                self._refresh_now(state)
+        elif mode == "wait_for":
+            await asyncio.sleep(max(0.0, state["refreshed_at"] + self.refresh_interval - time.monotonic()))
+            self._index(index)
+
+    def _json(self, data, status=200):
+        text = json.dumps(data)
+        self.bytes_sent += len(text)
+        return web.Response(text=text, status=status, content_type="application/json")
+
+    @web.middleware
+    async def _latency(self, request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def info(self, request):
+        return self._json({"name": "fake", "cluster_name": "fake",
+                           "version": {"distribution": "opensearch", "number": "2.11.1"}})
+
+    async def index_exists(self, request):
+        return web.Response(status=200 if request.match_info["index"] in self.indices else 404)
+
+    async def create_index(self, request):
+        index = request.match_info["index"]
+        body = await request.json() if request.can_read_body else {}
+        self.indices[index] = self._new_index(body.get("mappings"))
+        return self._json({"acknowledged": True, "index": index})
+
+    async def get_index_template(self, request):
+        name = request.match_info["name"]
+        if name not in self.templates:
+            return self._json({"error": {"type": "resource_not_found_exception"}, "status": 404}, status=404)
+        return self._json({"index_templates": [{"name": name, "index_template": self.templates[name]}]})
+
+    async def put_index_template(self, request):
+        self.templates[request.match_info["name"]] = await request.json()
+        return self._json({"acknowledged": True})
+
+    async def index_doc(self, request):
+        index, doc_id = request.match_info["index"], request.match_info["id"]
+        docs = self._docs(index)
+        result = "updated" if doc_id in docs else "created"
+        seq_no = docs[doc_id]["_seq_no"] + 1 if doc_id in docs else 0
+        docs[doc_id] = {"_source": await request.json(), "_seq_no": seq_no}
+        await self._refresh(request, index)
+        return self._json({"_index": index, "_id": doc_id, "result": result, "_seq_no": seq_no,
+                           "_primary_term": 1}, status=201 if result == "created" else 200)
+
+    def _not_found(self, index, doc_id):
+        return self._json({"_index": index, "_id": doc_id, "found": False}, status=404)
+
+    async def get_doc(self, request):
+        index, doc_id = request.match_info["index"], request.match_info["id"]
+        doc = self._docs(index).get(doc_id)
+        if doc is None:
+            return self._not_found(index, doc_id)
+        return self._json({"_index": index, "_id": doc_id, "found": True, "_seq_no": doc["_seq_no"],
+                           "_primary_term": 1, "_source": doc["_source"]})
+
+    async def update_doc(self, request):
+        index, doc_id = request.match_info["index"], request.match_info["id"]
+        doc = self._docs(index).get(doc_id)
+        if doc is None:
+            return self._json({"error": {"type": "document_missing_exception"}, "status": 404}, status=404)
+        body = await request.json()
+        if "script" in body:
+            params = body["script"].get("params", {})
+            _merge(doc["_source"], params.get("doc", {}))
+            for field, delta in params.get("increment", {}).items():
+                doc["_source"][field] = (doc["_source"].get(field) or 0) + delta
+        else:
+            _merge(doc["_source"], body.get("doc", {}))
+        doc["_seq_no"] += 1
+        await self._refresh(request, index)
+        response = {"_index": index, "_id": doc_id, "result": "updated", "_seq_no": doc["_seq_no"],
+                    "_primary_term": 1}
+        if request.query.get("_source") == "true":
+            response["get"] = {"found": True, "_seq_no": doc["_seq_no"], "_primary_term": 1,
+                               "_source": doc["_source"]}
+        return self._json(response)
+
+    async def delete_doc(self, request):
+        index, doc_id = request.match_info["index"], request.match_info["id"]
+        if self._docs(index).pop(doc_id, None) is None:
+            return self._json({"_index": index, "_id": doc_id, "result": "not_found"}, status=404)
+        await self._refresh(request, index)
+        return self._json({"_index": index, "_id": doc_id, "result": "deleted"})
+
+    async def put_mapping(self, request):
+        index = request.match_info["index"]
+        body = await request.json()
+        self._index(index)["mappings"].setdefault("properties", {}).update(body.get("properties", {}))
+        return self._json({"acknowledged": True})
+
+    @staticmethod
+    def _matches(source, query):
+        if "bool" not in query:
+            return True
+        for clause in query["bool"].get("filter", []):
+            if "term" in clause:
+                (field, value), = clause["term"].items()
+                actual = source.get(field)
+                if not (value in actual if isinstance(actual, list) else actual == value):
+                    return False
+            elif "terms" in clause:
+                (field, values), = clause["terms"].items()
+                actual = source.get(field)
+                actual = actual if isinstance(actual, list) else [actual]
+                if not set(actual) & set(values):
+                    return False
+        return True
+
+    def _sort_value(self, index, field, source):
+        value = source.get(field)
+        field_type = self.indices[index]["mappings"].get("properties", {}).get(field, {}).get("type")
+        if field_type == "date" and isinstance(value, str):
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return int(dt.timestamp() * 1000)
+        return value
+
+    @staticmethod
+    def _project(source, spec):
+        if spec is True or spec is None:
+            return source
+        if spec is False:
+            return {}
+        includes = spec.get("includes") if isinstance(spec, dict) else spec
+        excludes = spec.get("excludes", []) if isinstance(spec, dict) else []
+        return {k: v for k, v in source.items() if (not includes or k in includes) and k not in excludes}
+
+    async def search(self, request):
+        index = request.match_info["index"]
+        body = await request.json() if request.can_read_body else {}
+        size = int(request.query.get("size", body.get("size", 10)))
+        query = body.get("query", {"match_all": {}})
+        docs = [(doc_id, source, seq_no) for doc_id, (source, seq_no) in self._index(index)["visible"].items()
+                if self._matches(source, query)]
+
+        sort = [next(iter(clause.items())) for clause in body.get("sort", [])]
+        keyed = []
+        for doc_id, source, seq_no in docs:
+            keyed.append(([self._sort_value(index, field, source) for field, _ in sort], doc_id, source, seq_no))
+        # Stable multi-key sort, least significant key first
+        for position in reversed(range(len(sort))):
+            descending = sort[position][1].get("order") == "desc"
+            keyed.sort(key=lambda item: (item[0][position] is not None,
+                                         item[0][position] if item[0][position] is not None else 0),
+                       reverse=descending)
+        if "search_after" in body:
+            after = body["search_after"]
+            position = 0
+            while position < len(keyed) and self._before_or_equal(keyed[position][0], after, sort):
+                position += 1
+            keyed = keyed[position:]
+
+        hits = []
+        for values, doc_id, source, seq_no in keyed[:size]:
+            hit = {"_index": index, "_id": doc_id, "sort": values}
+            if body.get("_source") is not False:
+                hit["_source"] = self._project(source, body.get("_source"))
+            if body.get("seq_no_primary_term"):
+                hit.update({"_seq_no": seq_no, "_primary_term": 1})
+            hits.append(hit)
+        return self._json({"hits": {"total": {"value": len(docs), "relation": "eq"}, "hits": hits}})
+
+    @staticmethod
+    def _before_or_equal(values, after, sort):
+        """Whether a hit with sort `values` comes at or before the `after` position."""
+        for value, marker, (_, spec) in zip(values, after, sort):
+            if value == marker:
+                continue
+            return value > marker if spec.get("order") == "desc" else value < marker
+        return True
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._latency])
+        app.router.add_get("/", self.info)
+        app.router.add_get("/_index_template/{name}", self.get_index_template)
+        app.router.add_put("/_index_template/{name}", self.put_index_template)
+        app.router.add_head("/{index}", self.index_exists)
+        app.router.add_put("/{index}", self.create_index)
+        app.router.add_put("/{index}/_mapping", self.put_mapping)
+        app.router.add_put("/{index}/_doc/{id}", self.index_doc)
+        app.router.add_post("/{index}/_doc/{id}", self.index_doc)
+        app.router.add_get("/{index}/_doc/{id}", self.get_doc)
+        app.router.add_delete("/{index}/_doc/{id}", self.delete_doc)
+        app.router.add_post("/{index}/_update/{id}", self.update_doc)
+        app.router.add_route("*", "/{index}/_search", self.search)
+        return app
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 9201) -> threading.Thread:
+        """Serve from a daemon thread with its own event loop; returns once listening."""
+        started = threading.Event()
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._runner = web.AppRunner(self.app(), access_log=None)
+            loop.run_until_complete(self._runner.setup())
+            loop.run_until_complete(web.TCPSite(self._runner, host, port).start())
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        started.wait()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--refresh-ms", type=float, default=0.0)
+    parser.add_argument("--refresh-interval-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+    fake = FakeOpenSearch(args.latency_ms, args.refresh_ms, args.refresh_interval_ms)
+    web.run_app(fake.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
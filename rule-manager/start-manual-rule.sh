@@ -1,4 +1,6 @@
 #!/bin/bash
 
-# Chiamata per recuperare tutte le regole dal database
- docker exec -it rule-manager-jobmanager-1 bash ./bin/sql-client.sh -f /opt/flink/sql-rules/simple-copy.sql
\ No newline at end of file
+# Avvia una regola di sql-rules (default simple-copy.sql), solo se supera la validazione
+RULE=${1:-simple-copy.sql}
+python3 app/sql_validator.py "sql-rules/$RULE" || exit 1
+docker exec -it rule-manager-jobmanager-1 bash ./bin/sql-client.sh -f "/opt/flink/sql-rules/$RULE"
@@ -0,0 +1,5 @@
+#!/bin/bash
+
+# Unisce le regole valide di sql-rules in un unico job (una sola lettura di call-data-raw) e lo avvia
+python3 app/rule_bundler.py sql-rules/*.sql -o sql-rules/bundle/active-rules.sql || exit 1
+docker exec -it rule-manager-jobmanager-1 bash ./bin/sql-client.sh -f /opt/flink/sql-rules/bundle/active-rules.sql
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: righe/secondo del motore a colonne (cdr_engine) rispetto al
+generate_records per-record degli script generati (data/generate_script.py).
+
+Uso:
+    python bench_generator.py [--records 200000] [--script ../data/generate_script.py]
+"""
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import cdr_engine
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "generate_script.py")
+
+
+def load_script(path):
+    spec = importlib.util.spec_from_file_location("generated_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(label, num_records, seconds, baseline=None):
+    rate = num_records / seconds
+    speedup = f"  (x{baseline / seconds:.1f})" if baseline else ""
+    print(f"{label:<32} {seconds:8.3f}s {rate:14,.0f} righe/s{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT)
+    args = parser.parse_args()
+
+    n = args.records
+    script = load_script(args.script)
+    rng = np.random.default_rng(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_csv = os.path.join(tmp, "old.csv")
+        new_csv = os.path.join(tmp, "new.csv")
+
+        print(f"Record: {n:,}")
+        gen_old = timed(lambda: script.generate_records(n))
+        gen_new = timed(lambda: cdr_engine.generate_batch(n, rng=rng))
+        report("generate_records", n, gen_old)
+        report("cdr_engine.generate_batch", n, gen_new, gen_old)
+
+        records = script.generate_records(n)
+        batch = cdr_engine.generate_batch(n, rng=rng)
+        save_old = timed(lambda: script.save_to_csv(records, old_csv))
+        save_new = timed(lambda: cdr_engine.save_to_csv(batch, new_csv))
+        report("generate_records + save_to_csv", n, gen_old + save_old)
+        report("generate_batch + save_to_csv", n, gen_new + save_new, gen_old + save_old)
+
+        with open(old_csv) as f_old, open(new_csv) as f_new:
+            assert f_old.readline() == f_new.readline(), "intestazione CSV diversa"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Motore di generazione CDR a colonne.
+
+Invece di costruire un dizionario per ogni cartellino (come fa il
+generate_records degli script generati), genera intere colonne con NumPy
+e converte in testo solo al momento della scrittura.
+
+Uso:
+    from cdr_engine import generate_batch, save_to_csv
+    batch = generate_batch(1_000_000)
+    save_to_csv(batch, "/data/output_20250404133948.csv")
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Costanti e configurazione (stesse liste degli script generati)
+CARRIERS = ["Tata Communications", "Verizon", "BT Wholesale", "Telia Carrier", "Orange International Carriers", "Deutsche Telekom ICSS"]
+COUNTRIES = ["IT:Italy", "FR:France", "DE:Germany", "US:United States", "GB:United Kingdom", "ES:Spain"]
+SELLING_DEST = ["IT_Mobile", "FR_Mobile", "DE_Mobile", "US_Mobile", "GB_Mobile", "ES_Mobile"]
+
+# Destinazioni ad alto costo usate solo dai pattern di frode (IRSF): gli indici
+# country/selling_dest oltre len(COUNTRIES) puntano a queste liste
+HIGH_COST_COUNTRIES = ["CU:Cuba", "SO:Somalia", "TV:Tuvalu", "NR:Nauru"]
+HIGH_COST_SELLING_DEST = ["CU_Premium", "SO_Premium", "TV_Premium", "NR_Premium"]
+
+# Schema a 16 colonne emesso da save_to_csv e letto da csv-to-kafka.conf
+FIELDS = ["tenant", "val_euro", "duration", "economicUnitValue", "other_party_country",
+          "routing_dest", "service_type__desc", "op35", "carrier_in", "carrier_out",
+          "selling_dest", "raw_caller_number", "raw_called_number", "paese_destinazione",
+          "timestamp", "xdrid"]
+
+TENANT = "Sparkle"
+SERVICE_TYPE = "Voice"
+
+# val_euro tra 0.10 e 10.00, duration tra 1 e 3600 secondi
+MIN_CENTS, MAX_CENTS = 10, 1000
+MIN_DURATION, MAX_DURATION = 1, 3600
+
+# Tabelle di lookup: le colonne numeriche hanno pochi valori possibili, quindi
+# il testo si ottiene indicizzando invece di formattare riga per riga
+_AMOUNT_TEXT = np.array([str(c / 100) for c in range(MAX_CENTS + 1)], dtype=object)
+_DURATION_TEXT = np.array([str(d) for d in range(MAX_DURATION + 1)], dtype=object)
+_MS_TEXT = np.array([f".{ms:03d}" for ms in range(1000)], dtype=object)
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_UUID_HEX_SLICES = [(0, 8, 0), (9, 13, 8), (14, 18, 12), (19, 23, 16), (24, 36, 20)]
+
+
+def _lookup(values):
+    return np.array(values, dtype=object)
+
+
+def _country_parts():
+    codes, names = zip(*(c.split(":") for c in COUNTRIES + HIGH_COST_COUNTRIES))
+    return _lookup(codes), _lookup(names)
+
+
+@dataclass
+class CdrBatch:
+    """Blocco di cartellini memorizzato per colonne.
+
+    Le colonne categoriche sono indici nelle liste CARRIERS/COUNTRIES/SELLING_DEST,
+    i numeri sono array di byte a 12 cifre, gli istanti sono millisecondi epoch UTC.
+    labels, se presente, indica per ogni riga il pattern di frode iniettato
+    ("" per il traffico normale); non fa parte del CSV.
+    """
+    val_cents: np.ndarray
+    duration: np.ndarray
+    country: np.ndarray
+    carrier_in: np.ndarray
+    carrier_out: np.ndarray
+    selling_dest: np.ndarray
+    raw_caller_number: np.ndarray
+    raw_called_number: np.ndarray
+    event_ms: np.ndarray
+    xdrid: np.ndarray
+    utc_offset_s: int = 0
+    labels: np.ndarray = None
+
+    def __len__(self):
+        return len(self.event_ms)
+
+
+def random_numbers(rng, n):
+    """n numeri telefonici casuali di 12 cifre come array di byte (dtype S12)."""
+    digits = rng.integers(ord("0"), ord("9") + 1, size=(n, 12), dtype=np.uint8)
+    return digits.view("S12").ravel()
+
+
+def random_uuids(rng, n):
+    """n UUID versione 4 come array di byte (dtype S36), generati in blocco."""
+    raw = np.frombuffer(rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+
+    hex_digits = np.empty((n, 32), dtype=np.uint8)
+    hex_digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    hex_digits[:, 1::2] = _HEX_DIGITS[raw & 0x0F]
+
+    out = np.full((n, 36), ord("-"), dtype=np.uint8)
+    for start, end, src in _UUID_HEX_SLICES:
+        out[:, start:end] = hex_digits[:, src:src + end - start]
+    return out.view("S36").ravel()
+
+
+def generate_batch(num_records, rng=None, base_time=None, spread_seconds=60.0):
+    """Genera num_records cartellini casuali con distribuzione uniforme.
+
+    I timestamp sono ordinati e distribuiti in [base_time, base_time + spread_seconds).
+    base_time deve avere un fuso orario; di default è l'istante corrente locale.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    n = int(num_records)
+
+    base_ms = int(base_time.timestamp() * 1000)
+    offsets = np.sort(rng.integers(0, max(int(spread_seconds * 1000), 1), size=n))
+
+    return CdrBatch(
+        val_cents=rng.integers(MIN_CENTS, MAX_CENTS + 1, size=n, dtype=np.int16),
+        duration=rng.integers(MIN_DURATION, MAX_DURATION + 1, size=n, dtype=np.int16),
+        country=rng.integers(0, len(COUNTRIES), size=n, dtype=np.uint8),
+        carrier_in=rng.integers(0, len(CARRIERS), size=n, dtype=np.uint8),
+        carrier_out=rng.integers(0, len(CARRIERS), size=n, dtype=np.uint8),
+        selling_dest=rng.integers(0, len(SELLING_DEST), size=n, dtype=np.uint8),
+        raw_caller_number=random_numbers(rng, n),
+        raw_called_number=random_numbers(rng, n),
+        event_ms=base_ms + offsets,
+        xdrid=random_uuids(rng, n),
+        utc_offset_s=int(base_time.utcoffset().total_seconds()),
+    )
+
+
+def iter_batches(total_records, chunk_size=100_000, rng=None, base_time=None, rate=1000.0):
+    """Genera total_records cartellini a blocchi di chunk_size, uno alla volta.
+
+    Il tempo evento avanza di chunk_size / rate secondi per blocco, quindi
+    rate è il numero medio di chiamate al secondo nel dataset prodotto.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    remaining = int(total_records)
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        spread = n / rate
+        yield generate_batch(n, rng=rng, base_time=base_time, spread_seconds=spread)
+        base_time += timedelta(seconds=spread)
+        remaining -= n
+
+
+def concat_batches(batches):
+    """Unisce più blocchi in uno solo ordinato per istante evento."""
+    batches = list(batches)
+    order = np.argsort(np.concatenate([b.event_ms for b in batches]), kind="stable")
+    columns = {}
+    for name in ("val_cents", "duration", "country", "carrier_in", "carrier_out", "selling_dest",
+                 "raw_caller_number", "raw_called_number", "event_ms", "xdrid"):
+        columns[name] = np.concatenate([getattr(b, name) for b in batches])[order]
+    labels = np.concatenate([b.labels if b.labels is not None else np.full(len(b), "", dtype=object)
+                             for b in batches])[order]
+    return CdrBatch(**columns, utc_offset_s=batches[0].utc_offset_s, labels=labels)
+
+
+def _offset_suffix(utc_offset_s):
+    sign = "+" if utc_offset_s >= 0 else "-"
+    hours, minutes = divmod(abs(utc_offset_s) // 60, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def format_timestamps(event_ms, utc_offset_s=0):
+    """Timestamp ISO8601 con fuso, es. '2025-03-26T17:20:10.000+02:00'.
+
+    Formatta con NumPy solo i secondi distinti e aggiunge i millisecondi via lookup.
+    """
+    local_ms = np.asarray(event_ms, dtype=np.int64) + utc_offset_s * 1000
+    seconds, millis = np.divmod(local_ms, 1000)
+    unique_seconds, inverse = np.unique(seconds, return_inverse=True)
+    second_text = np.datetime_as_string(unique_seconds.astype("datetime64[s]"), unit="s").astype(object)
+    return second_text[inverse] + _MS_TEXT[millis] + _offset_suffix(utc_offset_s)
+
+
+def batch_columns(batch):
+    """Colonne testuali del blocco nell'ordine di FIELDS (liste di str)."""
+    n = len(batch)
+    codes, names = _country_parts()
+    carriers = _lookup(CARRIERS)
+    dests = _lookup(SELLING_DEST + HIGH_COST_SELLING_DEST)
+
+    amount = _AMOUNT_TEXT[batch.val_cents].tolist()
+    dest = dests[batch.selling_dest].tolist()
+    return [
+        [TENANT] * n,
+        amount,
+        _DURATION_TEXT[batch.duration].tolist(),
+        amount,
+        codes[batch.country].tolist(),
+        dest,
+        [SERVICE_TYPE] * n,
+        [""] * n,
+        carriers[batch.carrier_in].tolist(),
+        carriers[batch.carrier_out].tolist(),
+        dest,
+        batch.raw_caller_number.astype("U12").tolist(),
+        batch.raw_called_number.astype("U12").tolist(),
+        names[batch.country].tolist(),
+        format_timestamps(batch.event_ms, batch.utc_offset_s).tolist(),
+        batch.xdrid.astype("U36").tolist(),
+    ]
+
+
+def batch_to_rows(batch):
+    """Righe del blocco come tuple di str nell'ordine di FIELDS."""
+    return zip(*batch_columns(batch))
+
+
+def batch_to_csv(batch):
+    """Testo CSV del blocco, senza intestazione, con newline finale.
+
+    Nessun valore contiene virgole o virgolette, quindi non serve quoting.
+    """
+    if not len(batch):
+        return ""
+    return "\n".join(map(",".join, batch_to_rows(batch))) + "\n"
+
+
+def save_to_csv(batch, filename):
+    """Salva il blocco nel file CSV con la stessa intestazione degli script generati."""
+    with open(filename, "w", newline="") as f:
+        f.write(",".join(FIELDS) + "\n")
+        f.write(batch_to_csv(batch))
+    print(f"File generato: {filename}")
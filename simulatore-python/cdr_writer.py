@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Scrittura CSV in streaming per dataset di grandi dimensioni.
+
+I cartellini vengono generati e scritti un blocco alla volta, quindi la
+memoria resta costante qualunque sia il numero di record. Ogni file viene
+scritto in un file temporaneo nascosto (.output_....tmp) e rinominato solo a
+scrittura completata: l'input `file` di Logstash (path /data/*.csv) non vede
+mai un file a metà.
+
+Uso:
+    python cdr_writer.py --records 50000000 --chunk-size 200000 --out-dir /data
+    python cdr_writer.py --records 50000000 --compression gzip --out-dir /data
+"""
+
+import argparse
+import gzip
+import io
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import cdr_engine
+
+# Estensione aggiunta al nome file per ogni codec supportato
+COMPRESSION_SUFFIX = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _open_compressed(raw, compression):
+    """Incapsula il file binario raw nel codec richiesto, in modalità testo."""
+    if compression is None:
+        stream = raw
+    elif compression == "gzip":
+        # mtime e nome fissi: a parità di contenuto il .gz è identico byte per byte
+        stream = gzip.GzipFile(filename="", fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Compressione zstd non disponibile: installare il pacchetto 'zstandard'")
+        stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    else:
+        raise ValueError(f"Codec di compressione non supportato: {compression}")
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="", write_through=False)
+
+
+@contextmanager
+def atomic_output(path, compression=None):
+    """Apre path in scrittura tramite file temporaneo e rename atomico finale.
+
+    Il file temporaneo sta nella stessa directory (stesso filesystem) e non
+    corrisponde ai pattern *.csv / *.csv.gz letti da Logstash. In caso di
+    errore il temporaneo viene eliminato e path non viene creato.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    raw = open(tmp_path, "wb")
+    try:
+        text = _open_compressed(raw, compression)
+        yield text
+        text.flush()
+        if text.buffer is not raw:
+            text.buffer.close()
+        raw.flush()
+        os.fsync(raw.fileno())
+        raw.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        raw.close()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def write_stream(batches, path, compression=None):
+    """Scrive l'intestazione e poi ogni blocco in path; ritorna i record scritti."""
+    written = 0
+    with atomic_output(path, compression) as f:
+        f.write(",".join(cdr_engine.FIELDS) + "\n")
+        for batch in batches:
+            f.write(cdr_engine.batch_to_csv(batch))
+            written += len(batch)
+    return written
+
+
+def output_filename(out_dir, compression=None, now=None):
+    """Nome file come quello degli script generati: output_YYYYMMDDHHMMSS.csv[.gz|.zst]."""
+    now = now or datetime.now()
+    return os.path.join(out_dir, f"output_{now.strftime('%Y%m%d%H%M%S')}.csv{COMPRESSION_SUFFIX[compression]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, required=True, help="numero totale di cartellini")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="cartellini per blocco")
+    parser.add_argument("--rate", type=float, default=1000.0, help="chiamate al secondo nel tempo evento")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None)
+    parser.add_argument("--out-dir", default="/data")
+    args = parser.parse_args()
+
+    try:
+        print(f"Inizio generazione: {datetime.now()}")
+        os.makedirs(args.out_dir, exist_ok=True)
+        filename = output_filename(args.out_dir, args.compression)
+        batches = cdr_engine.iter_batches(args.records, chunk_size=args.chunk_size, rate=args.rate)
+        written = write_stream(batches, filename, args.compression)
+        print(f"File generato: {filename} ({written} record)")
+    except KeyboardInterrupt:
+        print("\nGenerazione interrotta dall'utente")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
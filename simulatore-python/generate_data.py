@@ -2,7 +2,13 @@
 import os
 import sys
 import google.generativeai as genai
-import tempfile
+from datetime import datetime
+
+from script_runner import GeneratedScript, ScriptError
+
+PREVIEW_RECORDS = 100
+FULL_RECORDS = 5000
+PREVIEW_ROWS_SHOWN = 5
 
 def get_user_prompt():
     print("\n=== Generatore di dati CSV ===")
@@ -21,13 +27,6 @@ def generate_code(prompt, data_dir):
     )
     return response.text.strip().replace("```python", "").replace("```", "")
 
-def save_code(code):
-    # Crea un file temporaneo per il codice Python
-    fd, path = tempfile.mkstemp(suffix='.py', prefix='generator_')
-    with os.fdopen(fd, 'w') as f:
-        f.write(code)
-    return path
-
 def ask_yes_no(question):
     while True:
         response = input(f"\n{question} (y/n): ").lower().strip()
@@ -53,15 +52,22 @@ def main():
             generated_code = generate_code(prompt, data_dir)
             print("\nCodice Python generato con successo!")
 
-            # Salva ed esegui il codice
-            script_path = save_code(generated_code)
-            
-            print(f"\nGenerazione preview in preview_data.csv...")
-            os.system(f"python {script_path}")
-            
-            # Pulisci il file temporaneo
-            os.unlink(script_path)
-
+            # Carica il codice una volta: preview nel processo corrente
+            script = GeneratedScript(generated_code)
+            preview = script.preview(PREVIEW_RECORDS)
+            print(f"\nPreview ({len(preview)} record):")
+            for record in preview[:PREVIEW_ROWS_SHOWN]:
+                print(record)
+
+            # Generazione completa in un processo figlio con timeout e limite di memoria
+            if ask_yes_no("Vuoi generare il dataset completo?"):
+                filename = os.path.join(data_dir, f"output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+                written = script.run(FULL_RECORDS, filename)
+                print(f"\nGenerati {written} record")
+
+        except (ScriptError, TimeoutError) as e:
+            print(f"\nErrore nello script generato: {str(e)}")
+            continue
         except Exception as e:
             print(f"\nErrore: {str(e)}")
             continue
@@ -108,7 +114,12 @@ Il codice deve generare un CSV con i seguenti campi:
     "xdrid": randomico univoco del cartellino'
 }
 
-La funzione generata deve seguire questi passi:
+Il codice deve definire:
+1. generate_records(num_records): ritorna la lista dei record generati
+2. save_to_csv(records, filename, preview=False): se filename non è vuoto salva i record in filename,
+   altrimenti in 'preview_data.csv' (preview) o in `__DATA_DIR__/output_YYYYMMDD_HHMMSS.csv`
+Il chiamante importa il modulo e usa direttamente queste due funzioni; il main serve solo per l'esecuzione
+da riga di comando:
 1. Generare prima una preview di 100 record in 'preview_data.csv'
 2. Chiedere conferma all'utente con "Vuoi generare il dataset completo? (s/n): "
 3. Se confermato con 's', salvare il dataset completo in `__DATA_DIR__/output_YYYYMMDD_HHMMSS.csv`
@@ -140,7 +151,9 @@ def create_dir_if_not_exists(filename):
 
 def save_to_csv(records, filename, preview=False):
     # Determina il percorso del file
-    if preview:
+    if filename:
+        filepath = filename
+    elif preview:
         filepath = "./preview_data.csv"
     else:
         # Usa il timestamp per il nome del file
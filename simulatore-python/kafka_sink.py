@@ -0,0 +1,161 @@
+"""
+Sink diretto verso Kafka per il simulatore.
+
+Pubblica i cartellini sul topic call-data-raw senza passare da file CSV e
+Logstash. I messaggi hanno la stessa forma prodotta da csv-to-kafka.conf
+(stessi nomi di campo, chiave = xdrid, event_timestamp normalizzato in UTC),
+quindi le regole Flink e kafka-to-opensearch.conf non cambiano.
+
+Il trasporto è intercambiabile: ConfluentTransport usa confluent-kafka con
+batch compressi, InMemoryTransport scrive in un broker finto nel processo
+(utile per prove senza Kafka).
+
+Uso:
+    sink = KafkaSink(ConfluentTransport("localhost:9092"))
+    sink.emit(rows)   # righe nell'ordine di cdr_engine.FIELDS
+    sink.close()
+"""
+
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import cdr_engine
+
+TOPIC = "call-data-raw"
+
+# Fuso usato dal filtro date di csv-to-kafka.conf per timestamp senza offset
+DEFAULT_TIMEZONE = ZoneInfo("Europe/Rome")
+
+# Impostazioni del producer orientate al throughput: batch grandi, compressi
+PRODUCER_DEFAULTS = {
+    "linger.ms": 50,
+    "batch.size": 1048576,
+    "compression.type": "lz4",
+    "acks": "1",
+    "queue.buffering.max.messages": 1000000,
+}
+
+_INDEX = {name: i for i, name in enumerate(cdr_engine.FIELDS)}
+
+
+def _utc_iso(dt):
+    return dt.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+@lru_cache(maxsize=65536)
+def normalize_timestamp(value):
+    """Timestamp del CSV in ISO8601 UTC con millisecondi, come il filtro date di Logstash.
+
+    In cache: nei replay e nei dati generati molte righe condividono lo stesso istante.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=DEFAULT_TIMEZONE)
+    return _utc_iso(dt)
+
+
+def _number(value, cast):
+    return cast(value) if value != "" else None
+
+
+def row_to_message(row, ingest_ts):
+    """Documento JSON (come dict) per una riga CSV, con i campi aggiunti da Logstash."""
+    return {
+        "tenant": row[_INDEX["tenant"]],
+        "val_euro": _number(row[_INDEX["val_euro"]], float),
+        "duration": _number(row[_INDEX["duration"]], int),
+        "economicUnitValue": _number(row[_INDEX["economicUnitValue"]], float),
+        "other_party_country": row[_INDEX["other_party_country"]],
+        "routing_dest": row[_INDEX["routing_dest"]],
+        "service_type__desc": row[_INDEX["service_type__desc"]],
+        "op35": row[_INDEX["op35"]],
+        "carrier_in": row[_INDEX["carrier_in"]],
+        "carrier_out": row[_INDEX["carrier_out"]],
+        "selling_dest": row[_INDEX["selling_dest"]],
+        "raw_caller_number": row[_INDEX["raw_caller_number"]],
+        "raw_called_number": row[_INDEX["raw_called_number"]],
+        "paese_destinazione": row[_INDEX["paese_destinazione"]],
+        "event_timestamp": normalize_timestamp(row[_INDEX["timestamp"]]),
+        "xdrid": row[_INDEX["xdrid"]],
+        "event_type": "call_record",
+        "kafka_timestamp": ingest_ts,
+        "@timestamp": ingest_ts,
+    }
+
+
+class InMemoryBroker:
+    """Broker finto: per ogni topic la lista dei messaggi (key, value) ricevuti."""
+
+    def __init__(self):
+        self.topics = defaultdict(list)
+
+    def messages(self, topic=TOPIC):
+        return [(key, json.loads(value)) for key, value in self.topics[topic]]
+
+
+class InMemoryTransport:
+    """Trasporto che consegna subito i messaggi a un InMemoryBroker."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def produce(self, topic, key, value):
+        self.broker.topics[topic].append((key, value))
+
+    def flush(self):
+        return 0
+
+
+class ConfluentTransport:
+    """Trasporto su confluent-kafka con le impostazioni di PRODUCER_DEFAULTS."""
+
+    def __init__(self, bootstrap_servers, **config):
+        try:
+            from confluent_kafka import Producer
+        except ImportError:
+            raise ValueError("Sink Kafka non disponibile: installare il pacchetto 'confluent-kafka'")
+        self.errors = 0
+        self.producer = Producer({"bootstrap.servers": bootstrap_servers, **PRODUCER_DEFAULTS, **config})
+
+    def _on_delivery(self, err, msg):
+        if err is not None:
+            self.errors += 1
+
+    def produce(self, topic, key, value):
+        while True:
+            try:
+                self.producer.produce(topic, key=key, value=value, on_delivery=self._on_delivery)
+                break
+            except BufferError:
+                # Coda locale piena: attende che i batch in volo vengano consegnati
+                self.producer.poll(0.1)
+        self.producer.poll(0)
+
+    def flush(self):
+        remaining = self.producer.flush()
+        if self.errors:
+            raise RuntimeError(f"{self.errors} messaggi non consegnati a Kafka")
+        return remaining
+
+
+class KafkaSink:
+    """Sink compatibile con replay.RotatingCsvSink che pubblica su Kafka."""
+
+    def __init__(self, transport, topic=TOPIC):
+        self.transport = transport
+        self.topic = topic
+        self.sent = 0
+
+    def emit(self, rows):
+        ingest_ts = _utc_iso(datetime.now(timezone.utc))
+        produce = self.transport.produce
+        for row in rows:
+            message = row_to_message(row, ingest_ts)
+            produce(self.topic, message["xdrid"].encode(), json.dumps(message, separators=(",", ":")).encode())
+        self.sent += len(rows)
+
+    def close(self):
+        self.transport.flush()
@@ -0,0 +1,233 @@
+"""
+Generatori parametrici dei pattern di frode più usati.
+
+Ogni pattern inietta nel traffico normale di cdr_engine una quota di
+cartellini fraudolenti, marcati nella colonna labels del blocco:
+
+    burst_caller  un caller che chiama molti numeri diversi in pochi minuti
+    wangiri       squilli brevissimi da un numero estero verso molti numeri
+    irsf          chiamate lunghe e costose verso destinazioni ad alto costo
+    simbox        poche SIM che terminano molto traffico entrante (fan-in)
+
+match_prompt riconosce questi pattern nelle richieste in linguaggio naturale
+del simulatore, così server.py può evitare la chiamata a Gemini;
+render_script produce uno script con la stessa interfaccia di quelli generati.
+"""
+
+import csv
+import re
+from datetime import datetime
+
+import numpy as np
+
+import cdr_engine
+
+DEFAULT_RECORDS = 5000
+
+
+def _fraud_rows(rng, n, base_time, spread_seconds, label):
+    """Blocco di n righe casuali marcate con label, da personalizzare per colonna."""
+    batch = cdr_engine.generate_batch(n, rng=rng, base_time=base_time, spread_seconds=spread_seconds)
+    batch.labels = np.full(n, label, dtype=object)
+    return batch
+
+
+def _fixed_number(rng, prefix=""):
+    digits = cdr_engine.random_numbers(rng, 1)[0].decode()
+    return (prefix + digits)[:12].encode()
+
+
+def burst_caller(num_records, rng=None, base_time=None, callers=1, calls_per_caller=20, window_seconds=120):
+    """callers numeri che chiamano ciascuno calls_per_caller numeri distinti in window_seconds."""
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    fraud_n = min(callers * calls_per_caller, num_records)
+    normal = cdr_engine.generate_batch(num_records - fraud_n, rng=rng, base_time=base_time)
+
+    fraud = _fraud_rows(rng, fraud_n, base_time, window_seconds, "burst_caller")
+    caller_pool = np.array([_fixed_number(rng) for _ in range(callers)])
+    fraud.raw_caller_number = np.repeat(caller_pool, calls_per_caller)[:fraud_n]
+    return cdr_engine.concat_batches([normal, fraud])
+
+
+def wangiri(num_records, rng=None, base_time=None, share=0.2, max_duration=3, caller_prefix="882"):
+    """Un numero estero (prefisso caller_prefix) che fa squilli di pochi secondi a molti numeri."""
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    fraud_n = int(num_records * share)
+    normal = cdr_engine.generate_batch(num_records - fraud_n, rng=rng, base_time=base_time)
+
+    fraud = _fraud_rows(rng, fraud_n, base_time, 60.0, "wangiri")
+    fraud.raw_caller_number = np.full(fraud_n, _fixed_number(rng, caller_prefix))
+    fraud.duration = rng.integers(1, max_duration + 1, size=fraud_n, dtype=np.int16)
+    fraud.val_cents = np.full(fraud_n, cdr_engine.MIN_CENTS, dtype=np.int16)
+    return cdr_engine.concat_batches([normal, fraud])
+
+
+def irsf(num_records, rng=None, base_time=None, share=0.1, callers=3, min_duration=1800):
+    """Pochi caller con chiamate lunghe e costose verso le destinazioni HIGH_COST_*."""
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    fraud_n = int(num_records * share)
+    normal = cdr_engine.generate_batch(num_records - fraud_n, rng=rng, base_time=base_time)
+
+    fraud = _fraud_rows(rng, fraud_n, base_time, 60.0, "irsf")
+    destination = len(cdr_engine.COUNTRIES) + rng.integers(0, len(cdr_engine.HIGH_COST_COUNTRIES),
+                                                           size=fraud_n, dtype=np.uint8)
+    caller_pool = np.array([_fixed_number(rng) for _ in range(callers)])
+    fraud.raw_caller_number = caller_pool[rng.integers(0, callers, size=fraud_n)]
+    fraud.country = destination
+    fraud.selling_dest = destination
+    fraud.duration = rng.integers(min_duration, cdr_engine.MAX_DURATION + 1, size=fraud_n, dtype=np.int16)
+    fraud.val_cents = rng.integers(800, cdr_engine.MAX_CENTS + 1, size=fraud_n, dtype=np.int16)
+    return cdr_engine.concat_batches([normal, fraud])
+
+
+def simbox(num_records, rng=None, base_time=None, share=0.3, sims=8, caller_prefix="39", carrier_in=0):
+    """sims numeri locali che terminano traffico entrante da un solo carrier_in verso molti numeri."""
+    rng = rng if rng is not None else np.random.default_rng()
+    base_time = base_time if base_time is not None else datetime.now().astimezone()
+    fraud_n = int(num_records * share)
+    normal = cdr_engine.generate_batch(num_records - fraud_n, rng=rng, base_time=base_time)
+
+    fraud = _fraud_rows(rng, fraud_n, base_time, 60.0, "simbox")
+    sim_pool = np.array([_fixed_number(rng, caller_prefix) for _ in range(sims)])
+    fraud.raw_caller_number = sim_pool[rng.integers(0, sims, size=fraud_n)]
+    fraud.carrier_in = np.full(fraud_n, carrier_in, dtype=np.uint8)
+    fraud.country = np.zeros(fraud_n, dtype=np.uint8)
+    fraud.selling_dest = np.zeros(fraud_n, dtype=np.uint8)
+    return cdr_engine.concat_batches([normal, fraud])
+
+
+PATTERNS = {
+    "burst_caller": burst_caller,
+    "wangiri": wangiri,
+    "irsf": irsf,
+    "simbox": simbox,
+}
+
+
+def generate(pattern, num_records, seed=None, **params):
+    """Blocco di num_records cartellini per il pattern richiesto."""
+    return PATTERNS[pattern](num_records, rng=np.random.default_rng(seed), **params)
+
+
+def generate_records(pattern, num_records, seed=None, **params):
+    """Come generate ma ritorna una lista di dizionari, come gli script generati."""
+    batch = generate(pattern, num_records, seed=seed, **params)
+    return [dict(zip(cdr_engine.FIELDS, row)) for row in cdr_engine.batch_to_rows(batch)]
+
+
+def save_labels(batch, filename):
+    """Salva le righe fraudolente iniettate (xdrid, caller, pattern) in filename.
+
+    Usare un nome che non finisca in .csv (es. <file>.csv.labels), altrimenti
+    Logstash lo leggerebbe come un file di cartellini.
+    """
+    mask = batch.labels != ""
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["xdrid", "raw_caller_number", "pattern"])
+        writer.writerows(zip(batch.xdrid[mask].astype("U36"),
+                             batch.raw_caller_number[mask].astype("U12"),
+                             batch.labels[mask]))
+
+
+# Riconoscimento dei pattern nelle richieste in linguaggio naturale
+
+_RECORDS_RE = re.compile(r"(\d+)\s*(?:chiamate|record|cartellini|righe)")
+_BURST_RE = re.compile(r"chiama\w*\s+(\d+)\s+(?:numeri|called|chiamati)\D+?(\d+)\s*(minut|second)")
+_KEYWORDS = [
+    ("wangiri", re.compile(r"wangiri|one[\s-]?ring|squill")),
+    ("irsf", re.compile(r"\birsf\b|alto costo|high[\s-]?cost|premium")),
+    ("simbox", re.compile(r"sim[\s-]?box|fan[\s-]?in")),
+    ("burst_caller", re.compile(r"\bburst\b|raffica")),
+]
+
+
+# Parole che non aggiungono vincoli al pattern. Qualunque altra parola (paese,
+# carrier, "ogni N secondi", orari, ...) esprime un vincolo che i parametri del
+# template non coprono e la richiesta passa al modello.
+_FILLER = set("""
+a ad al alla alle allo agli ai anche che ci con crea creare csv da dal dalla dati dataset del della delle dei
+di e ed file fraud frode fraudolente fraudolenti fraudolento fraudolenta genera generare generami il in la le
+lo gli i mi nel nella normale normali o pattern per piu simula simulare simulazione tipo traffico tra un
+una uno verso voglio vorrei caso esempio chiamate squilli brevi brevissimi breve lunghe costose molti numeri
+estero estere numero destinazioni caller sim box
+a an and calls call create fake for generate generation give me of please records simulate some the to with
+""".split())
+
+
+def _unmatched_words(text, matches):
+    """Parole di text che non rientrano in nessuno dei match riconosciuti."""
+    spans = [m.span() for m in matches if m]
+    return [w.group() for w in re.finditer(r"\w+", text)
+            if w.group() not in _FILLER and not any(w.start() < end and start < w.end() for start, end in spans)]
+
+
+def match_prompt(prompt):
+    """Ritorna (pattern, num_records, params) se il prompt descrive un pattern noto, altrimenti None.
+
+    Ritorna None anche quando il prompt contiene vincoli che il template non
+    sa esprimere (destinazioni, carrier, periodicità, fasce orarie, ...).
+    """
+    text = " ".join(prompt.lower().split())
+    records = _RECORDS_RE.search(text)
+    num_records = int(records.group(1)) if records else DEFAULT_RECORDS
+
+    burst = _BURST_RE.search(text)
+    if burst:
+        if _unmatched_words(text, [records, burst]):
+            return None
+        window = int(burst.group(2)) * (60 if burst.group(3) == "minut" else 1)
+        return "burst_caller", num_records, {"calls_per_caller": int(burst.group(1)), "window_seconds": window}
+    for pattern, regex in _KEYWORDS:
+        if regex.search(text):
+            if _unmatched_words(text, [records, *(m for _, r in _KEYWORDS for m in r.finditer(text))]):
+                return None
+            return pattern, num_records, {}
+    return None
+
+
+_SCRIPT_TEMPLATE = '''import os
+import sys
+from datetime import datetime
+
+# Il simulatore è in {simulator_dir!r} nel container; dall'host lo script
+# (in ./data) lo trova nella cartella simulatore-python accanto
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _dir in (os.getenv("SIMULATOR_DIR", ""), {simulator_dir!r}, os.path.join(_HERE, "..", "simulatore-python")):
+    if _dir and os.path.exists(os.path.join(_dir, "cdr_engine.py")):
+        sys.path.insert(0, _dir)
+        break
+import cdr_engine
+import patterns
+
+# Script generato dal template "{pattern}" (nessuna chiamata al modello)
+PATTERN = {pattern!r}
+PARAMS = {params!r}
+NUM_RECORDS = {num_records!r}
+DATA_DIR = {data_dir!r} if os.path.isdir({data_dir!r}) else _HERE
+
+
+def generate_records(num_records):
+    return patterns.generate_records(PATTERN, num_records, **PARAMS)
+
+
+def main():
+    print(f"Inizio generazione: {{datetime.now()}}")
+    batch = patterns.generate(PATTERN, NUM_RECORDS, **PARAMS)
+    filename = os.path.join(DATA_DIR, f"output{{datetime.now().strftime('%Y%m%d%H%M%S')}}.csv")
+    patterns.save_labels(batch, filename + ".labels")
+    cdr_engine.save_to_csv(batch, filename)
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def render_script(pattern, num_records, params, simulator_dir, data_dir="/data"):
+    """Testo dello script per il pattern; importa cdr_engine/patterns da simulator_dir."""
+    return _SCRIPT_TEMPLATE.format(pattern=pattern, params=params, num_records=num_records,
+                                   simulator_dir=simulator_dir, data_dir=data_dir)
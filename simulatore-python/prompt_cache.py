@@ -0,0 +1,79 @@
+"""
+Cache su disco del codice generato da Gemini, indicizzata per prompt normalizzato.
+
+La chiave è lo SHA-256 del prompt normalizzato (minuscolo, spazi compattati,
+punteggiatura finale rimossa) e della versione del contesto: se CONTEXT cambia,
+le vecchie voci non vengono più usate. Ogni voce è un file JSON in directory,
+quindi la cache sopravvive ai riavvii del container.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+
+def normalize_prompt(prompt):
+    """Forma canonica del prompt: due richieste equivalenti danno la stessa stringa."""
+    return " ".join(prompt.lower().split()).rstrip(" .!?;:")
+
+
+def context_version(context):
+    """Impronta breve del contesto passato al modello."""
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+
+class PromptCache:
+    """Voci {code, preview_code, prompt, created_at} salvate in directory/<chiave>.json."""
+
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.version = context_version(context)
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, prompt):
+        payload = f"{self.version}\0{normalize_prompt(prompt)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, prompt):
+        """Voce in cache per il prompt, oppure None."""
+        key = self.key(prompt)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and os.path.exists(self._path(key)):
+                with open(self._path(key)) as f:
+                    entry = json.load(f)
+                self._memory[key] = entry
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, prompt, code, preview_code):
+        """Salva il codice generato per il prompt (scrittura atomica del file)."""
+        key = self.key(prompt)
+        entry = {
+            "prompt": normalize_prompt(prompt),
+            "code": code,
+            "preview_code": preview_code,
+            "created_at": datetime.now().isoformat(),
+        }
+        tmp_path = self._path(key) + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+            self._memory[key] = entry
+        return entry
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(os.listdir(self.directory))}
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Replay dei cartellini a ritmo costante per test di throughput sostenuto.
+
+Il pattern "periodico" degli script generati (time.sleep tra un batch e
+l'altro) produce raffiche; qui i record vengono emessi a un rate fisso
+(es. 20000 CDR/s) tramite un token bucket alimentato dal clock monotono, così
+gli errori dei singoli sleep non si accumulano nel tempo. I record sono scritti
+in file CSV ruotati a blocchi (rename atomico in /data), oppure pubblicati
+direttamente su Kafka (--sink kafka, vedi kafka_sink.py); a fine corsa viene
+riportato il rate ottenuto.
+
+Sorgenti:
+    --input FILE   CSV esistenti (anche .gz/.zst), es. output20250327220646.csv_ori
+    --generate     cartellini nuovi dal motore cdr_engine
+
+Uso:
+    python replay.py --rate 20000 --input ../output20250327220646.csv_ori --out-dir /data
+    python replay.py --rate 20000 --generate --duration 300 --out-dir /data
+    python replay.py --rate 0 --generate --records 10000000 --sink kafka --bootstrap-servers localhost:9092
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import os
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+import cdr_engine
+import cdr_writer
+import kafka_sink
+
+TIMESTAMP_COLUMN = cdr_engine.FIELDS.index("timestamp")
+
+
+class TokenBucket:
+    """Token bucket con rate costante e capacità massima burst.
+
+    I token maturano in base al tempo monotono trascorso davvero, non alla
+    durata richiesta agli sleep: se uno sleep dura di più, il ritardo viene
+    recuperato al giro successivo (fino a burst token).
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate / 10, 1))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = 0.0
+        self.last = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, n):
+        """Blocca finché non sono disponibili n token e li consuma."""
+        self._refill()
+        while self.tokens < n:
+            self.sleep((n - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= n
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    if path.endswith(".zst"):
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), newline="")
+    return open(path, newline="")
+
+
+def iter_csv_rows(paths):
+    """Righe (liste di str nell'ordine di FIELDS) dai CSV indicati, in sequenza."""
+    for path in paths:
+        with _open_text(path) as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header != cdr_engine.FIELDS:
+                raise ValueError(f"{path}: intestazione diversa dallo schema a 16 colonne")
+            yield from reader
+
+
+def iter_generated_rows(chunk_size=10_000):
+    """Sequenza infinita di righe nuove generate da cdr_engine.
+
+    Blocchi piccoli: la generazione di un blocco non deve superare il burst
+    del token bucket, altrimenti il ritardo non viene più recuperato.
+    """
+    while True:
+        yield from batch_rows(cdr_engine.generate_batch(chunk_size))
+
+
+def batch_rows(batch):
+    return map(list, cdr_engine.batch_to_rows(batch))
+
+
+class RotatingCsvSink:
+    """Scrive le righe in file output_<ts>_<n>.csv ruotati per numero di righe o età.
+
+    Ogni file è scritto con cdr_writer.atomic_output e compare in out_dir solo
+    quando viene chiuso.
+    """
+
+    def __init__(self, out_dir, rotate_rows=100_000, rotate_seconds=5.0, compression=None):
+        self.out_dir = out_dir
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        self.files = 0
+        self._stack = None
+        self._writer = None
+        self._rows = 0
+        self._opened_at = 0.0
+
+    def _open(self):
+        run_ts = datetime.now().strftime("%Y%m%d%H%M%S")
+        suffix = cdr_writer.COMPRESSION_SUFFIX[self.compression]
+        path = os.path.join(self.out_dir, f"output_{run_ts}_{self.files:06d}.csv{suffix}")
+        self._stack = ExitStack()
+        f = self._stack.enter_context(cdr_writer.atomic_output(path, self.compression))
+        self._writer = csv.writer(f, lineterminator="\n")
+        self._writer.writerow(cdr_engine.FIELDS)
+        self._rows = 0
+        self._opened_at = time.monotonic()
+
+    def _rotate(self):
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+            self.files += 1
+
+    def emit(self, rows):
+        if self._stack is not None and time.monotonic() - self._opened_at >= self.rotate_seconds:
+            self._rotate()
+        if self._stack is None:
+            self._open()
+        self._writer.writerows(rows)
+        self._rows += len(rows)
+        if self._rows >= self.rotate_rows:
+            self._rotate()
+
+    def close(self):
+        self._rotate()
+
+
+def _now_iso():
+    return datetime.now().astimezone().isoformat(timespec="milliseconds")
+
+
+def replay(rows, sink, rate, max_records=None, duration=None, retime=True, tick=0.01, report_every=5.0):
+    """Emette rows su sink a rate record/s; ritorna (record emessi, secondi trascorsi).
+
+    I record sono inviati a micro-batch di rate * tick righe. Con retime il
+    timestamp di ogni riga diventa l'istante di emissione, così la latenza
+    della pipeline si misura rispetto all'invio. Con rate 0 non c'è
+    limite: i record sono emessi alla massima velocità possibile.
+    """
+    batch_size = max(1, int(rate * tick)) if rate > 0 else 10_000
+    bucket = TokenBucket(rate, burst=batch_size * 10) if rate > 0 else None
+    rows = iter(rows) if max_records is None else itertools.islice(rows, max_records)
+
+    start = last_report = time.monotonic()
+    emitted = reported = 0
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            if bucket is not None:
+                bucket.acquire(len(chunk))
+            if retime:
+                now = _now_iso()
+                for row in chunk:
+                    row[TIMESTAMP_COLUMN] = now
+            sink.emit(chunk)
+            emitted += len(chunk)
+
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                print(f"Rate: {(emitted - reported) / (now - last_report):,.0f} CDR/s (totale {emitted:,})")
+                last_report, reported = now, emitted
+    finally:
+        sink.close()
+    return emitted, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", action="append", help="CSV da riprodurre (ripetibile)")
+    source.add_argument("--generate", action="store_true", help="genera cartellini nuovi")
+    parser.add_argument("--rate", type=float, required=True, help="record al secondo (0 = senza limite)")
+    parser.add_argument("--records", type=int, default=None, help="ferma dopo N record")
+    parser.add_argument("--duration", type=float, default=None, help="ferma dopo N secondi")
+    parser.add_argument("--keep-timestamps", action="store_true", help="non riscrivere il timestamp")
+    parser.add_argument("--rotate-rows", type=int, default=100_000)
+    parser.add_argument("--rotate-seconds", type=float, default=5.0)
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None)
+    parser.add_argument("--out-dir", default="/data")
+    parser.add_argument("--sink", choices=["csv", "kafka"], default="csv")
+    parser.add_argument("--bootstrap-servers", default="kafka:29092")
+    parser.add_argument("--topic", default=kafka_sink.TOPIC)
+    args = parser.parse_args()
+
+    if args.generate and args.records is None and args.duration is None:
+        parser.error("con --generate specificare --records o --duration")
+
+    rows = iter_csv_rows(args.input) if args.input else iter_generated_rows()
+    if args.sink == "kafka":
+        sink = kafka_sink.KafkaSink(kafka_sink.ConfluentTransport(args.bootstrap_servers), args.topic)
+    else:
+        os.makedirs(args.out_dir, exist_ok=True)
+        sink = RotatingCsvSink(args.out_dir, args.rotate_rows, args.rotate_seconds, args.compression)
+
+    print(f"Inizio replay: {datetime.now()} a {args.rate:,.0f} CDR/s")
+    try:
+        emitted, elapsed = replay(rows, sink, args.rate, max_records=args.records,
+                                  duration=args.duration, retime=not args.keep_timestamps)
+    except KeyboardInterrupt:
+        print("\nReplay interrotto dall'utente")
+        sys.exit(0)
+    achieved = emitted / elapsed if elapsed else 0.0
+    target = f"{args.rate:,.0f}" if args.rate > 0 else "illimitato"
+    destination = f"{sink.files} file" if args.sink == "csv" else f"topic {args.topic}"
+    print(f"Replay completato: {emitted:,} record in {elapsed:.1f}s, "
+          f"rate ottenuto {achieved:,.0f} CDR/s (target {target}), {destination}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Esecuzione in-process degli script generati da Gemini.
+
+Il codice generato viene caricato una sola volta come modulo (senza eseguire
+il suo main). La preview chiama direttamente generate_records con pochi record
+nel processo corrente, quindi costa millisecondi invece dell'avvio di un
+interprete. La generazione completa gira in un processo figlio, con timeout e
+limite di memoria. Il figlio non è un fork del processo corrente, che ha già i
+thread di grpc/google-generativeai: viene creato dal forkserver (spawn dove non
+c'è) e ricompila il codice dello script.
+
+Uso:
+    script = GeneratedScript(code)
+    records = script.preview(100)
+    script.run(5000, "/data/output_20250404133948.csv", timeout=600, memory_limit_mb=2048)
+"""
+
+import multiprocessing
+import resource
+import traceback
+import types
+
+
+class ScriptError(Exception):
+    """Errore sollevato dallo script generato o dal processo che lo esegue."""
+
+
+def load_module(code, name="generated_script"):
+    """Compila ed esegue code in un nuovo modulo; il blocco __main__ non viene eseguito."""
+    module = types.ModuleType(name)
+    module.__file__ = f"<{name}>"
+    exec(compile(code, module.__file__, "exec"), module.__dict__)
+    for required in ("generate_records", "save_to_csv"):
+        if not callable(getattr(module, required, None)):
+            raise ScriptError(f"Lo script generato non definisce {required}()")
+    return module
+
+
+def _data_size():
+    """Byte del segmento dati (heap) del processo corrente, 0 se non disponibile."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _start_method():
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _run_child(code, name, num_records, filename, memory_limit_mb, conn):
+    """Corpo del processo figlio: carica lo script, applica il limite di memoria, genera e salva."""
+    try:
+        module = load_module(code, name)
+        if memory_limit_mb:
+            # RLIMIT_DATA conta heap e mmap anonimi, non le librerie mappate: il limite
+            # vale per la memoria allocata dallo script oltre a quella già in uso
+            limit = _data_size() + memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+        records = module.generate_records(num_records)
+        module.save_to_csv(records, filename)
+        conn.send(("ok", len(records)))
+    except MemoryError:
+        conn.send(("error", f"Limite di memoria di {memory_limit_mb} MB superato"))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class GeneratedScript:
+    """Script generato caricato una volta e riusato per preview e generazione completa."""
+
+    def __init__(self, code, name="generated_script"):
+        self.code = code
+        self.name = name
+        self.module = load_module(code, name)
+
+    def preview(self, num_records=100):
+        """Record di preview generati nel processo corrente."""
+        return self.module.generate_records(num_records)
+
+    def run(self, num_records, filename, timeout=600, memory_limit_mb=2048):
+        """Genera num_records record e li salva in filename in un processo figlio.
+
+        Ritorna il numero di record generati. Solleva ScriptError se lo script
+        fallisce o supera il limite di memoria, TimeoutError se supera timeout
+        secondi (il processo figlio viene terminato).
+        """
+        ctx = multiprocessing.get_context(_start_method())
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_run_child,
+                              args=(self.code, self.name, num_records, filename, memory_limit_mb, child_conn))
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(timeout):
+                raise TimeoutError(f"Generazione interrotta dopo {timeout} secondi")
+            status, detail = parent_conn.recv()
+        except EOFError:
+            process.join(5)
+            raise ScriptError(f"Il processo di generazione è terminato con codice {process.exitcode}")
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            parent_conn.close()
+
+        if status != "ok":
+            raise ScriptError(detail)
+        return detail
@@ -1,4 +1,4 @@
-# pip install flask google-generativeai
+# pip install flask google-generativeai (modalità ASGI: starlette uvicorn)
 
 # Workflow:
 # 1. Genera il codice Python:
@@ -15,6 +15,14 @@
 # - Pattern normale: {"rule": "Genera un CSV con 5000 chiamate normali randomiche"}
 # - Pattern periodico: {"rule": "Genera un CSV ogni 5 secondi con chiamate normali"}
 # - Pattern fraudolento: {"rule": "CSV con caller che chiama 20 numeri in 2 minuti"}
+#
+# I pattern noti (burst caller, wangiri, IRSF, SIM box: vedi patterns.py) sono
+# generati da template senza chiamare Gemini; le altre richieste passano dal
+# modello una sola volta e poi vengono servite dalla cache in /data/.prompt_cache.
+#
+# Con SERVER_MODE=asgi il server gira su uvicorn: al massimo GENERATION_CONCURRENCY
+# chiamate a Gemini in parallelo, richieste uguali in corso condividono la stessa
+# chiamata, oltre GENERATION_QUEUE richieste in attesa la risposta è 429.
 
 from flask import Flask, request, jsonify
 import google.generativeai as genai
@@ -24,8 +32,15 @@ import random
 import datetime
 import pytz
 
+import patterns
+from prompt_cache import PromptCache
+
 app = Flask(__name__)
 
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv('DATA_DIR', '/data')
+PREVIEW_RECORDS = 100
+
 # Imposta la chiave API di Gemini da variabile d'ambiente
 GENAI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GENAI_API_KEY:
@@ -147,31 +162,63 @@ if __name__ == "__main__":
 Rispondi solo con il codice Python, senza testo aggiuntivo.
 """
 
-@app.route("/generate_code", methods=["POST"])
-def generate_code():
-    try:
-        # Get request
-        user_request = request.json.get("rule", "")
-        if not user_request:
-            return jsonify({"error": "Missing 'rule' parameter"}), 400
+prompt_cache = PromptCache(os.path.join(DATA_DIR, '.prompt_cache'), CONTEXT)
+
+
+# Modalità di servizio: "flask" (server di sviluppo) oppure "asgi" (uvicorn, chiamate a Gemini
+# concorrenti con limite, richieste identiche in corso unificate e 429 oltre la coda)
+SERVER_MODE = os.getenv('SERVER_MODE', 'flask')
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '4'))
+GENERATION_QUEUE = int(os.getenv('GENERATION_QUEUE', '16'))
+GENERATION_QUEUE_TIMEOUT = float(os.getenv('GENERATION_QUEUE_TIMEOUT', '30'))
+
+
+def known_scripts(user_request):
+    """(codice completo, codice preview, origine) da template o cache, oppure None."""
+    matched = patterns.match_prompt(user_request)
+    if matched:
+        pattern, num_records, params = matched
+        return (patterns.render_script(pattern, num_records, params, SIMULATOR_DIR, DATA_DIR),
+                patterns.render_script(pattern, PREVIEW_RECORDS, params, SIMULATOR_DIR, DATA_DIR),
+                "template")
+
+    cached = prompt_cache.get(user_request)
+    if cached:
+        return cached["code"], cached["preview_code"], "cache"
+    return None
+
+
+def generate_scripts(user_request):
+    """Chiamata (bloccante) a Gemini; salva il risultato in cache."""
+    response = genai.GenerativeModel('gemini-2.0-flash').generate_content(
+        f"{CONTEXT}\n\nRichiesta: {user_request}"
+    )
+    generated_code = response.text.strip().replace("```python", "").replace("```", "")
+    preview_code = generated_code.replace("num_records=5000", f"num_records={PREVIEW_RECORDS}")
+    prompt_cache.put(user_request, generated_code, preview_code)
+    return generated_code, preview_code, "model"
+
+
+def build_scripts(user_request):
+    """Ritorna (codice completo, codice preview, origine) per la richiesta.
 
-        # Call Gemini
-        response = genai.GenerativeModel('gemini-2.0-flash').generate_content(
-            f"{CONTEXT}\n\nRichiesta: {user_request}"
-        )
+    Origine: "template" per i pattern noti, "cache" se la richiesta è già
+    stata generata, "model" se è servita una chiamata a Gemini.
+    """
+    return known_scripts(user_request) or generate_scripts(user_request)
 
-        generated_code = response.text.strip().replace("```python", "").replace("```", "")
 
-        # Create preview script (100 records)
-        preview_code = generated_code.replace("num_records=5000", "num_records=100")
-        with open("/data/preview_script.py", "w") as f:
-            f.write(preview_code)
+def write_scripts(generated_code, preview_code, source):
+    """Scrive preview_script.py e generate_script.py in DATA_DIR, ritorna la risposta."""
+    # Create preview script (100 records)
+    with open(os.path.join(DATA_DIR, "preview_script.py"), "w") as f:
+        f.write(preview_code)
 
-        # Create full generation script
-        with open("/data/generate_script.py", "w") as f:
-            f.write(generated_code)
+    # Create full generation script
+    with open(os.path.join(DATA_DIR, "generate_script.py"), "w") as f:
+        f.write(generated_code)
 
-        message = """
+    message = """
 Generated two scripts:
 1. /data/preview_script.py - Run this to see 100 sample records
 2. /data/generate_script.py - Run this to generate the full dataset
@@ -179,13 +226,72 @@ Generated two scripts:
 To preview: python /data/preview_script.py
 To generate full CSV: python /data/generate_script.py"""
 
-        return jsonify({
-            "status": "Scripts generated successfully",
-            "message": message.strip()
-        })
+    return {
+        "status": "Scripts generated successfully",
+        "message": message.strip(),
+        "source": source,
+        "cache": prompt_cache.stats()
+    }
+
+
+@app.route("/generate_code", methods=["POST"])
+def generate_code():
+    try:
+        # Get request
+        user_request = request.json.get("rule", "")
+        if not user_request:
+            return jsonify({"error": "Missing 'rule' parameter"}), 400
+
+        # Template, cache or Gemini
+        return jsonify(write_scripts(*build_scripts(user_request)))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+def create_asgi_app():
+    """Stesso endpoint come app Starlette, con le chiamate a Gemini eseguite tramite SingleFlight."""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from single_flight import Overloaded, SingleFlight
+
+    gate = SingleFlight(GENERATION_CONCURRENCY, GENERATION_QUEUE, GENERATION_QUEUE_TIMEOUT)
+
+    async def generate_code_async(request):
+        try:
+            user_request = (await request.json()).get("rule", "")
+            if not user_request:
+                return JSONResponse({"error": "Missing 'rule' parameter"}, status_code=400)
+
+            # Cache e scrittura degli script su file fuori dall'event loop
+            scripts = await asyncio.to_thread(known_scripts, user_request)
+            coalesced = False
+            if scripts is None:
+                # Richieste equivalenti già in corso attendono la stessa chiamata a Gemini
+                scripts, coalesced = await gate.run(prompt_cache.key(user_request), generate_scripts, user_request)
+            written = await asyncio.to_thread(write_scripts, *scripts)
+            return JSONResponse({**written, "coalesced": coalesced, "generation": gate.stats()})
+
+        except Overloaded as e:
+            return JSONResponse({"error": f"Troppe generazioni in corso, riprova più tardi: {e}"},
+                                status_code=429, headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        gate.shutdown()
+
+    return Starlette(routes=[Route("/generate_code", generate_code_async, methods=["POST"])], lifespan=lifespan)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    if SERVER_MODE == 'asgi':
+        import uvicorn
+        uvicorn.run(create_asgi_app(), host="0.0.0.0", port=5000)
+    else:
+        app.run(host="0.0.0.0", port=5000)
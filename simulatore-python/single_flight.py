@@ -0,0 +1,114 @@
+"""
+Bounded, coalescing runner for the model calls of the ASGI servers.
+
+Vendored as rule-manager/app/single_flight.py and simulatore-python/single_flight.py
+(separate images): keep the two files identical.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Overloaded(Exception):
+    """Raised when a call can't be admitted; carries the suggested Retry-After in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class SingleFlight:
+    """Bounded, coalescing runner for slow blocking calls (model generation) in an asyncio server.
+
+    - at most `max_concurrency` calls run at once, each on a worker thread;
+    - a call whose key is already in flight waits for that result instead
+      of starting its own;
+    - at most `max_waiting` calls queue for a slot, and none waits longer
+      than `queue_timeout` seconds: beyond that Overloaded is raised, to be
+      answered with 429 and Retry-After.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_waiting: int = 16, queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.started = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.running = 0
+        self.waiting = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="generation")
+
+    def _retry_after(self) -> int:
+        return max(1, int(self.queue_timeout))
+
+    async def run(self, key: str, fn: Callable[..., Any], *args) -> Tuple[Any, bool]:
+        """Result of fn(*args), shared with concurrent callers using the same key.
+
+        Returns (result, coalesced) where coalesced is True when the result
+        came from a call started by another request.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight), True
+
+        if self.running + self.waiting >= self.max_concurrency + self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(f"{self.running} generations running and {self.waiting} queued",
+                             self._retry_after())
+
+        # The call runs as its own task: if the request that started it goes
+        # away, requests coalesced onto it still get the result
+        self.waiting += 1
+        task = asyncio.ensure_future(self._lead(fn, *args))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), False
+
+    async def _lead(self, fn: Callable[..., Any], *args) -> Any:
+        # Not asyncio.wait_for: before Python 3.12 it can lose an acquire that
+        # completes as the timeout fires, leaking the permit
+        acquired = False
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                self._semaphore.release()
+            self.rejected += 1
+            raise Overloaded(f"no generation slot within {self.queue_timeout:g}s", self._retry_after())
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.started += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None and not isinstance(task.exception(), Overloaded):
+            logger.error(f"Generation for {key} failed: {str(task.exception())}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_waiting": self.max_waiting,
+            "running": self.running,
+            "waiting": self.waiting,
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)